@@ -0,0 +1,261 @@
+## Non-interactive batch mode for scripts and ops automation
+##
+## Runs operations through dbTier on one connection and prints one JSON result
+## per line. An operation comes either from the command line:
+##   python main.py book --client maria45@gmail.com --date 2025-05-01 --model M1111111
+## or, many at a time, from a JSONL stream with one operation per line:
+##   {"op": "book", "client": "maria45@gmail.com", "date": "2025-05-01", "model": "M1111111"}
+##   {"op": "top-clients", "k": 5}
+##   python main.py run ops.jsonl --batch-size 500 > results.jsonl
+##
+## Writes are grouped into transactions of --batch-size operations, and the
+## results of a batch are printed once it is committed. A failing write can
+## roll back the whole open transaction; the batch's earlier writes are then
+## run again, so only the failing operation is lost.
+
+import contextlib
+import json
+import sys
+from collections import namedtuple
+
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_INERROR
+
+import dbTier
+
+BATCH_SIZE = 100
+
+# func(conn, commit, **params) returns (ok, result). Each argument is
+# (name, type, default); a default of None means the argument is required.
+Operation = namedtuple("Operation", ["func", "writes", "arguments", "help"])
+
+def book(conn, commit, client_email, date, model, strategy=dbTier.DEFAULT_ASSIGNMENT_STRATEGY, rent_id="", days=1):
+    if not rent_id:
+        rent_id = dbTier.next_rent_id(conn)
+    status, driver = dbTier.book_rent_status(conn, rent_id, date, client_email, model, strategy,
+                                             commit=commit, days=days)
+    return status == dbTier.BOOK_OK, {"status": dbTier.BOOK_STATUS_NAMES[status], "rent_id": rent_id, "driver": driver}
+
+
+def search(conn, commit, date, days=1):
+    models = dbTier.find_available_models(conn, date, days)
+    return True, [{"model_id": model_id, "car_id": car_id, "color": color,
+                   "transmission": transmission, "year": year}
+                  for model_id, car_id, color, transmission, year in models]
+
+
+def add_car(conn, commit, car_id, brand):
+    return dbTier.insert_car(conn, car_id, brand, commit=commit), {"car_id": car_id}
+
+
+def add_model(conn, commit, model_id, car_id, color, transmission, year):
+    added = dbTier.insert_model(conn, model_id, color, transmission, year, car_id, commit=commit)
+    return added, {"model_id": model_id}
+
+
+def top_clients(conn, commit, k):
+    return True, [{"email": email, "name": name, "rents": count}
+                  for email, name, count in dbTier.get_top_k_clients(conn, k)]
+
+
+def driver_stats(conn, commit):
+    return True, [{"name": name, "rents": total, "avg_rating": None if avg == -1 else float(avg)}
+                  for name, total, avg in dbTier.get_driver_stats(conn)]
+
+
+def rent_series(conn, commit, start, end, bucket="day", model="", driver="", city=""):
+    series = dbTier.get_rent_series(conn, start, end, bucket, model or None, driver or None, city or None)
+    return True, [{"bucket": day, "rents": count} for day, count in series]
+
+
+OPERATIONS = {
+    "book": Operation(book, True, [
+        ("client", str, None), ("date", str, None), ("model", str, None),
+        ("strategy", str, dbTier.DEFAULT_ASSIGNMENT_STRATEGY), ("rent_id", str, ""), ("days", int, 1)],
+        "book a rent for one or more days (the rent ID is generated unless given)"),
+    "search": Operation(search, False, [("date", str, None), ("days", int, 1)],
+        "list the models available for one or more days from a date"),
+    "add-car": Operation(add_car, True, [("car_id", str, None), ("brand", str, None)],
+        "add a car"),
+    "add-model": Operation(add_model, True, [
+        ("model_id", str, None), ("car_id", str, None), ("color", str, None),
+        ("transmission", str, None), ("year", int, None)],
+        "add a model of an existing car"),
+    "top-clients": Operation(top_clients, False, [("k", int, 10)],
+        "list the clients with the most rents"),
+    "driver-stats": Operation(driver_stats, False, [],
+        "list every driver's rent count and average rating"),
+    "rent-series": Operation(rent_series, False, [
+        ("start", str, None), ("end", str, None), ("bucket", str, "day"),
+        ("model", str, ""), ("driver", str, ""), ("city", str, "")],
+        "count rents per day, week or month, optionally for one model, driver or city"),
+}
+
+# JSON/argument names that differ from the Python parameter names
+PARAMETER_NAMES = {"client": "client_email"}
+
+
+def add_subcommands(subparsers):
+    """Adds one subcommand per operation, plus "run" for JSONL streams"""
+    for name, operation in OPERATIONS.items():
+        parser = subparsers.add_parser(name, help=operation.help)
+        for argument, kind, default in operation.arguments:
+            flag = "--" + argument.replace("_", "-")
+            if default is None:
+                parser.add_argument(flag, dest=argument, type=kind, required=True)
+            else:
+                parser.add_argument(flag, dest=argument, type=kind, default=default)
+    parser = subparsers.add_parser("run", help="run operations from a JSONL file (- for stdin)")
+    parser.add_argument("file", nargs="?", default="-")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE,
+                        help="write operations per transaction")
+    parser.add_argument("--stop-on-error", action="store_true",
+                        help="stop at the first operation that fails")
+
+
+def parse_operation(line):
+    """Turns one JSONL line into (op name, params). Raises ValueError if it is invalid"""
+    request = json.loads(line)
+    if not isinstance(request, dict):
+        raise ValueError("operation must be a JSON object")
+    name = request.pop("op", None)
+    if name not in OPERATIONS:
+        raise ValueError(f"unknown op: {name}")
+    known = {argument for argument, _, _ in OPERATIONS[name].arguments}
+    unknown = set(request) - known
+    if unknown:
+        raise ValueError(f"unknown argument(s) for {name}: {', '.join(sorted(unknown))}")
+    for argument, kind, default in OPERATIONS[name].arguments:
+        if argument in request:
+            request[argument] = kind(request[argument])
+        elif default is None:
+            raise ValueError(f"missing argument for {name}: {argument}")
+    return name, request
+
+
+def _call(conn, name, params, commit):
+    """Runs one operation, keeping dbTier's error messages off stdout"""
+    operation = OPERATIONS[name]
+    kwargs = {PARAMETER_NAMES.get(key, key): value for key, value in params.items()}
+    with contextlib.redirect_stdout(sys.stderr):
+        return operation.func(conn, commit, **kwargs)
+
+
+class BatchRunner:
+    """Runs operations on one connection, committing writes every batch_size operations"""
+
+    def __init__(self, conn, batch_size=BATCH_SIZE, out=None):
+        self.conn = conn
+        self.batch_size = max(1, batch_size)
+        self.out = out or sys.stdout
+        self.pending = []       # (record, name, params) of writes not yet committed
+        self.buffered = []      # results waiting for the next commit, in input order
+        self.failures = 0
+
+    def run(self, index, name, params):
+        """Runs one operation. Returns False if it failed"""
+        record = {"line": index, "op": name}
+        self.buffered.append(record)
+        ok = self._execute(record, name, params)
+        if self.pending and self._rolled_back():
+            self._replay()
+        if ok and OPERATIONS[name].writes:
+            self.pending.append((record, name, params))
+            if len(self.pending) >= self.batch_size:
+                self.commit()
+        if not self.pending:
+            self.flush()
+        return ok
+
+    def _execute(self, record, name, params):
+        record.pop("result", None)
+        record.pop("error", None)
+        try:
+            ok, result = _call(self.conn, name, params, commit=False)
+            record.update(ok=bool(ok), result=result)
+        except Exception as e:
+            record.update(ok=False, error=str(e))
+            ok = False
+            if self.conn.get_transaction_status() == TRANSACTION_STATUS_INERROR:
+                self.conn.rollback()
+        if not ok:
+            self.failures += 1
+        return ok
+
+    def _rolled_back(self):
+        """True if the open transaction holding the pending writes was rolled back"""
+        return self.conn.get_transaction_status() == TRANSACTION_STATUS_IDLE
+
+    def _replay(self):
+        """Runs the pending writes again after a rollback discarded them"""
+        queue, self.pending = self.pending, []
+        while queue:
+            record, name, params = queue.pop(0)
+            record["replayed"] = True
+            if self._execute(record, name, params):
+                self.pending.append((record, name, params))
+            elif self.pending and self._rolled_back():
+                # The replayed write failed too and took the others with it;
+                # start over without it
+                queue = self.pending + queue
+                self.pending = []
+
+    def commit(self):
+        """Commits the pending writes and prints the buffered results"""
+        try:
+            self.conn.commit()
+        except Exception as e:
+            self.conn.rollback()
+            for record, _, _ in self.pending:
+                record.update(ok=False, error=f"commit failed: {e}")
+                self.failures += 1
+        else:
+            if self.pending and hasattr(self.conn, "note_write"):
+                self.conn.note_write()
+        self.pending = []
+        self.flush()
+
+    def flush(self):
+        for record in self.buffered:
+            self.out.write(json.dumps(record, default=str) + "\n")
+        self.out.flush()
+        self.buffered = []
+
+
+def run_stream(conn, lines, batch_size=BATCH_SIZE, stop_on_error=False, out=None):
+    """
+    Runs every operation in an iterable of JSONL lines.
+
+    Returns:
+        The number of operations that failed
+    """
+    runner = BatchRunner(conn, batch_size, out)
+    for index, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            name, params = parse_operation(line)
+        except ValueError as e:
+            runner.buffered.append({"line": index, "ok": False, "error": str(e)})
+            runner.failures += 1
+            ok = False
+        else:
+            ok = runner.run(index, name, params)
+        if not ok and stop_on_error:
+            break
+    runner.commit()
+    return runner.failures
+
+
+def run_command(conn, args):
+    """Runs the subcommand parsed by main.parse_args. Returns the exit status"""
+    if args.command == "run":
+        with contextlib.ExitStack() as stack:
+            lines = sys.stdin if args.file == "-" else stack.enter_context(open(args.file))
+            failures = run_stream(conn, lines, args.batch_size, args.stop_on_error)
+    else:
+        params = {argument: getattr(args, argument) for argument, _, _ in OPERATIONS[args.command].arguments}
+        runner = BatchRunner(conn, batch_size=1)
+        runner.run(1, args.command, params)
+        runner.commit()
+        failures = runner.failures
+    return 1 if failures else 0
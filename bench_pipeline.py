@@ -0,0 +1,144 @@
+## Measures sequential vs. pipelined statement execution over a slow network
+##
+## Starts a local TCP proxy in front of the database that delays every packet
+## by --delay milliseconds in each direction, then registers the same client
+## (with several addresses and cards) both ways: one dbTier call per statement,
+## and one execute_pipeline call. Every iteration is rolled back; only the
+## benchmark addresses are kept, since addresses are interned and committed on
+## first use (later iterations resolve them from the intern cache).
+##
+## Example:
+##   python bench_pipeline.py --delay 20 --addresses 3 --cards 2 --iterations 20
+
+import argparse
+import socket
+import sys
+import threading
+import time
+
+import psycopg2.extensions
+
+import dbconfig
+import dbTier
+import perfstats
+
+
+class CountingCursor(psycopg2.extensions.cursor):
+    """Cursor that counts statements sent to the server (one round trip each)"""
+    executed = 0
+
+    def execute(self, query, vars=None):
+        CountingCursor.executed += 1
+        return super().execute(query, vars)
+
+
+class LatencyProxy:
+    """TCP proxy on localhost that adds a fixed delay to every forwarded chunk"""
+
+    def __init__(self, target_host, target_port, delay):
+        self.target = (target_host, int(target_port))
+        self.delay = delay
+        self.server = socket.create_server(("127.0.0.1", 0))
+        self.port = self.server.getsockname()[1]
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            client, _ = self.server.accept()
+            upstream = socket.create_connection(self.target)
+            threading.Thread(target=self._pump, args=(client, upstream), daemon=True).start()
+            threading.Thread(target=self._pump, args=(upstream, client), daemon=True).start()
+
+    def _pump(self, source, destination):
+        try:
+            while True:
+                data = source.recv(65536)
+                if not data:
+                    break
+                time.sleep(self.delay)
+                destination.sendall(data)
+        except OSError:
+            pass
+        finally:
+            source.close()
+            destination.close()
+
+
+def client_details(iteration, n_addresses, n_cards):
+    email = f"pipeline-bench{iteration}@example.com"
+    addresses = [(100 + n, "Bench St", "Latencyville") for n in range(n_addresses)]
+    cards = [(f"9{iteration:09d}{n:06d}", addresses[n % n_addresses]) for n in range(n_cards)]
+    return email, addresses, cards
+
+
+def register_sequential(conn, email, addresses, cards):
+    """One dbTier call (and round trip) per statement, like the original registration flow"""
+    address_ids = dbTier.intern_addresses(conn, addresses)
+    card_address_ids = dbTier.intern_addresses(conn, [address for _, address in cards])
+    dbTier.insert_client(conn, email, "Bench Client", commit=False)
+    for address_id in address_ids:
+        dbTier.insert_client_address(conn, email, address_id, commit=False)
+    for (cc, _), address_id in zip(cards, card_address_ids):
+        dbTier.insert_credit_card(conn, cc, email, address_id, commit=False)
+    conn.rollback()
+
+
+def register_pipelined(conn, email, addresses, cards):
+    """All statements in one execute_pipeline call, like client.register_client"""
+    address_ids = dbTier.intern_addresses(conn, addresses + [address for _, address in cards])
+    statements = [dbTier.client_statement(email, "Bench Client")]
+    for address_id in address_ids[:len(addresses)]:
+        statements.append(dbTier.client_address_statement(email, address_id))
+    for (cc, _), address_id in zip(cards, address_ids[len(addresses):]):
+        statements.append(dbTier.credit_card_statement(cc, email, address_id))
+    results = dbTier.execute_pipeline(conn, statements, commit=False)
+    conn.rollback()
+    failed = [error for _, code, error in results if code is not None]
+    if failed:
+        raise RuntimeError(f"pipelined registration failed: {failed[0]}")
+
+
+def measure(conn, flow, args):
+    latencies = []
+    CountingCursor.executed = 0
+    for iteration in range(args.iterations):
+        email, addresses, cards = client_details(iteration, args.addresses, args.cards)
+        start = time.perf_counter()
+        flow(conn, email, addresses, cards)
+        latencies.append(time.perf_counter() - start)
+    # Plus the BEGIN psycopg2 sends before the first statement and the final rollback
+    round_trips = CountingCursor.executed / args.iterations + 2
+    return perfstats.summarize(latencies), round_trips
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Compare sequential and pipelined registration over added latency")
+    parser.add_argument("--delay", type=float, default=10.0, help="added one-way latency in ms")
+    parser.add_argument("--addresses", type=int, default=3, help="addresses per client")
+    parser.add_argument("--cards", type=int, default=2, help="credit cards per client")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--dbinfo", default=dbconfig.DB_INFO_FILE, help="database info file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    info = dbconfig.read_db_info(args.dbinfo)
+    proxy = LatencyProxy(info["host"], info["port"], args.delay / 1000)
+    conn = dbconfig.connect(dict(info, host="127.0.0.1", port=proxy.port))
+    conn.cursor_factory = CountingCursor
+
+    print(f"Registering a client with {args.addresses} addresses and {args.cards} cards, "
+          f"{args.delay:g} ms added each way, {args.iterations} iterations\n")
+    print(perfstats.format_header("Flow", extra=f"{'Trips':>8}"))
+    try:
+        for label, flow in (("sequential", register_sequential), ("pipelined", register_pipelined)):
+            summary, round_trips = measure(conn, flow, args)
+            print(perfstats.format_summary(label, summary) + f"{round_trips:>8.0f}")
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,14 @@
 ## Contains all of the methods for client-specific actions
 
 import dbTier
+import metrics
+from driver import choose_driver
 from datetime import datetime
 import re
 
+# Longest date range shown by the availability calendar
+MAX_CALENDAR_DAYS = 31
+
 def increment_id(id):
     """Automatically increments the id by one so the client
       doesn't have to manually enter a new id for new rents and reviews"""
@@ -45,37 +50,60 @@ def get_address():
     city = input("     City: ")
     return number, road, city
 
+def get_days():
+    """Prompts user for the length of a rent (Enter for one day)
+
+    Returns the number of days"""
+    days = input(f"   Number of days (1-{dbTier.MAX_RENT_DAYS}, Enter for 1): ").strip()
+    while days and not (days.isnumeric() and 1 <= int(days) <= dbTier.MAX_RENT_DAYS):
+        days = input(f"   Invalid number of days. Try again (1-{dbTier.MAX_RENT_DAYS}): ").strip()
+    return int(days) if days else 1
+
+def display_availability_calendar(conn):
+    """Prompts for a date range and prints how many drivers are free for
+    each model on each day of the range ('-' means the model is unavailable)"""
+    start = input("   Enter start date (YYYY-MM-DD): ")
+    while not is_valid_date(start):
+        start = input("Invalid date. Please try again: ")
+    end = input("   Enter end date (YYYY-MM-DD): ")
+    while not is_valid_date(end) or end < start:
+        end = input("Invalid end date (must be on or after the start date). Please try again: ")
+
+    # Keep the calendar readable on a terminal
+    span = (datetime.strptime(end, "%Y-%m-%d") - datetime.strptime(start, "%Y-%m-%d")).days + 1
+    if span > MAX_CALENDAR_DAYS:
+        print(f"\nPlease choose a range of at most {MAX_CALENDAR_DAYS} days.")
+        return
+
+    dates, matrix = dbTier.get_availability_matrix(conn, start, end)
+    print(f"\n{'Model ID':<10}" + "".join(f"{day.strftime('%m-%d'):>7}" for day in dates))
+    print('-' * (10 + 7 * len(dates)))
+    for model_id, counts in matrix:
+        cells = "".join(f"{(count if count > 0 else '-'):>7}" for count in counts)
+        print(f"{model_id:<10}{cells}")
+
 def register_client(conn):
-    """Handles new client registration and initial address/card setup"""
+    """Handles new client registration and initial address/card setup.
+    All of the client's details are collected first and then saved in a single
+    round trip to the database."""
     print("\nClient Registration:")
     email = input("   Enter your email: ")
-    name  = input("   Enter your name: ")
-
-    # Insert client record
-    if not dbTier.insert_client(conn, email, name, commit=False):
+    # Fail early instead of after the user has typed in every address and card
+    if dbTier.get_client(conn, email) is not None:
         print("\nRegistration failed: client email already in use.")
         return
-
-    print(f"\nClient {email} registered successfully.")
-
-    one_addr = False
-    one_cc = False
+    name  = input("   Enter your name: ")
 
     print("\nNew client address registration:")
     # Prompt to add at least one address
+    addresses = []
     while True:
         print("   Enter Address Info")
-        number, street, city = get_address()
-        # Add address to Address table if it doesn't already exist
-        dbTier.insert_address(conn, number, street, city, commit=False)
-        # Add to client addresses
-        if dbTier.insert_client_address(conn, email, number, street, city, commit=False):
-            print(f"   Address {number} {street}, {city} added.")
-            one_addr = True
+        address = get_address()
+        if address in addresses:
+            print("   Address already entered.")
         else:
-            print("   Failed to add address. The Client is already registered to this address.")
-            if not one_addr:
-                continue # continue to make sure at least 1 address is valid
+            addresses.append(address)
         next_addr = input("    Enter additional address (y/n)?")
         # Anything other than 'y' will break
         if next_addr.lower() != "y":
@@ -83,37 +111,86 @@ def register_client(conn):
 
     print("\nNew client payment registration:")
     # Prompt to add at least one credit card
+    cards = []
     while True:
         cc = input("   Enter Credit Card Number: ")
-        while not is_valid_card(cc):
-            cc = input("   Invlalid card. Please try again: ")
+        while not is_valid_card(cc) or cc in [card for card, _ in cards]:
+            cc = input("   Invlalid or repeated card. Please try again: ")
 
         print("   Payment address:")
-        number, street, city = get_address()
-        # Add address to Address table if it doesn't already exist
-        dbTier.insert_address(conn, number, street, city, commit=False)
-        # Add to client addresses
-        if dbTier.insert_credit_card(conn, cc, email, number, street, city, commit=False):
-            print(f"\nCredit card {cc} added to your profile.")
-            one_cc = True
-        else:
-            print("\n   Failed to add credit card. Card already in use.")
-            if not one_cc:
-                continue # continue to make sure at least 1 address is valid
+        cards.append((cc, get_address()))
         next_addr = input("    Enter additional credit card (y/n)?")
         # Anything other than 'y' will break
         if next_addr.lower() != "y":
             break
 
+    # Look up (or add) every address at once; known addresses need no round trip
+    address_ids = dbTier.intern_addresses(conn, addresses + [address for _, address in cards])
+    if address_ids is None:
+        print("\nRegistration failed: could not save addresses.")
+        return
+    card_address_ids = address_ids[len(addresses):]
+
+    # Client, then each address link, then each card
+    statements = [dbTier.client_statement(email, name)]
+    for address_id in address_ids[:len(addresses)]:
+        statements.append(dbTier.client_address_statement(email, address_id))
+    for (cc, _), address_id in zip(cards, card_address_ids):
+        statements.append(dbTier.credit_card_statement(cc, email, address_id))
+    results = dbTier.execute_pipeline(conn, statements, commit=False)
+
+    client_rows, _, client_error = results[0]
+    if not client_rows:
+        print(f"\nRegistration failed: {client_error or 'client email already in use.'}")
+        conn.rollback()
+        metrics.REGISTRATIONS.inc(role="client", outcome="failed")
+        return
+    print(f"\nClient {email} registered successfully.")
+
+    one_addr = False
+    one_cc = False
+    address_results = results[1:1 + len(addresses)]
+    for (number, street, city), (rows, _, error) in zip(addresses, address_results):
+        if rows:
+            print(f"   Address {number} {street}, {city} added.")
+            one_addr = True
+        else:
+            print(f"   Failed to add address {number} {street}, {city}. {error or ''}")
+    card_results = results[1 + len(addresses):]
+    for (cc, _), (rows, _, error) in zip(cards, card_results):
+        if rows:
+            print(f"   Credit card {cc} added to your profile.")
+            one_cc = True
+        else:
+            print(f"   Failed to add credit card {cc}. {error or 'Card already in use.'}")
 
     # Only commit changes if at least 1 address and credit card have been added
     if one_addr and one_cc:
         print("\nSetup complete. You can now log in as a client.")
         conn.commit()
+        metrics.REGISTRATIONS.inc(role="client", outcome="ok")
     ## If something went wrong and there is not at least 1 credit card and 1 address, discard changes
     else:
         print("\nClient setup failed. Discarding new client information.")
         conn.rollback()
+        metrics.REGISTRATIONS.inc(role="client", outcome="failed")
+
+
+def choose_client(conn, email):
+    """Lists the clients closest to a mistyped email and lets the user pick one.
+
+    Returns the chosen client as (email, name), or None if there is no match
+    or the user picks none"""
+    candidates = dbTier.search_clients(conn, email)
+    if not candidates:
+        return None
+    print(f"   No client with email \"{email}\". Did you mean:")
+    for i, (candidate, name, _) in enumerate(candidates, start=1):
+        print(f"     {i}. {candidate} ({name})")
+    choice = input(f"   Enter a number (1-{len(candidates)}), or press Enter for none: ").strip()
+    if choice.isnumeric() and 1 <= int(choice) <= len(candidates):
+        return candidates[int(choice) - 1][:2]
+    return None
 
 
 def client_login(conn):
@@ -121,35 +198,76 @@ def client_login(conn):
     print("\nClient Login:")
     email = input("   Please enter your email: ")
 
-    # Validate client exists
+    # Validate client exists, offering close matches for a mistyped email
     client = dbTier.get_client(conn, email)
+    if client is None:
+        client = choose_client(conn, email)
     if client is None:
         print("\nLogin failed: Client not found.")
+        metrics.LOGINS.inc(role="client", outcome="failed")
         return
+    email = client[0]
+    metrics.LOGINS.inc(role="client", outcome="ok")
 
     print(f"\nWelcome {client[1]}! Please select an action:")
     client_menu(conn, email)
 
 
+class ProfileCache:
+    """The logged-in client's profile, fetched once per session and again after the client's own writes"""
+
+    def __init__(self, conn, email):
+        self.conn = conn
+        self.email = email
+        self.profile = None
+
+    def get(self):
+        if self.profile is None:
+            self.profile = dbTier.get_client_profile(self.conn, self.email)
+        return self.profile
+
+    def invalidate(self):
+        self.profile = None
+
+
+def display_profile(profile):
+    """Prints a client's addresses, credit cards and reviews"""
+    print(f"\n{profile.name} <{profile.email}>")
+    print("\nAddresses:")
+    for number, road, city in profile.addresses:
+        print(f"   {number} {road}, {city}")
+    print("\nCredit cards:")
+    for cc, number, road, city in profile.cards:
+        billing = f"{number} {road}, {city}" if number is not None else "no billing address"
+        print(f"   {cc}  ({billing})")
+    print("\nReviews:")
+    for review_id, driver, rating, message in profile.reviews:
+        print(f"   {review_id}  {driver:<15}{rating}/5  {message}")
+
+
 def client_menu(conn, email):
     """Sub-menu for client operations"""
+    profile = ProfileCache(conn, email)
     user_input = ''
     while user_input != 'x':
         print("\nClient actions:")
         print("   1. Add address")
         print("   2. Add credit card")
-        print("   3. Search available models by date")
+        print("   3. Search available models by dates")
         print("   4. Book a rent")
         print("   5. View my rents")
         print("   6. Post a review")
+        print("   7. View availability calendar")
+        print("   8. View my profile")
         print("   x. Log out")
 
-        user_input = input("Enter a command (1-6, or x to log out): ")
+        user_input = input("Enter a command (1-8, or x to log out): ")
         match user_input:
             case '1':
                 number, street, city = get_address()
-                dbTier.insert_address(conn, number, street, city)
-                if dbTier.insert_client_address(conn, email, number, street, city):
+                address_id = dbTier.intern_address(conn, number, street, city)
+                if address_id is not None and dbTier.insert_client_address(conn, email, address_id):
+                    profile.invalidate()
                     print(f"\nAddress {number} {street}, {city} added to your profile.")
                 else:
                     print("   Failed to add address. Client already registerd to address")
@@ -159,8 +277,9 @@ def client_menu(conn, email):
                     cc = input("   Invlalid card. Please try again: ")
                 print("   Enter payment address: ")
                 number, street, city = get_address()
-                dbTier.insert_address(conn, number, street, city)
-                if dbTier.insert_credit_card(conn, cc, email, number, street, city):
+                address_id = dbTier.intern_address(conn, number, street, city)
+                if address_id is not None and dbTier.insert_credit_card(conn, cc, email, address_id):
+                    profile.invalidate()
                     print(f"\nCredit card {cc} added to your profile.")
                 else:
                     print("\nFailed to add credit card. Card already in use")
@@ -168,35 +287,69 @@ def client_menu(conn, email):
                 date = input("   Enter date (YYYY-MM-DD) to search available models: ")
                 while not is_valid_date(date):
                     date = input("Invalid date. Please try again: ")
+                days = get_days()
 
-                models = dbTier.find_available_models(conn, date)
+                models = dbTier.find_available_models(conn, date, days)
                 print(f"\n{'Model ID':<10}{'Car ID':<10}{'Color':<10}{'Trans.':<10}{'Year':<6}")
                 print('-' * 46)
                 for mid, cid, color, trans, year in models:
                     print(f"{mid:<10}{cid:<10}{color:<10}{trans:<10}{year:<6}")
+
+                if models:
+                    model_id = input(f"   Enter a model ID to hold it for {dbTier.HOLD_TTL // 60} minutes (or press Enter to skip): ").strip()
+                    if model_id:
+                        status, hold = dbTier.place_hold(conn, email, date, model_id, days=days)
+                        if status == dbTier.BOOK_OK:
+                            print(f"\nModel {hold.model_id} is held for you with driver {hold.driver} "
+                                  f"until {hold.expires_at:%H:%M}. Book it with option 4.")
+                        else:
+                            print("\n" + dbTier.BOOK_FAILURE_MESSAGES[status].format(rent_id=""))
+                            print("Failed to hold the model.")
             case '4':
                 # New: Automatically create new Rent_id
-                rent_id = increment_id(dbTier.get_latest_rent_id(conn))
+                rent_id = dbTier.next_rent_id(conn)
 
                 date = input("   Enter rent date (YYYY-MM-DD): ")
                 while not is_valid_date(date):
                     date = input("Invalid date. Please try again: ")
+                days = get_days()
 
                 model_id = input("   Enter model ID to book: ")
 
-                if dbTier.book_rent(conn, rent_id, date, email, model_id):
+                status, _ = dbTier.book_rent_status(conn, rent_id, date, email, model_id, days=days)
+                if status == dbTier.BOOK_OK:
                     print(f"\nRent {rent_id} successfully booked.")
                 else:
-                    print("\nFailed to book rent.")
+                    print("\n" + dbTier.BOOK_FAILURE_MESSAGES[status].format(rent_id=rent_id))
+                    print("Failed to book rent.")
+                    if status in (dbTier.BOOK_NO_DRIVER, dbTier.BOOK_MODEL_TAKEN):
+                        join = input("   Join the waitlist for this model and date? (y/n): ")
+                        if join.strip().lower() == 'y':
+                            if dbTier.join_waitlist(conn, email, date, model_id, days=days):
+                                print("\nYou are on the waitlist. The rent will be booked when a driver is free.")
+                            else:
+                                print("\nYou are already waiting for this model on this date.")
             case '5':
+                # Read live rather than from the profile cache: the waitlist worker
+                # books rents for the client without going through this session
                 rents = dbTier.get_client_rents(conn, email)
-                print(f"\n{'Rent ID':<10}{'Date':<12}{'Model':<10}{'Car':<10}{'Driver':<15}")
-                print('-' * 57)
-                for rid, date, mid, cid, color, trans, year, drv in rents:
+                print(f"\n{'Rent ID':<10}{'Date':<12}{'Days':<6}{'Model':<10}{'Car':<10}{'Driver':<15}")
+                print('-' * 63)
+                for rid, date, mid, cid, color, trans, year, drv, days in rents:
                     # New: Have to cast data as a str to get it to print properly for some reason
-                    print(f"{rid:<10}{str(date):<12}{mid:<10}{cid:<10}{drv:<15}")
+                    print(f"{rid:<10}{str(date):<12}{days:<6}{mid:<10}{cid:<10}{drv:<15}")
+                waiting = dbTier.get_waitlist(conn, email)
+                if waiting:
+                    print(f"\nWaitlist\n{'Date':<12}{'Days':<6}{'Model':<10}{'Since':<18}{'Tries':<6}")
+                    print('-' * 52)
+                    for date, mid, since, attempts, days in waiting:
+                        print(f"{str(date):<12}{days:<6}{mid:<10}{since:%Y-%m-%d %H:%M}  {attempts:<6}")
             case '6':
                 driver = input("   Enter driver name to review: ")
+                driver = choose_driver(conn, driver)
+                if driver is None:
+                    print("\nNo matching driver found.")
+                    continue
 
                 # Check if client has reviewed this driver before, if so, ask if they'd like to update their review
                 has_reviewed = dbTier.has_reviewed(conn, email, driver)
@@ -220,9 +373,14 @@ def client_menu(conn, email):
                     successful = dbTier.insert_review(conn, review_id, email, driver, message, int(rating))
                 
                 if successful:
+                    profile.invalidate()
                     print("\nReview submitted successfully.")
                 else:
                     print("\nFailed to submit review.")
+            case '7':
+                display_availability_calendar(conn)
+            case '8':
+                display_profile(profile.get())
             case 'x':
                 print("\nLogging out client...")
             case _:
@@ -0,0 +1,121 @@
+## Manager fleet dashboard: the analytics reports run in parallel
+##
+## get_models_rents, get_driver_stats, get_top_k_clients and the freshness of
+## their views each run on their own pooled connection at the same time, so the
+## dashboard takes as long as the slowest report rather than the sum of all of
+## them. The pool (a psycopg2 ThreadedConnectionPool) is opened on first use,
+## sized to one connection per report, and kept for later dashboards until
+## close_pool(). Like the other read-only calls, the reports go to a read
+## replica when dbinfo.txt lists any, and to the primary otherwise. A session
+## whose own writes the replicas have not replayed yet uses a primary pool.
+
+import random
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from psycopg2.pool import ThreadedConnectionPool
+
+import dbconfig
+import dbTier
+import metrics
+
+# Report name -> function(conn, k, live)
+REPORTS = {
+    "models_rents": lambda conn, k, live: dbTier.get_models_rents(conn, live),
+    "driver_stats": lambda conn, k, live: dbTier.get_driver_stats(conn, live),
+    "top_clients": lambda conn, k, live: dbTier.get_top_k_clients(conn, k, live),
+    "freshness": lambda conn, k, live: dbTier.get_analytics_freshness(conn),
+}
+
+# One field per report, plus the seconds each report took and the total
+Dashboard = namedtuple("Dashboard", list(REPORTS) + ["timings", "elapsed"])
+
+
+class DashboardPool:
+    """A connection pool with one worker thread per connection"""
+
+    def __init__(self, info, size=len(REPORTS)):
+        self.size = size
+        self.pool = ThreadedConnectionPool(1, size, **info)
+        self.executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix="dashboard")
+        self._lock = threading.Lock()
+        self.in_use = 0
+
+    def _run(self, func, *args):
+        """Runs func(conn, *args) on a pooled connection. Returns (result, seconds)"""
+        conn = self.pool.getconn()
+        with self._lock:
+            self.in_use += 1
+        start = time.perf_counter()
+        try:
+            return func(conn, *args), time.perf_counter() - start
+        finally:
+            # End the read transaction before the connection goes back
+            conn.rollback()
+            with self._lock:
+                self.in_use -= 1
+            self.pool.putconn(conn)
+
+    def fleet_dashboard(self, k=10, live=False):
+        """
+        Runs every report at once and merges the results.
+
+        Parameters:
+            k: Number of top clients
+            live: Query the booking tables instead of the analytics views
+
+        Returns:
+            A Dashboard
+        """
+        start = time.perf_counter()
+        futures = {name: self.executor.submit(self._run, report, k, live)
+                   for name, report in REPORTS.items()}
+        results = {name: future.result() for name, future in futures.items()}
+        return Dashboard(**{name: result for name, (result, _) in results.items()},
+                         timings={name: seconds for name, (_, seconds) in results.items()},
+                         elapsed=time.perf_counter() - start)
+
+    def close(self):
+        self.executor.shutdown()
+        self.pool.closeall()
+
+
+# Open pools: "reports" (a replica if any is listed) and "primary"
+_pools = {}
+_pool_lock = threading.Lock()
+
+
+def _server_info(primary):
+    """Connection settings from dbinfo.txt: a replica (picked at random, to
+    spread app processes over them) unless primary is set or none is listed"""
+    replicas = [] if primary else dbconfig.read_replica_info()
+    if replicas:
+        return random.choice(replicas)
+    return dbconfig.read_db_info()
+
+
+def get_pool(info=None, primary=False):
+    """
+    Returns the shared dashboard pool, opening it on first use.
+
+    Parameters:
+        info: Connection settings for a new pool (from dbinfo.txt if None)
+        primary: Use a pool on the primary, for sessions that must see their
+            own recent writes
+    """
+    name = "primary" if primary else "reports"
+    with _pool_lock:
+        if name not in _pools:
+            _pools[name] = DashboardPool(info if info is not None else _server_info(primary))
+            metrics.watch_pool(f"dashboard_{name}", _pools[name])
+        return _pools[name]
+
+
+def close_pool():
+    with _pool_lock:
+        for name, pool in _pools.items():
+            metrics.unwatch_pool(f"dashboard_{name}")
+            pool.close()
+        _pools.clear()
@@ -9,46 +9,351 @@
 # If inserting/deleting, use `conn.commit()` to save changes to the db
 # call curr.close() when finished
 
+import functools
+import time
+from collections import namedtuple
 import psycopg2
-from psycopg2 import errors, DatabaseError
+from psycopg2 import errors, sql, DatabaseError
 from psycopg2.extensions import connection
 
-### General ###
+### Connection routing ###
+# Every function below is tagged with how it uses the database. When conn is a
+# routing.RoutedConnection, read-only calls are sent to a read replica and the
+# other calls to the primary (a plain psycopg2 connection is used as-is).
+# The tag is stored in the function's `access` attribute.
+
+def read_only(func):
+    """Tags a function that only reads and can tolerate replica lag"""
+    @functools.wraps(func)
+    def wrapper(conn, *args, **kwargs):
+        if hasattr(conn, "reader"):
+            conn = conn.reader()
+        return func(conn, *args, **kwargs)
+    wrapper.access = "read"
+    return wrapper
+
+def read_primary(func):
+    """Tags a function that only reads but must see the latest committed data"""
+    @functools.wraps(func)
+    def wrapper(conn, *args, **kwargs):
+        if hasattr(conn, "reader"):
+            conn = conn.primary
+        return func(conn, *args, **kwargs)
+    wrapper.access = "primary"
+    return wrapper
+
+def read_write(func):
+    """Tags a function that writes to the database"""
+    @functools.wraps(func)
+    def wrapper(conn, *args, **kwargs):
+        if not hasattr(conn, "reader"):
+            return func(conn, *args, **kwargs)
+        try:
+            return func(conn.primary, *args, **kwargs)
+        finally:
+            conn.note_write()
+    wrapper.access = "write"
+    return wrapper
+
+### Shared statements ###
+# Used both by the single-statement functions below and by the statement
+# builders that feed execute_pipeline.
+
+INSERT_DRIVER_QUERY = """INSERT INTO Driver (name, address_id)
+    VALUES(%s, %s)
+    ON CONFLICT (name) DO NOTHING
+    RETURNING 1"""
+# Adds a driver together with their address (interned as by resolve_addresses).
+# The address is only added when the name is free, so a rejected driver does
+# not leave a new address behind.
+INSERT_DRIVER_WITH_ADDRESS_QUERY = """WITH new_address AS (
+        INSERT INTO Address (number, road, city)
+        SELECT %(number)s, %(road)s, %(city)s
+        WHERE NOT EXISTS (SELECT 1 FROM Driver WHERE name = %(name)s)
+        ON CONFLICT (number, road, city) DO NOTHING
+        RETURNING address_id
+    )
+    INSERT INTO Driver (name, address_id)
+    SELECT %(name)s, COALESCE((SELECT address_id FROM new_address),
+                              (SELECT address_id FROM Address
+                               WHERE (number, road, city) = (%(number)s, %(road)s, %(city)s)))
+    ON CONFLICT (name) DO NOTHING
+    RETURNING 1"""
+UPDATE_DRIVER_ADDRESS_QUERY = """UPDATE Driver
+    SET address_id = %s
+    WHERE name = %s
+    RETURNING *"""
+INSERT_CLIENT_QUERY = """INSERT INTO Client (email, name)
+    VALUES(%s, %s)
+    ON CONFLICT (email)
+    DO NOTHING
+    RETURNING 1"""
+INSERT_CLIENT_ADDRESS_QUERY = """INSERT INTO ClientAddresses (client_id, address_id)
+    VALUES((SELECT client_id FROM Client WHERE email = %s), %s)
+    ON CONFLICT (client_id, address_id)
+    DO NOTHING
+    RETURNING 1"""
+INSERT_CREDIT_CARD_QUERY = """INSERT INTO CreditCard (cc_number, client_id, address_id)
+    VALUES(%s, (SELECT client_id FROM Client WHERE email = %s), %s)
+    ON CONFLICT (cc_number)
+    DO NOTHING
+    RETURNING 1"""
+
+### Address interning ###
+# Addresses are stored once in Address and referenced everywhere else by their
+# integer address_id. Address rows are never updated or deleted, so once an id
+# is committed it stays valid, and intern_addresses keeps the ids it has seen in
+# a per-process cache (keyed by connection dsn) to resolve known addresses
+# without a round trip.
+
+ADDRESS_CACHE_SIZE = 10000
+_address_cache = {}
+
+@read_write
+def resolve_addresses(conn:psycopg2.extensions.connection, addresses, commit=True):
+    """
+    Looks up the address_id of each address, adding the ones that do not exist
+    yet, in a single statement.
+
+    Parameters:
+        conn: The database connection
+        addresses: List of (number, road, city) tuples
+        commit: Commit the new addresses
+
+    Returns:
+        List of (address_id, is_new) tuples in input order, or None on error
+    """
+    dbQuery = """
+        WITH req AS (
+            SELECT number, road, city, ord
+            FROM unnest(%s::int[], %s::text[], %s::text[]) WITH ORDINALITY AS t(number, road, city, ord)
+        ),
+        ins AS (
+            INSERT INTO Address (number, road, city)
+            SELECT DISTINCT number, road, city FROM req
+            ON CONFLICT (number, road, city) DO NOTHING
+            RETURNING address_id, number, road, city
+        )
+        SELECT COALESCE(ins.address_id, a.address_id), ins.address_id IS NOT NULL
+        FROM req
+        LEFT JOIN ins ON (ins.number, ins.road, ins.city) = (req.number, req.road, req.city)
+        LEFT JOIN Address a ON (a.number, a.road, a.city) = (req.number, req.road, req.city)
+        ORDER BY req.ord;
+    """
+    columns = list(zip(*addresses)) if addresses else [(), (), ()]
+    params = tuple(list(column) for column in columns)
+    curr = conn.cursor()
+    try:
+        curr.execute(dbQuery, params)
+        results = curr.fetchall()
+        # An address added by a concurrent transaction is skipped by the insert
+        # but not visible to the statement's snapshot; a second run sees it
+        if any(address_id is None for address_id, _ in results):
+            curr.execute(dbQuery, params)
+            results = [(address_id or retry_id, is_new or retry_new)
+                       for (address_id, is_new), (retry_id, retry_new) in zip(results, curr.fetchall())]
+        if commit:
+            conn.commit()
+    except Exception as e:
+        print("\nFailed to add address to database: ", e)
+        conn.rollback()
+        results = None
+    finally:
+        curr.close()
+    return results
 
-def insert_address(conn:psycopg2.extensions.connection, number, road, city, commit=True):
+def intern_addresses(conn:psycopg2.extensions.connection, addresses, commit=True):
     """
-    Searches the database for an address
+    Returns the address_id of each address, adding new addresses to the
+    database. Cached addresses are resolved without a round trip.
 
     Parameters:
+        conn: The database connection
+        addresses: List of (number, road, city) tuples
+        commit: Commit the new addresses
+
+    Returns:
+        List of address ids in input order, or None on error
+    """
+    keys = [(conn.dsn, int(number), road, city) for number, road, city in addresses]
+    missing = list(dict.fromkeys(key for key in keys if key not in _address_cache))
+    if missing:
+        # Without an open transaction, any existing row found is already committed
+        was_idle = conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_IDLE
+        results = resolve_addresses(conn, [key[1:] for key in missing], commit)
+        if results is None:
+            return None
+        if len(_address_cache) + len(missing) > ADDRESS_CACHE_SIZE:
+            _address_cache.clear()
+        found = {}
+        for key, (address_id, is_new) in zip(missing, results):
+            found[key] = address_id
+            # Only cache ids that are committed: a rollback would invalidate the others
+            if (commit and is_new) or (was_idle and not is_new):
+                _address_cache[key] = address_id
+        return [_address_cache.get(key) or found[key] for key in keys]
+    return [_address_cache[key] for key in keys]
+
+def intern_address(conn:psycopg2.extensions.connection, number, road, city, commit=True):
+    """
+    Returns the address_id of an address, adding it to the database if needed.
+
+    Parameters:
+        conn: The database connection
         number: Address number
         road:   The road
         city:   City address is located in
+        commit: Commit the new address
 
     Returns:
-        Boolean: True if address exists in the db, false otherwise
+        The address id, or None on error
     """
-    dbQuery = """INSERT INTO Address VALUES(%s, %s, %s) 
-                 ON CONFLICT (number, road, city)
-                 DO NOTHING
-                 RETURNING 1"""
-    is_successful = False
+    address_ids = intern_addresses(conn, [(number, road, city)], commit)
+    return address_ids[0] if address_ids else None
+
+### Pipelined statements ###
+# Multi-step flows (registering a client with several addresses and cards,
+# adding a driver and their address, ...) can send all of their statements in
+# one round trip with execute_pipeline instead of waiting for each reply.
+# The *_statement builders return (query, params) pairs for it.
+
+def driver_statement(name, address_id):
+    """Statement that adds a driver (row count 0 if the name is taken)"""
+    return INSERT_DRIVER_QUERY, (name, address_id)
+
+def driver_with_address_statement(name, number, road, city):
+    """Statement that adds a driver and, if new, their address (row count 0 if the name is taken)"""
+    return INSERT_DRIVER_WITH_ADDRESS_QUERY, {"name": name, "number": int(number), "road": road, "city": city}
+
+def driver_address_statement(name, address_id):
+    """Statement that changes a driver's address (row count 0 if the driver does not exist)"""
+    return UPDATE_DRIVER_ADDRESS_QUERY, (address_id, name)
+
+def client_statement(email, name):
+    """Statement that adds a client (row count 0 if the email is taken)"""
+    return INSERT_CLIENT_QUERY, (email, name)
+
+def client_address_statement(email, address_id):
+    """Statement that links a client to an address (row count 0 if already linked)"""
+    return INSERT_CLIENT_ADDRESS_QUERY, (email, address_id)
+
+def credit_card_statement(cc_number, email, address_id):
+    """Statement that adds a credit card (row count 0 if the card is in use)"""
+    return INSERT_CREDIT_CARD_QUERY, (cc_number, email, address_id)
+
+@read_write
+def execute_pipeline(conn:psycopg2.extensions.connection, statements, atomic=False, commit=True):
+    """
+    Sends a list of statements to the server in a single round trip.
+    The server function run_statement_batch runs them in order, each in its own
+    subtransaction, so a failing statement is undone on its own and the rest
+    still run (later statements that depend on it will fail too).
+
+    Parameters:
+        conn: The database connection
+        statements: List of (query, params) tuples, e.g. from the *_statement builders
+        atomic: If True, undo every statement when any of them fails
+        commit: Commit the successful statements
+
+    Returns:
+        List with one (row_count, error_code, error_message) tuple per statement, in order.
+        row_count is None and error_code holds the SQLSTATE for failed statements.
+    """
+    if not statements:
+        return []
+    dbQuery = """SELECT row_count, error_code, error_message
+                 FROM run_statement_batch(%s::text[])
+                 ORDER BY stmt_index"""
     curr = conn.cursor()
     try:
-        curr.execute(dbQuery, (number, road, city))
-        if commit:
+        # Bind parameters on the client so the server receives plain SQL text
+        encoding = psycopg2.extensions.encodings[conn.encoding]
+        texts = [curr.mogrify(query, params).decode(encoding) for query, params in statements]
+        curr.execute(dbQuery, (texts,))
+        results = curr.fetchall()
+        if atomic and any(error_code is not None for _, error_code, _ in results):
+            conn.rollback()
+        elif commit:
             conn.commit()
-        if curr.fetchone() != None:
-            is_successful = True
     except Exception as e:
-        print("\nFailed to add manager to database: ", e)
+        print("\nFailed to run statement pipeline: ", e)
         conn.rollback()
+        results = [(None, getattr(e, "pgcode", None), str(e))] * len(statements)
     finally:
         curr.close()
+    return results
 
-    return is_successful
+### Fuzzy search ###
+# Ranked lookups for when the exact driver name or client email is not known.
+# Candidates match by trigram word similarity (typos, partial names) or as a
+# substring; both are served by the trigram indexes in create_tables.sql.
+
+SEARCH_LIMIT = 5
+
+def _like_pattern(text):
+    """ILIKE pattern matching text anywhere, with its wildcards escaped"""
+    escaped = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+@read_only
+def search_drivers(conn:psycopg2.extensions.connection, text, limit=SEARCH_LIMIT):
+    """
+    Finds the drivers whose name best matches text.
+
+    Parameters:
+        conn: The database connection
+        text: Full or partial driver name, possibly misspelled
+        limit: Maximum number of candidates
+
+    Returns:
+        List of tuples: (name, score), an exact match first, then best match
+        first. A score of 1 can also be a whole-word match ("Bob" in "Amy Bob")
+    """
+    dbQuery = """
+        SELECT name, GREATEST(word_similarity(%(text)s, name), similarity(%(text)s, name)) AS score
+        FROM Driver
+        WHERE name %%> %(text)s OR name %% %(text)s OR name ILIKE %(pattern)s
+        ORDER BY name = %(text)s DESC, score DESC, name
+        LIMIT %(limit)s;
+    """
+    curr = conn.cursor()
+    curr.execute(dbQuery, {"text": text, "pattern": _like_pattern(text), "limit": limit})
+    results = curr.fetchall()
+    curr.close()
+    return results
+
+@read_only
+def search_clients(conn:psycopg2.extensions.connection, text, limit=SEARCH_LIMIT):
+    """
+    Finds the clients whose email or name best matches text.
+
+    Parameters:
+        conn: The database connection
+        text: Full or partial email or name, possibly misspelled
+        limit: Maximum number of candidates
+
+    Returns:
+        List of tuples: (email, name, score), an exact match first, then best match first
+    """
+    dbQuery = """
+        SELECT email, name,
+               GREATEST(word_similarity(%(text)s, email), similarity(%(text)s, email),
+                        word_similarity(%(text)s, name), similarity(%(text)s, name)) AS score
+        FROM Client
+        WHERE email %%> %(text)s OR email %% %(text)s OR email ILIKE %(pattern)s
+           OR name %%> %(text)s OR name %% %(text)s OR name ILIKE %(pattern)s
+        ORDER BY (email = %(text)s OR name = %(text)s) DESC, score DESC, email
+        LIMIT %(limit)s;
+    """
+    curr = conn.cursor()
+    curr.execute(dbQuery, {"text": text, "pattern": _like_pattern(text), "limit": limit})
+    results = curr.fetchall()
+    curr.close()
+    return results
 
 ### Manager Options ###
 
+@read_only
 def has_models(conn:psycopg2.extensions.connection):
     """Checks that models exist in the db
     
@@ -62,6 +367,7 @@ def has_models(conn:psycopg2.extensions.connection):
         else:
             return False
         
+@read_only
 def has_cars(conn:psycopg2.extensions.connection):
     """Checks that cars exist in the db
     
@@ -75,24 +381,31 @@ def has_cars(conn:psycopg2.extensions.connection):
         else:
             return False
 
-def get_models_rents(conn:psycopg2.extensions.connection):
+@read_only
+def get_models_rents(conn:psycopg2.extensions.connection, live=False):
     """
     Gets a list of all car models alongside the number of times each
     has been rented.
 
     Parameters:
         conn: The database connection
+        live: Query the booking tables instead of the model_rents_mv view
 
     Returns: 
         A list of tuples. Each tuple takes the form: (model_id, car_id, color, year, transmission, rent_count)
     """
-    dbQuery = """SELECT m.model_id, m.car_id, m.color, m.year, m.transmission,
-                        COUNT(rent_id) AS rent_count
-                 FROM Model m LEFT JOIN Rent r
-                 ON m.model_id = r.model
-                 GROUP BY m.car_id, m.model_id, m.color, m.year, m.transmission
-                 ORDER BY rent_count DESC;
-              """
+    if live:
+        dbQuery = """SELECT m.model_id, m.car_id, m.color, m.year, m.transmission,
+                            COUNT(rent_id) AS rent_count
+                     FROM Model m LEFT JOIN Rent r
+                     ON m.model_id = r.model
+                     GROUP BY m.car_id, m.model_id, m.color, m.year, m.transmission
+                     ORDER BY rent_count DESC;
+                  """
+    else:
+        dbQuery = """SELECT model_id, car_id, color, year, transmission, rent_count
+                     FROM model_rents_mv
+                     ORDER BY rent_count DESC;"""
     curr = conn.cursor()
     curr.execute(dbQuery)
     # returns list of tuples [(model_id, color, transmission, count(rents)), ...)]
@@ -100,7 +413,8 @@ def get_models_rents(conn:psycopg2.extensions.connection):
     curr.close()
     return models
 
-def insert_model(conn:psycopg2.extensions.connection, model_id, color, transmission, year, car_id):
+@read_write
+def insert_model(conn:psycopg2.extensions.connection, model_id, color, transmission, year, car_id, commit=True):
     """
     Inserts a new car model entry into the database.
     Prints an error message if the insert fails.
@@ -108,6 +422,7 @@ def insert_model(conn:psycopg2.extensions.connection, model_id, color, transmiss
     Parameters:
         car_id: An 8 digit primary key
         brand: The brand name of the car
+        commit: Commit the new model
     Returns: 
         True if insertion was successful, False if not.
     """
@@ -119,7 +434,8 @@ def insert_model(conn:psycopg2.extensions.connection, model_id, color, transmiss
     curr = conn.cursor()
     try:
         curr.execute(dbQuery, (model_id, car_id, color, transmission, year))
-        conn.commit()
+        if commit:
+            conn.commit()
         if curr.fetchone() != None:
             is_successful = True
     except Exception as e:
@@ -129,7 +445,8 @@ def insert_model(conn:psycopg2.extensions.connection, model_id, color, transmiss
         curr.close()
     return is_successful
 
-def insert_car(conn:psycopg2.extensions.connection, car_id, brand):
+@read_write
+def insert_car(conn:psycopg2.extensions.connection, car_id, brand, commit=True):
     """
     Inserts a new car model entry into the database.
     Prints an error message if the insert fails.
@@ -137,6 +454,7 @@ def insert_car(conn:psycopg2.extensions.connection, car_id, brand):
     Parameters:
         car_id: An 8 digit primary key
         brand: The brand name of the car
+        commit: Commit the new car
 
     Returns:
         Bool: True if insertion was successful, False if not
@@ -149,7 +467,8 @@ def insert_car(conn:psycopg2.extensions.connection, car_id, brand):
     curr = conn.cursor()
     try:
         curr.execute(dbQuery, (car_id, brand))
-        conn.commit()
+        if commit:
+            conn.commit()
         if curr.rowcount > 0:
             is_successful = True
     except Exception as e:
@@ -160,7 +479,149 @@ def insert_car(conn:psycopg2.extensions.connection, car_id, brand):
 
     return is_successful
 
+# Bulk fleet import
+@read_write
+def import_fleet(conn:psycopg2.extensions.connection, csv_file, update_existing=False, commit=True):
+    """
+    Imports cars and models from a CSV file in one transaction.
+    The file is streamed into a staging table with COPY, validated and merged
+    with set-based statements, so thousands of rows take a handful of round trips.
+
+    The file must have the header car_id,brand,model_id,color,transmission,year.
+    Rows with an empty model_id only add the car. Model rows may reference cars
+    that already exist or that appear elsewhere in the file.
+
+    Parameters:
+        conn: The database connection
+        csv_file: Open file object with the CSV text
+        update_existing: Update the brand of existing cars and the color,
+            transmission and year of existing models instead of skipping them
+        commit: Commit the import
+
+    Returns:
+        List of tuples (line number, car_id, model_id, outcome), one per data row,
+        or None if the file could not be loaded
+    """
+    on_car_conflict = ("DO UPDATE SET brand = EXCLUDED.brand" if update_existing else "DO NOTHING")
+    on_model_conflict = ("""DO UPDATE SET color = EXCLUDED.color,
+                                          transmission = EXCLUDED.transmission,
+                                          year = EXCLUDED.year
+                            WHERE Model.car_id = EXCLUDED.car_id""" if update_existing else "DO NOTHING")
+    statements = [
+        # Staging table; line_no follows the order of the data rows in the file
+        """DROP TABLE IF EXISTS pg_temp.fleet_stage""",
+        """CREATE TEMP TABLE fleet_stage(
+               line_no bigint GENERATED ALWAYS AS IDENTITY,
+               car_id text, brand text, model_id text,
+               color text, transmission text, year text,
+               outcome text
+           ) ON COMMIT DROP""",
+        None, # COPY goes here
+        """UPDATE fleet_stage
+           SET car_id = NULLIF(trim(car_id), ''),
+               brand = NULLIF(trim(brand), ''),
+               model_id = NULLIF(trim(model_id), ''),
+               color = NULLIF(trim(color), ''),
+               transmission = lower(trim(transmission)),
+               year = trim(year)""",
+        # Row validation
+        """UPDATE fleet_stage
+           SET outcome = CASE
+               WHEN car_id IS NULL OR length(car_id) <> 8
+                   THEN 'invalid car_id (must be 8 characters)'
+               WHEN model_id IS NULL
+                   THEN NULL
+               WHEN length(model_id) <> 8
+                   THEN 'invalid model_id (must be 8 characters)'
+               WHEN COALESCE(transmission, '') NOT IN ('manual', 'automatic')
+                   THEN 'invalid transmission (must be manual or automatic)'
+               WHEN COALESCE(year, '') !~ '^[0-9]{4}$'
+                   THEN 'invalid year'
+               WHEN year::int NOT BETWEEN 1900 AND EXTRACT(YEAR FROM now())::int + 1
+                   THEN 'invalid year'
+           END""",
+        # Conflicts inside the file: repeated model IDs and cars listed with different brands
+        """UPDATE fleet_stage s
+           SET outcome = 'model_id repeated in file (first on line ' || f.first_line + 1 || ')'
+           FROM (SELECT model_id, MIN(line_no) AS first_line
+                 FROM fleet_stage
+                 WHERE outcome IS NULL AND model_id IS NOT NULL
+                 GROUP BY model_id) f
+           WHERE s.model_id = f.model_id AND s.line_no > f.first_line AND s.outcome IS NULL""",
+        """UPDATE fleet_stage s
+           SET outcome = 'brand conflicts with line ' || f.line_no + 1
+           FROM (SELECT DISTINCT ON (car_id) car_id, brand, line_no
+                 FROM fleet_stage
+                 WHERE outcome IS NULL AND brand IS NOT NULL
+                 ORDER BY car_id, line_no) f
+           WHERE s.car_id = f.car_id AND s.brand <> f.brand AND s.outcome IS NULL""",
+        # Merge cars (first row with a brand wins)
+        f"""WITH merged AS (
+               INSERT INTO Car (car_id, brand)
+               SELECT DISTINCT ON (car_id) car_id, brand
+               FROM fleet_stage
+               WHERE outcome IS NULL AND brand IS NOT NULL
+               ORDER BY car_id, line_no
+               ON CONFLICT (car_id) {on_car_conflict}
+               RETURNING car_id, (xmax = 0) AS inserted
+           )
+           UPDATE fleet_stage s
+           SET outcome = CASE WHEN m.inserted THEN 'car added' ELSE 'car updated' END
+           FROM merged m
+           WHERE s.car_id = m.car_id AND s.model_id IS NULL AND s.outcome IS NULL""",
+        """UPDATE fleet_stage
+           SET outcome = 'car already exists'
+           WHERE model_id IS NULL AND outcome IS NULL""",
+        # Resolve model -> car references against existing and newly added cars
+        """UPDATE fleet_stage s
+           SET outcome = 'car_id does not exist'
+           WHERE s.outcome IS NULL
+             AND NOT EXISTS (SELECT 1 FROM Car c WHERE c.car_id = s.car_id)""",
+        # Merge models
+        f"""WITH merged AS (
+               INSERT INTO Model (model_id, car_id, color, transmission, year)
+               SELECT s.model_id, c.car_id, s.color, s.transmission, s.year::int
+               FROM fleet_stage s JOIN Car c ON c.car_id = s.car_id
+               WHERE s.outcome IS NULL
+               ON CONFLICT (model_id) {on_model_conflict}
+               RETURNING model_id, (xmax = 0) AS inserted
+           )
+           UPDATE fleet_stage s
+           SET outcome = CASE WHEN m.inserted THEN 'model added' ELSE 'model updated' END
+           FROM merged m
+           WHERE s.model_id = m.model_id AND s.outcome IS NULL""",
+        """UPDATE fleet_stage s
+           SET outcome = CASE WHEN EXISTS (SELECT 1 FROM Model m
+                                           WHERE m.model_id = s.model_id AND m.car_id <> s.car_id)
+                              THEN 'model_id already used by another car'
+                              ELSE 'model already exists' END
+           WHERE s.outcome IS NULL""",
+    ]
+    copyQuery = """COPY fleet_stage (car_id, brand, model_id, color, transmission, year)
+                   FROM STDIN WITH (FORMAT csv, HEADER true)"""
+    reportQuery = """SELECT line_no + 1, car_id, model_id, outcome
+                     FROM fleet_stage ORDER BY line_no"""
+    curr = conn.cursor()
+    try:
+        for statement in statements:
+            if statement is None:
+                curr.copy_expert(copyQuery, csv_file)
+            else:
+                curr.execute(statement)
+        curr.execute(reportQuery)
+        report = curr.fetchall()
+        if commit:
+            conn.commit()
+    except Exception as e:
+        print("\nFailed to import fleet: ", e)
+        conn.rollback()
+        report = None
+    finally:
+        curr.close()
+    return report
+
 # For manager registration
+@read_write
 def insert_manager(conn:psycopg2.extensions.connection, ssn, email, name):
     """
     Inserts a new manager entry in the database.
@@ -194,6 +655,7 @@ def insert_manager(conn:psycopg2.extensions.connection, ssn, email, name):
     return is_successful
 
 # For logging in a manager
+@read_only
 def get_manager(conn:psycopg2.extensions.connection, ssn):
     """
     Searches the database for a manager with a matching ssn.
@@ -215,6 +677,7 @@ def get_manager(conn:psycopg2.extensions.connection, ssn):
     return manager
 
 # For logging in a manager
+@read_only
 def get_car(conn:psycopg2.extensions.connection, car_id):
     """
     Searches the database for a car with a matching ssn.
@@ -235,8 +698,11 @@ def get_car(conn:psycopg2.extensions.connection, car_id):
     curr.close()
     return car
 
+@read_only
 def get_driver(conn:psycopg2.extensions.connection, name):
-    dbQuery = "SELECT * FROM Driver WHERE name = %s"
+    dbQuery = """SELECT d.name, a.number, a.road, a.city
+                 FROM Driver d LEFT JOIN Address a ON a.address_id = d.address_id
+                 WHERE d.name = %s"""
     curr = conn.cursor()
     curr.execute(dbQuery, (name,))
     driver = curr.fetchone()
@@ -247,22 +713,30 @@ def get_driver(conn:psycopg2.extensions.connection, name):
 
 
 # Get top-k clients by number of rents
-def get_top_k_clients(conn:psycopg2.extensions.connection, k):
+@read_only
+def get_top_k_clients(conn:psycopg2.extensions.connection, k, live=False):
     """
     Returns the top k clients along with their rent counts.
 
     Parameters:
         conn: The database connection
         k: Number of top clients to retrieve
+        live: Query the booking tables instead of the client_rents_mv view
 
     Returns:
         List of tuples: (email, name, rent_count)
     """
-    dbQuery = """SELECT c.email, c.name, COUNT(r.rent_id) AS rent_count
-                 FROM Client c JOIN Rent r ON c.email = r.client
-                 GROUP BY c.email, c.name
-                 ORDER BY rent_count DESC
-                 LIMIT %s;"""
+    if live:
+        dbQuery = """SELECT c.email, c.name, COUNT(r.rent_id) AS rent_count
+                     FROM Client c JOIN Rent r ON c.client_id = r.client_id
+                     GROUP BY c.client_id, c.email, c.name
+                     ORDER BY rent_count DESC
+                     LIMIT %s;"""
+    else:
+        dbQuery = """SELECT email, name, rent_count
+                     FROM client_rents_mv
+                     ORDER BY rent_count DESC
+                     LIMIT %s;"""
     curr = conn.cursor()
     curr.execute(dbQuery, (k,))
     results = curr.fetchall()
@@ -270,78 +744,670 @@ def get_top_k_clients(conn:psycopg2.extensions.connection, k):
     return results
 
 # Get driver statistics (total rents and average rating)
-def get_driver_stats(conn:psycopg2.extensions.connection):
+@read_only
+def get_driver_stats(conn:psycopg2.extensions.connection, live=False):
     """
     Retrieves each driver with total number of rents and average rating.
 
     Parameters:
         conn: The database connection
+        live: Query the booking tables instead of the driver_stats_mv view
+
+    Returns:
+        List of tuples: (name, total_rents, avg_rating)
+    """
+    if live:
+        dbQuery = """SELECT d.name,
+                            COUNT(r.rent_id) AS total_rents,
+                            COALESCE(ROUND(AVG(rv.rating)::numeric,2),-1) AS avg_rating
+                     FROM Driver d
+                     LEFT JOIN Rent r ON d.driver_id = r.driver_id
+                     LEFT JOIN Review rv ON d.driver_id = rv.driver_id
+                     GROUP BY d.driver_id, d.name
+                     ORDER BY d.name;"""
+    else:
+        dbQuery = """SELECT name, total_rents, avg_rating
+                     FROM driver_stats_mv
+                     ORDER BY name;"""
+    curr = conn.cursor()
+    curr.execute(dbQuery)
+    results = curr.fetchall()
+    curr.close()
+    return results
+
+# Get clients with address in city1 and rents with drivers in city2
+@read_only
+def get_clients_by_cities(conn:psycopg2.extensions.connection, city1, city2, live=False):
+    """
+    Retrieves clients who have at least one address in city1
+    and have booked a rent with a driver whose address is in city2.
+
+    Parameters:
+        conn: The database connection
+        city1: Client address city filter
+        city2: Driver address city filter
+        live: Query the booking tables instead of the client_driver_cities_mv view
+
+    Returns:
+        List of tuples: (email, name)
+    """
+    if live:
+        dbQuery = """SELECT DISTINCT c.email, c.name
+                     FROM Client c
+                     JOIN ClientAddresses ca ON c.client_id = ca.client_id
+                     JOIN Address ca_addr ON ca.address_id = ca_addr.address_id
+                     JOIN Rent r ON c.client_id = r.client_id
+                     JOIN Driver d ON r.driver_id = d.driver_id
+                     JOIN Address d_addr ON d.address_id = d_addr.address_id
+                     WHERE ca_addr.city = %s AND d_addr.city = %s;"""
+    else:
+        dbQuery = """SELECT email, name
+                     FROM client_driver_cities_mv
+                     WHERE client_city = %s AND driver_city = %s;"""
+    curr = conn.cursor()
+    curr.execute(dbQuery, (city1, city2))
+    results = curr.fetchall()
+    curr.close()
+    return results
+
+### Analytics refresh ###
+# The manager reports above read materialized views by default (live=False).
+# refresh_analytics rebuilds them with REFRESH MATERIALIZED VIEW CONCURRENTLY,
+# which does not block readers, and records when each one was refreshed.
+
+# Report name -> materialized view
+ANALYTICS_VIEWS = {
+    "models_rents": "model_rents_mv",
+    "top_clients": "client_rents_mv",
+    "driver_stats": "driver_stats_mv",
+    "clients_by_cities": "client_driver_cities_mv",
+}
+
+@read_write
+def refresh_analytics(conn:psycopg2.extensions.connection, reports=None):
+    """
+    Refreshes the materialized views behind the manager reports, each in its
+    own transaction.
+
+    Parameters:
+        conn: The database connection
+        reports: Names from ANALYTICS_VIEWS to refresh, or None for all of them
+
+    Returns:
+        List of (report, seconds) tuples for the views refreshed, stopping at
+        the first failure
+    """
+    refreshed = []
+    curr = conn.cursor()
+    try:
+        for report in reports or ANALYTICS_VIEWS:
+            view = ANALYTICS_VIEWS[report]
+            start = time.perf_counter()
+            curr.execute(sql.SQL("REFRESH MATERIALIZED VIEW CONCURRENTLY {}").format(sql.Identifier(view)))
+            # now() is the start of this transaction, so it never overstates freshness
+            curr.execute("""INSERT INTO AnalyticsRefresh (view_name, refreshed_at)
+                            VALUES (%s, now())
+                            ON CONFLICT (view_name) DO UPDATE SET refreshed_at = EXCLUDED.refreshed_at""",
+                         (view,))
+            conn.commit()
+            refreshed.append((report, time.perf_counter() - start))
+    except Exception as e:
+        print("\nFailed to refresh analytics: ", e)
+        conn.rollback()
+    finally:
+        curr.close()
+    return refreshed
+
+@read_only
+def get_analytics_freshness(conn:psycopg2.extensions.connection):
+    """
+    Returns when each manager report's view was last refreshed.
+
+    Parameters:
+        conn: The database connection
+
+    Returns:
+        Dict of report name -> (refreshed_at, age in seconds)
+    """
+    dbQuery = """SELECT view_name, refreshed_at, EXTRACT(EPOCH FROM now() - refreshed_at)
+                 FROM AnalyticsRefresh"""
+    curr = conn.cursor()
+    curr.execute(dbQuery)
+    by_view = {view: (refreshed_at, float(age)) for view, refreshed_at, age in curr.fetchall()}
+    curr.close()
+    return {report: by_view[view] for report, view in ANALYTICS_VIEWS.items() if view in by_view}
+
+# Search review messages, most relevant first
+REVIEW_PAGE_SIZE = 10
+
+@read_only
+def search_reviews(conn:psycopg2.extensions.connection, query, after=None, limit=REVIEW_PAGE_SIZE):
+    """
+    Full-text search over review messages, ranked by relevance and paged with
+    a keyset cursor (each page continues after the last row of the previous
+    one instead of skipping rows with OFFSET).
+
+    Parameters:
+        conn: The database connection
+        query: Search terms in web search syntax (e.g. late -rude, "too slow", late or rude)
+        after: Cursor returned with the previous page, or None for the first page
+        limit: Maximum number of reviews per page
+
+    Returns:
+        Tuple (reviews, cursor): reviews is a list of tuples
+        (review_id, driver, client, rating, message, rank), and cursor is the
+        value to pass as after for the next page (None on the last page)
+    """
+    dbQuery = """
+        SELECT review_id, driver, client, rating, message, rank
+        FROM (
+            SELECT rv.review_id, d.name AS driver, c.email AS client, rv.rating, rv.message,
+                   ts_rank(rv.message_tsv, q) AS rank
+            FROM websearch_to_tsquery('english', %(query)s) q
+            JOIN Review rv ON rv.message_tsv @@ q
+            JOIN Driver d ON d.driver_id = rv.driver_id
+            LEFT JOIN Client c ON c.client_id = rv.client_id
+        ) hits
+        WHERE %(after_rank)s::real IS NULL
+           OR (rank, review_id) < (%(after_rank)s::real, %(after_id)s)
+        ORDER BY rank DESC, review_id DESC
+        LIMIT %(limit)s;
+    """
+    after_rank, after_id = after if after else (None, None)
+    curr = conn.cursor()
+    # One extra row tells whether there is another page
+    curr.execute(dbQuery, {"query": query, "after_rank": after_rank, "after_id": after_id,
+                           "limit": limit + 1})
+    reviews = curr.fetchall()
+    curr.close()
+    cursor = None
+    if len(reviews) > limit:
+        reviews = reviews[:limit]
+        cursor = (reviews[-1][5], reviews[-1][0])
+    return reviews, cursor
+
+### Rent trends ###
+# Time-series reports read the RentDaily rollup (rents per day, model and
+# driver), which triggers on Rent keep current through bookings and deletes.
+# A multi-day rent counts on every day it covers, so the counts are rented
+# days. A year of daily counts for one model or driver is a few hundred rollup
+# rows. Listing the raw rents of a date range goes through the BRIN index on
+# Rent(date): a rent that overlaps the range starts at most MAX_RENT_DAYS - 1
+# days before it.
+
+RENT_BUCKETS = ("day", "week", "month")
+
+# Breakdown dimension -> column of the rollup query
+RENT_DIMENSIONS = {
+    "model": "rd.model",
+    "driver": "drv.name",
+    "city": "a.city",
+}
+
+@read_only
+def get_rent_series(conn:psycopg2.extensions.connection, start_date, end_date, bucket="day",
+                    model_id=None, driver=None, city=None):
+    """
+    Counts rents per day, week or month between two dates, optionally only for
+    one model, one driver or the drivers living in one city. Buckets without
+    rents are included with a count of 0.
+
+    Parameters:
+        conn: The database connection
+        start_date: First date (inclusive)
+        end_date: Last date (inclusive)
+        bucket: "day", "week" (starting Monday) or "month"
+        model_id: Only count rents of this model
+        driver: Only count rents of this driver (name)
+        city: Only count rents of drivers living in this city
+
+    Returns:
+        List of tuples: (bucket start date, rent_count), in date order
+    """
+    if bucket not in RENT_BUCKETS:
+        raise ValueError(f"Unknown time bucket: {bucket}")
+    dbQuery = """
+        WITH counts AS (
+            SELECT date_trunc(%(bucket)s, rd.day)::date AS bucket, SUM(rd.rent_count) AS rent_count
+            FROM RentDaily rd
+            JOIN Driver drv ON drv.driver_id = rd.driver_id
+            LEFT JOIN Address a ON a.address_id = drv.address_id
+            WHERE rd.day BETWEEN %(start)s AND %(end)s
+              AND (%(model)s::text IS NULL OR rd.model = %(model)s)
+              AND (%(driver)s::text IS NULL OR drv.name = %(driver)s)
+              AND (%(city)s::text IS NULL OR a.city = %(city)s)
+            GROUP BY 1
+        )
+        SELECT b::date, COALESCE(c.rent_count, 0)
+        FROM generate_series(date_trunc(%(bucket)s, %(start)s::date), %(end)s::date,
+                             ('1 ' || %(bucket)s)::interval) b
+        LEFT JOIN counts c ON c.bucket = b::date
+        ORDER BY b;"""
+    curr = conn.cursor()
+    curr.execute(dbQuery, {"bucket": bucket, "start": start_date, "end": end_date,
+                           "model": model_id, "driver": driver, "city": city})
+    series = curr.fetchall()
+    curr.close()
+    return series
+
+@read_only
+def get_rent_breakdown(conn:psycopg2.extensions.connection, start_date, end_date, by="model", limit=None):
+    """
+    Totals the rents between two dates per model, driver or driver city.
+
+    Parameters:
+        conn: The database connection
+        start_date: First date (inclusive)
+        end_date: Last date (inclusive)
+        by: "model", "driver" or "city"
+        limit: Maximum number of rows (None for all)
+
+    Returns:
+        List of tuples: (key, rent_count), busiest first, where key is the
+        model_id, driver name or city
+    """
+    if by not in RENT_DIMENSIONS:
+        raise ValueError(f"Unknown breakdown: {by}")
+    dbQuery = f"""
+        SELECT {RENT_DIMENSIONS[by]}, SUM(rd.rent_count) AS rent_count
+        FROM RentDaily rd
+        JOIN Driver drv ON drv.driver_id = rd.driver_id
+        LEFT JOIN Address a ON a.address_id = drv.address_id
+        WHERE rd.day BETWEEN %s AND %s
+        GROUP BY 1
+        HAVING SUM(rd.rent_count) > 0
+        ORDER BY rent_count DESC, 1
+        LIMIT %s;"""
+    curr = conn.cursor()
+    curr.execute(dbQuery, (start_date, end_date, limit))
+    breakdown = curr.fetchall()
+    curr.close()
+    return breakdown
+
+@read_only
+def get_rents_between(conn:psycopg2.extensions.connection, start_date, end_date):
+    """
+    Lists the individual rents that cover any day between two dates.
+
+    Parameters:
+        conn: The database connection
+        start_date: First date (inclusive)
+        end_date: Last date (inclusive)
+
+    Returns:
+        List of tuples: (rent_id, date, days, client email, driver name, model_id), in date order
+    """
+    dbQuery = """
+        SELECT r.rent_id, r.date, r.days, c.email, drv.name, r.model
+        FROM Rent r
+        JOIN Client c ON c.client_id = r.client_id
+        JOIN Driver drv ON drv.driver_id = r.driver_id
+        WHERE r.date BETWEEN %(start)s::date - %(max_days)s + 1 AND %(end)s
+          AND r.dates && daterange(%(start)s, %(end)s, '[]')
+        ORDER BY r.date, r.rent_id;"""
+    curr = conn.cursor()
+    curr.execute(dbQuery, {"start": start_date, "end": end_date, "max_days": MAX_RENT_DAYS})
+    rents = curr.fetchall()
+    curr.close()
+    return rents
+
+### Change feed ###
+# Rent, review, car, model and driver changes are recorded in the Outbox table
+# by triggers, in the same transaction as the change (see create_tables.sql).
+# A consumer reads events after its position, a (txid, event_id) pair, and
+# acknowledges the last one it has handled. Only events below the oldest
+# running transaction are returned, so an event that commits late can never
+# land behind a position that was already acknowledged.
+
+OUTBOX_CHANNEL = "outbox"
+OUTBOX_TOPICS = ("rent", "review", "car", "model", "driver")
+OUTBOX_BATCH_SIZE = 500
+OUTBOX_PRUNE_BATCH_SIZE = 5000
+
+# Position before the first event
+OUTBOX_START = ("0", 0)
+
+OutboxEvent = namedtuple("OutboxEvent", ["txid", "event_id", "topic", "event", "key", "payload", "created_at"])
+
+@read_write
+def register_outbox_consumer(conn:psycopg2.extensions.connection, name, from_start=False):
+    """
+    Registers a consumer, unless it already exists.
+    A new consumer starts after the newest event (or before the oldest one if
+    from_start). An existing consumer keeps its position.
+
+    Parameters:
+        conn: The database connection
+        name: Consumer name
+        from_start: Start a new consumer at the beginning of the feed
+
+    Returns:
+        The consumer's position (txid, event_id), or None if registering failed
+    """
+    dbQuery = """
+        INSERT INTO OutboxConsumer (name, last_txid, last_event_id)
+        SELECT %(name)s, COALESCE(head.txid, '0'), COALESCE(head.event_id, 0)
+        FROM (SELECT 1) one
+        LEFT JOIN (SELECT txid, event_id
+                   FROM Outbox
+                   WHERE NOT %(from_start)s
+                     AND txid < pg_snapshot_xmin(pg_current_snapshot())
+                   ORDER BY txid DESC, event_id DESC
+                   LIMIT 1) head ON true
+        ON CONFLICT (name) DO NOTHING;
+    """
+    position_query = "SELECT last_txid::text, last_event_id FROM OutboxConsumer WHERE name = %s;"
+    curr = conn.cursor()
+    try:
+        curr.execute(dbQuery, {"name": name, "from_start": from_start})
+        curr.execute(position_query, (name,))
+        position = curr.fetchone()
+        conn.commit()
+        return position
+    except Exception as e:
+        print("Failed to register the consumer:", e)
+        conn.rollback()
+        return None
+    finally:
+        curr.close()
+
+@read_primary
+def read_outbox(conn:psycopg2.extensions.connection, after=OUTBOX_START, limit=OUTBOX_BATCH_SIZE):
+    """
+    Reads the events that follow a position, in order.
+
+    Parameters:
+        conn: The database connection
+        after: Position (txid, event_id) of the last event already read
+        limit: Maximum number of events returned
+
+    Returns:
+        List of OutboxEvent
+    """
+    dbQuery = """
+        SELECT txid::text, event_id, topic, event, entity_key, payload, created_at
+        FROM Outbox
+        WHERE (txid, event_id) > (%s::xid8, %s)
+          AND txid < pg_snapshot_xmin(pg_current_snapshot())
+        ORDER BY txid, event_id
+        LIMIT %s;
+    """
+    curr = conn.cursor()
+    curr.execute(dbQuery, (after[0], after[1], limit))
+    events = [OutboxEvent(*row) for row in curr.fetchall()]
+    curr.close()
+    return events
+
+@read_write
+def ack_outbox(conn:psycopg2.extensions.connection, name, position):
+    """
+    Acknowledges every event of a consumer up to and including a position.
+    The position never moves backwards.
+
+    Parameters:
+        conn: The database connection
+        name: Consumer name
+        position: (txid, event_id) of the last event handled
+
+    Returns:
+        True if the consumer's position moved
+    """
+    dbQuery = """
+        UPDATE OutboxConsumer
+        SET last_txid = %(txid)s::xid8, last_event_id = %(event_id)s, acked_at = now()
+        WHERE name = %(name)s
+          AND (last_txid, last_event_id) < (%(txid)s::xid8, %(event_id)s);
+    """
+    curr = conn.cursor()
+    try:
+        curr.execute(dbQuery, {"name": name, "txid": position[0], "event_id": position[1]})
+        moved = curr.rowcount == 1
+        conn.commit()
+        return moved
+    except Exception as e:
+        print("Failed to acknowledge events:", e)
+        conn.rollback()
+        return False
+    finally:
+        curr.close()
+
+@read_primary
+def get_outbox_consumers(conn:psycopg2.extensions.connection):
+    """
+    Lists the consumers and how far behind they are.
+
+    Parameters:
+        conn: The database connection
+
+    Returns:
+        List of tuples: (name, txid, event_id, acked_at, pending events), by name
+    """
+    dbQuery = """
+        SELECT c.name, c.last_txid::text, c.last_event_id, c.acked_at,
+               (SELECT COUNT(*) FROM Outbox o
+                WHERE (o.txid, o.event_id) > (c.last_txid, c.last_event_id))
+        FROM OutboxConsumer c
+        ORDER BY c.name;
+    """
+    curr = conn.cursor()
+    curr.execute(dbQuery)
+    consumers = curr.fetchall()
+    curr.close()
+    return consumers
+
+@read_write
+def drop_outbox_consumer(conn:psycopg2.extensions.connection, name):
+    """
+    Removes a consumer, so its position no longer holds back prune_outbox.
+
+    Parameters:
+        conn: The database connection
+        name: Consumer name
+
+    Returns:
+        True if the consumer existed
+    """
+    curr = conn.cursor()
+    try:
+        curr.execute("DELETE FROM OutboxConsumer WHERE name = %s;", (name,))
+        dropped = curr.rowcount == 1
+        conn.commit()
+        return dropped
+    except Exception as e:
+        print("Failed to drop the consumer:", e)
+        conn.rollback()
+        return False
+    finally:
+        curr.close()
+
+@read_write
+def prune_outbox(conn:psycopg2.extensions.connection, batch_size=OUTBOX_PRUNE_BATCH_SIZE):
+    """
+    Deletes the events every consumer has acknowledged, in batches that each
+    commit on their own. Nothing is deleted while there are no consumers.
+
+    Parameters:
+        conn: The database connection
+        batch_size: Maximum number of events deleted per transaction
+
+    Returns:
+        Number of events deleted, or None if the job failed
+    """
+    dbQuery = """
+        DELETE FROM Outbox
+        WHERE event_id = ANY(ARRAY(
+            SELECT event_id FROM Outbox
+            WHERE (txid, event_id) <= (SELECT last_txid, last_event_id
+                                       FROM OutboxConsumer
+                                       ORDER BY last_txid, last_event_id
+                                       LIMIT 1)
+            ORDER BY txid, event_id
+            LIMIT %s));
+    """
+    total = 0
+    curr = conn.cursor()
+    try:
+        while True:
+            curr.execute(dbQuery, (batch_size,))
+            batch = curr.rowcount
+            conn.commit()
+            total += batch
+            if batch < batch_size:
+                return total
+    except Exception as e:
+        print("Failed to prune the outbox:", e)
+        conn.rollback()
+        return None
+    finally:
+        curr.close()
+
+### Batched deletes ###
+# Deleting a car, model or driver with one DELETE cascades through Model, Rent,
+# Drives and Review in a single long transaction that holds locks bookings need.
+# These functions instead remove the dependent rows first, in small batches that
+# each commit on their own, and delete the parent row last. Every table with an
+# ON DELETE CASCADE reference is cleared first, including the rollups (RentDaily,
+# DriverLoad), so the parent delete has nothing left to cascade. Waiting
+# requests and holds go before the rents, so the rents freed on the way do not
+# get booked again by the waitlist worker.
+
+# For each kind of delete: the tables to clear, in order, with the WHERE clause
+# selecting the rows that belong to the target (every %s is the target's key)
+DELETE_PLANS = {
+    "car": [
+        ("Waitlist", "model IN (SELECT model_id FROM Model WHERE car_id = %s)"),
+        ("RentHold", "model IN (SELECT model_id FROM Model WHERE car_id = %s)"),
+        ("Rent", "model IN (SELECT model_id FROM Model WHERE car_id = %s)"),
+        ("RentDaily", "model IN (SELECT model_id FROM Model WHERE car_id = %s)"),
+        ("Drives", "model IN (SELECT model_id FROM Model WHERE car_id = %s)"),
+        ("Model", "car_id = %s"),
+        ("Car", "car_id = %s"),
+    ],
+    "model": [
+        ("Waitlist", "model = %s"),
+        ("RentHold", "model = %s"),
+        ("Rent", "model = %s"),
+        ("RentDaily", "model = %s"),
+        ("Drives", "model = %s"),
+        ("Model", "model_id = %s"),
+    ],
+    "driver": [
+        ("RentHold", "driver_id = (SELECT driver_id FROM Driver WHERE name = %s)"),
+        ("Rent", "driver_id = (SELECT driver_id FROM Driver WHERE name = %s)"),
+        ("RentDaily", "driver_id = (SELECT driver_id FROM Driver WHERE name = %s)"),
+        ("DriverLoad", "driver_id = (SELECT driver_id FROM Driver WHERE name = %s)"),
+        ("Drives", "driver_id = (SELECT driver_id FROM Driver WHERE name = %s)"),
+        ("Review", "driver_id = (SELECT driver_id FROM Driver WHERE name = %s)"),
+        ("DriverRating", "driver_id = (SELECT driver_id FROM Driver WHERE name = %s)"),
+        ("Driver", "name = %s"),
+    ],
+}
+
+# Number of times a batch is retried when it cannot get its locks in time
+DELETE_LOCK_RETRIES = 5
+
+@read_primary
+def count_delete_impact(conn:psycopg2.extensions.connection, kind, key):
+    """
+    Counts the rows a delete would remove from each table, in one query.
+
+    Parameters:
+        conn: The database connection
+        kind: "car", "model" or "driver"
+        key: car_id, model_id or driver name
 
     Returns:
-        List of tuples: (name, total_rents, avg_rating)
+        List of tuples: (table, row_count), in the order the tables are cleared
     """
-    dbQuery = """SELECT d.name,
-                        COUNT(r.rent_id) AS total_rents,
-                        COALESCE(ROUND(AVG(rv.rating)::numeric,2),-1) AS avg_rating
-                 FROM Driver d
-                 LEFT JOIN Rent r ON d.name = r.driver
-                 LEFT JOIN Review rv ON d.name = rv.driver
-                 GROUP BY d.name
-                 ORDER BY d.name;"""
+    plan = DELETE_PLANS[kind]
+    dbQuery = " UNION ALL ".join(
+        f"(SELECT '{table}', COUNT(*) FROM {table} WHERE {where})" for table, where in plan)
+    params = tuple(key for _, where in plan for _ in range(where.count("%s")))
     curr = conn.cursor()
-    curr.execute(dbQuery)
-    results = curr.fetchall()
+    curr.execute(dbQuery, params)
+    counts = curr.fetchall()
     curr.close()
-    return results
+    return counts
 
-# Get clients with address in city1 and rents with drivers in city2
-def get_clients_by_cities(conn:psycopg2.extensions.connection, city1, city2):
+@read_write
+def delete_in_batches(conn:psycopg2.extensions.connection, kind, key, batch_size=1000,
+                      progress=None, lock_timeout_ms=2000):
     """
-    Retrieves clients who have at least one address in city1
-    and have booked a rent with a driver whose address is in city2.
+    Deletes a car (with its models), a model or a driver, together with every
+    row that depends on it, in bounded batches with one short transaction each.
+    A batch that waits longer than lock_timeout_ms for a lock is rolled back and
+    retried, so the job gives way to bookings instead of stalling them.
 
     Parameters:
         conn: The database connection
-        city1: Client address city filter
-        city2: Driver address city filter
+        kind: "car", "model" or "driver"
+        key: car_id, model_id or driver name
+        batch_size: Maximum number of rows deleted per transaction
+        progress: Optional function called as progress(table, rows_deleted_so_far) after each batch
+        lock_timeout_ms: Lock wait limit for each batch
 
     Returns:
-        List of tuples: (email, name)
+        List of tuples (table, rows_deleted) in the order the tables were cleared,
+        or None if the job failed (batches committed before the failure stay deleted)
     """
-    dbQuery = """SELECT DISTINCT c.email, c.name
-                 FROM Client c
-                 JOIN ClientAddresses ca ON c.email = ca.client
-                 JOIN Rent r ON c.email = r.client
-                 JOIN Driver d ON r.driver = d.name
-                 WHERE ca.city = %s AND d.city = %s;"""
+    deleted = []
     curr = conn.cursor()
-    curr.execute(dbQuery, (city1, city2))
-    results = curr.fetchall()
-    curr.close()
-    return results
+    try:
+        for table, where in DELETE_PLANS[kind]:
+            dbQuery = f"""DELETE FROM {table}
+                          WHERE ctid = ANY(ARRAY(SELECT ctid FROM {table}
+                                                 WHERE {where}
+                                                 LIMIT %s))"""
+            params = tuple(key for _ in range(where.count("%s"))) + (batch_size,)
+            total = 0
+            retries = 0
+            while True:
+                try:
+                    curr.execute("SET LOCAL lock_timeout = %s", (f"{int(lock_timeout_ms)}ms",))
+                    curr.execute(dbQuery, params)
+                    batch = curr.rowcount
+                    conn.commit()
+                except errors.LockNotAvailable:
+                    conn.rollback()
+                    retries += 1
+                    if retries > DELETE_LOCK_RETRIES:
+                        raise
+                    continue
+                retries = 0
+                total += batch
+                if progress is not None:
+                    progress(table, total)
+                if batch < batch_size:
+                    break
+            deleted.append((table, total))
+    except Exception as e:
+        print("\nFailed to delete: ", e)
+        conn.rollback()
+        deleted = None
+    finally:
+        curr.close()
+    return deleted
 
 ### Driver Options ###
 
-def insert_driver(conn:psycopg2.extensions.connection, name, number, road, city):
+@read_write
+def insert_driver(conn:psycopg2.extensions.connection, name, address_id):
     """
-    Searches the database for an address
+    Inserts a new driver into the database.
 
     Parameters:
-        number: Address number
-        road:   The road
-        city:   City address is located in
+        conn: The database connection
+        name: Driver name
+        address_id: Address identifier (from intern_address)
 
     Returns:
-        Boolean: True if address exists in the db, false otherwise
+        True if insertion successful, False otherwise
     """
-    dbQuery = """INSERT INTO Driver 
-                 VALUES(%s, %s, %s, %s)
-                 ON CONFLICT (name) DO NOTHING
-                 RETURNING 1"""
+    dbQuery = INSERT_DRIVER_QUERY
     is_successful = False
     curr = conn.cursor()
     try:
-        curr.execute(dbQuery, (name, number, road, city))
+        curr.execute(dbQuery, (name, address_id))
         conn.commit()
         if curr.fetchone() != None:
             is_successful = True
@@ -353,6 +1419,7 @@ def insert_driver(conn:psycopg2.extensions.connection, name, number, road, city)
     return is_successful
 
 
+@read_write
 def delete_driver(conn:psycopg2.extensions.connection, name):
     """
     Deletes a driver by name.
@@ -380,28 +1447,26 @@ def delete_driver(conn:psycopg2.extensions.connection, name):
     return is_successful
 
 
-def update_driver_address(conn:psycopg2.extensions.connection, name, number, road, city):
+@read_write
+def update_driver_address(conn:psycopg2.extensions.connection, name, address_id):
     """
     Updates a driver's address.
 
     Parameters:
         conn: The database connection
         name: Driver name
-        new_address_id: New address identifier
+        address_id: New address identifier (from intern_address)
 
     Returns:
         True if update successful, False otherwise
     """
     is_successful = False
-    dbQuery = """UPDATE Driver 
-                 SET number = %s, road = %s, city = %s
-                 WHERE name = %s
-                 RETURNING *"""
+    dbQuery = UPDATE_DRIVER_ADDRESS_QUERY
     curr = conn.cursor()
     is_successful = False
     curr = conn.cursor()
     try:
-        curr.execute(dbQuery, (number, road, city, name))
+        curr.execute(dbQuery, (address_id, name))
         conn.commit()
         if curr.fetchone() is not None:
             is_successful = True
@@ -412,14 +1477,17 @@ def update_driver_address(conn:psycopg2.extensions.connection, name, number, roa
         curr.close()
     return is_successful
 
+@read_write
 def update_driver_name(conn:psycopg2.extensions.connection, old_name, new_name):
     """
-    Updates a driver's address.
+    Renames a driver.
+    Rents, reviews and qualifications reference the driver by driver_id,
+    so a rename only rewrites the Driver row.
 
     Parameters:
         conn: The database connection
-        name: Driver name
-        new_address_id: New address identifier
+        old_name: Current driver name
+        new_name: New driver name (must not be taken by another driver)
 
     Returns:
         True if update successful, False otherwise
@@ -447,6 +1515,7 @@ def update_driver_name(conn:psycopg2.extensions.connection, old_name, new_name):
         curr.close()
     return is_successful
 
+@read_only
 def get_all_models(conn:psycopg2.extensions.connection):
     """
     Retrieves all car models in the system.
@@ -465,6 +1534,7 @@ def get_all_models(conn:psycopg2.extensions.connection):
     return models
 
 
+@read_write
 def qualify_driver_for_model(conn:psycopg2.extensions.connection, name, model_id):
     """
     Qualifies a driver for a specific model.
@@ -479,7 +1549,8 @@ def qualify_driver_for_model(conn:psycopg2.extensions.connection, name, model_id
         Error codes: 1 = already qualified. 2 = foreign key violation, 3 = unknown error
     """
     return_val = 3
-    dbQuery = "INSERT INTO Drives (driver, model) VALUES (%s, %s)"
+    dbQuery = """INSERT INTO Drives (driver_id, model)
+                 VALUES ((SELECT driver_id FROM Driver WHERE name = %s), %s)"""
     curr = conn.cursor()
     try:
         curr.execute(dbQuery, (name, model_id))
@@ -489,8 +1560,8 @@ def qualify_driver_for_model(conn:psycopg2.extensions.connection, name, model_id
     except psycopg2.errors.UniqueViolation as e:
         conn.rollback()
         return_val = 1
-    # Foreign key not found
-    except errors.ForeignKeyViolation as e:
+    # Foreign key not found (an unknown driver name resolves to a NULL driver_id)
+    except (errors.ForeignKeyViolation, errors.NotNullViolation) as e:
         ## This one is fine to just let it return false
         conn.rollback()
         return_val = 2
@@ -502,8 +1573,84 @@ def qualify_driver_for_model(conn:psycopg2.extensions.connection, name, model_id
         curr.close()
     return return_val
 
+@read_write
+def qualify_drivers_bulk(conn:psycopg2.extensions.connection, pairs, commit=True):
+    """
+    Qualifies drivers for models with a single set-based INSERT and one commit.
+
+    Parameters:
+        conn: The database connection
+        pairs: List of (driver name, model_id) tuples
+        commit: Commit the new qualifications
+
+    Returns:
+        List of (driver, model_id, code) tuples in input order, using the codes of
+        qualify_driver_for_model: 0 = qualified, 1 = already qualified (or
+        repeated in the input), 2 = driver or model does not exist, 3 = unknown error
+    """
+    if not pairs:
+        return []
+    dbQuery = """
+        WITH req AS (
+            SELECT driver, model, ord
+            FROM unnest(%s::text[], %s::text[]) WITH ORDINALITY AS t(driver, model, ord)
+        ),
+        ins AS (
+            INSERT INTO Drives (driver_id, model)
+            SELECT DISTINCT d.driver_id, m.model_id
+            FROM req
+            JOIN Driver d ON d.name = req.driver
+            JOIN Model m ON m.model_id = req.model
+            ON CONFLICT (driver_id, model) DO NOTHING
+            RETURNING driver_id, model
+        )
+        SELECT req.driver, req.model,
+               CASE WHEN d.name IS NULL OR m.model_id IS NULL THEN 2
+                    WHEN ins.driver_id IS NOT NULL
+                         AND req.ord = MIN(req.ord) OVER (PARTITION BY req.driver, req.model) THEN 0
+                    ELSE 1
+               END AS code
+        FROM req
+        LEFT JOIN Driver d ON d.name = req.driver
+        LEFT JOIN Model m ON m.model_id = req.model
+        LEFT JOIN ins ON ins.driver_id = d.driver_id AND ins.model = m.model_id
+        ORDER BY req.ord;
+    """
+    drivers = [driver for driver, _ in pairs]
+    model_ids = [model_id for _, model_id in pairs]
+    curr = conn.cursor()
+    try:
+        curr.execute(dbQuery, (drivers, model_ids))
+        results = curr.fetchall()
+        if commit:
+            conn.commit()
+    except Exception as e:
+        print("Error inserting into db: ", e)
+        conn.rollback()
+        results = [(driver, model_id, 3) for driver, model_id in pairs]
+    finally:
+        curr.close()
+    return results
+
+@read_write
+def qualify_driver_for_models(conn:psycopg2.extensions.connection, name, model_ids):
+    """
+    Qualifies one driver for a list of models in a single statement.
+
+    Parameters:
+        conn: The database connection
+        name: Driver name
+        model_ids: List of model identifiers
+
+    Returns:
+        List of (model_id, code) tuples in input order (codes as in qualify_drivers_bulk)
+    """
+    results = qualify_drivers_bulk(conn, [(name, model_id) for model_id in model_ids])
+    return [(model_id, code) for _, model_id, code in results]
+
 ### Client Options ###
 # For logging in a client
+@read_only
 def get_client(conn: psycopg2.extensions.connection, email):
     """
     Searches the database for a client with a matching email.
@@ -522,7 +1669,61 @@ def get_client(conn: psycopg2.extensions.connection, email):
     curr.close()
     return client
 
+# Everything the client menu shows about a client, from get_client_profile:
+#   addresses: (number, road, city)
+#   cards: (cc_number, number, road, city); the address parts are None if unknown
+#   reviews: (review_id, driver, rating, message)
+ClientProfile = namedtuple("ClientProfile", "email name addresses cards reviews")
+
+@read_only
+def get_client_profile(conn:psycopg2.extensions.connection, email):
+    """
+    Retrieves a client with their addresses, credit cards and reviews in one
+    round trip. Each list is aggregated into a JSON array on the server. Rents
+    change without the client's own writes (the waitlist worker books them),
+    so they are read live with get_client_rents instead.
+
+    Parameters:
+        conn: The database connection
+        email: Client email address
+
+    Returns:
+        A ClientProfile, or None if there is no such client
+    """
+    dbQuery = """
+        SELECT c.email, c.name,
+            (SELECT COALESCE(json_agg(json_build_array(a.number, a.road, a.city)
+                                      ORDER BY a.city, a.road, a.number), '[]')
+             FROM ClientAddresses ca
+             JOIN Address a ON ca.address_id = a.address_id
+             WHERE ca.client_id = c.client_id),
+            (SELECT COALESCE(json_agg(json_build_array(cc.cc_number, a.number, a.road, a.city)
+                                      ORDER BY cc.cc_number), '[]')
+             FROM CreditCard cc
+             LEFT JOIN Address a ON cc.address_id = a.address_id
+             WHERE cc.client_id = c.client_id),
+            (SELECT COALESCE(json_agg(json_build_array(rv.review_id, d.name, rv.rating, rv.message)
+                                      ORDER BY rv.review_id), '[]')
+             FROM Review rv
+             JOIN Driver d ON rv.driver_id = d.driver_id
+             WHERE rv.client_id = c.client_id)
+        FROM Client c
+        WHERE c.email = %s;
+    """
+    curr = conn.cursor()
+    curr.execute(dbQuery, (email,))
+    row = curr.fetchone()
+    curr.close()
+    if row is None:
+        return None
+    email, name, addresses, cards, reviews = row
+    return ClientProfile(email, name,
+                         [tuple(address) for address in addresses],
+                         [tuple(card) for card in cards],
+                         [tuple(review) for review in reviews])
 
+
+@read_write
 def insert_client(conn:psycopg2.extensions.connection, email, name, commit=True):
     """
     Inserts a new client into the database.
@@ -536,12 +1737,7 @@ def insert_client(conn:psycopg2.extensions.connection, email, name, commit=True)
         True if insertion successful, False otherwise
     """
     is_successful = False
-    dbQuery = "INSERT INTO Client (email, name) VALUES (%s, %s)"
-    dbQuery = """INSERT INTO Client (email, name)
-                 VALUES(%s, %s) 
-                 ON CONFLICT (email)
-                 DO NOTHING
-                 RETURNING 1"""
+    dbQuery = INSERT_CLIENT_QUERY
     curr = conn.cursor()
     try:
         curr.execute(dbQuery, (email, name))
@@ -558,27 +1754,24 @@ def insert_client(conn:psycopg2.extensions.connection, email, name, commit=True)
     return is_successful
 
 
-def insert_client_address(conn:psycopg2.extensions.connection, email, number, road, city, commit=True):
+@read_write
+def insert_client_address(conn:psycopg2.extensions.connection, email, address_id, commit=True):
     """
     Associates a client with an address.
 
     Parameters:
         conn: The database connection
         email: Client email
-        address_id: Address identifier
+        address_id: Address identifier (from intern_address)
 
     Returns:
         True if insertion successful, False otherwise
     """
     is_successful = False
-    dbQuery = """INSERT INTO ClientAddresses (client, number, road, city)
-                 VALUES(%s, %s, %s, %s) 
-                 ON CONFLICT (client, number, road, city)
-                 DO NOTHING
-                 RETURNING 1"""
+    dbQuery = INSERT_CLIENT_ADDRESS_QUERY
     curr = conn.cursor()
     try:
-        curr.execute(dbQuery, (email, number, road, city))
+        curr.execute(dbQuery, (email, address_id))
         if commit:
             conn.commit()
         if curr.fetchone() is not None:
@@ -591,7 +1784,8 @@ def insert_client_address(conn:psycopg2.extensions.connection, email, number, ro
     return is_successful
 
 
-def insert_credit_card(conn:psycopg2.extensions.connection, cc_number, email, number, road, city, commit=True):
+@read_write
+def insert_credit_card(conn:psycopg2.extensions.connection, cc_number, email, address_id, commit=True):
     """
     Inserts a new credit card for a client.
 
@@ -599,20 +1793,16 @@ def insert_credit_card(conn:psycopg2.extensions.connection, cc_number, email, nu
         conn: The database connection
         number: Credit card number
         email: Client email
-        payment_address: Address identifier for payment
+        address_id: Address identifier for payment (from intern_address)
 
     Returns:
         True if insertion successful, False otherwise
     """
     is_successful = False
-    dbQuery = """INSERT INTO CreditCard (cc_number, client, addr_number, road, city)
-                 VALUES(%s, %s, %s, %s, %s) 
-                 ON CONFLICT (cc_number)
-                 DO NOTHING
-                 RETURNING 1"""
+    dbQuery = INSERT_CREDIT_CARD_QUERY
     curr = conn.cursor()
     try:
-        curr.execute(dbQuery, (cc_number, email, number, road, city))
+        curr.execute(dbQuery, (cc_number, email, address_id))
         if commit:
             conn.commit()
         if curr.fetchone() is not None:
@@ -625,118 +1815,751 @@ def insert_credit_card(conn:psycopg2.extensions.connection, cc_number, email, nu
     return is_successful
 
 # Find available models for a given date
-def find_available_models(conn:psycopg2.extensions.connection, date):
+@read_only
+def find_available_models(conn:psycopg2.extensions.connection, date, days=1):
     """
-    Retrieves all models available on a specific date.
+    Retrieves all models available for days consecutive days from a date.
     A model is available if:
-      1) It is not rented on that date.
-      2) There exists at least one qualified driver not booked that date.
+      1) It is not rented or held (place_hold) on any of those days.
+      2) There exists at least one qualified driver not booked or held on any of them.
+    Every check is one range overlap test against the GiST index of the
+    exclusion constraints, however many days are asked for.
 
     Parameters:
         conn: The database connection
         date: date to check availability
+        days: Number of days from date
 
     Returns:
         List of tuples: (model_id, car_id, color, transmission, year)
     """
     dbQuery = """
-        SELECT DISTINCT m.model_id, m.car_id, m.color, m.transmission, m.year
-        FROM Model m
-        WHERE m.model_id NOT IN (
-            SELECT r.model FROM Rent r WHERE r.date = %s
+        WITH wanted AS (
+            SELECT daterange(%(date)s::date, %(date)s::date + %(days)s) AS dates
+        )
+        SELECT m.model_id, m.car_id, m.color, m.transmission, m.year
+        FROM Model m, wanted w
+        WHERE NOT EXISTS (
+            SELECT 1 FROM Rent r
+            WHERE r.model = m.model_id AND r.dates && w.dates
+        )
+        AND NOT EXISTS (
+            SELECT 1 FROM RentHold h
+            WHERE h.model = m.model_id AND h.dates && w.dates AND h.expires_at > now()
         )
         AND EXISTS (
             SELECT 1 FROM Drives d
-            LEFT JOIN Rent r2 ON d.driver = r2.driver AND r2.date = %s
-            WHERE d.model = m.model_id AND r2.rent_id IS NULL
+            WHERE d.model = m.model_id
+              AND NOT EXISTS (SELECT 1 FROM Rent r2
+                              WHERE r2.driver_id = d.driver_id AND r2.dates && w.dates)
+              AND NOT EXISTS (SELECT 1 FROM RentHold h2
+                              WHERE h2.driver_id = d.driver_id AND h2.dates && w.dates
+                                AND h2.expires_at > now())
         )
         ORDER BY m.model_id;
     """
     curr = conn.cursor()
-    curr.execute(dbQuery, (date, date))
+    curr.execute(dbQuery, {"date": date, "days": days})
     models = curr.fetchall()
     curr.close()
     return models
 
+# Find free driver counts for every model over a range of dates
+@read_only
+def find_available_models_range(conn:psycopg2.extensions.connection, start_date, end_date):
+    """
+    Retrieves, for every model and every date between start_date and end_date
+    (inclusive), the number of qualified drivers that are not booked that day.
+    Uses a single query over the whole range instead of one search per date.
+    A model that is already rented on a date has 0 free drivers on that date.
+    Active holds (place_hold) count as rents, and multi-day rents and holds
+    count on every day they cover.
+
+    Parameters:
+        conn: The database connection
+        start_date: First date of the range
+        end_date: Last date of the range
+
+    Returns:
+        List of tuples: (model_id, date, free_drivers), ordered by model then date
+    """
+    dbQuery = """
+        WITH days AS (
+            SELECT generate_series(%(start)s::date, %(end)s::date, interval '1 day')::date AS day
+        ),
+        booked AS (
+            SELECT b.model, b.driver_id, dy.day AS date
+            FROM (SELECT r.model, r.driver_id, r.dates
+                  FROM Rent r
+                  WHERE r.dates && daterange(%(start)s, %(end)s, '[]')
+                  UNION ALL
+                  SELECT h.model, h.driver_id, h.dates
+                  FROM RentHold h
+                  WHERE h.dates && daterange(%(start)s, %(end)s, '[]') AND h.expires_at > now()) b
+            JOIN days dy ON b.dates @> dy.day
+        ),
+        taken_models AS (
+            SELECT DISTINCT model, date FROM booked
+        ),
+        busy_drivers AS (
+            SELECT DISTINCT driver_id, date FROM booked
+        )
+        SELECT m.model_id, dy.day,
+               CASE WHEN t.model IS NOT NULL THEN 0
+                    ELSE COUNT(d.driver_id) FILTER (WHERE b.driver_id IS NULL)
+               END AS free_drivers
+        FROM Model m
+        CROSS JOIN days dy
+        LEFT JOIN taken_models t ON t.model = m.model_id AND t.date = dy.day
+        LEFT JOIN Drives d ON d.model = m.model_id
+        LEFT JOIN busy_drivers b ON b.driver_id = d.driver_id AND b.date = dy.day
+        GROUP BY m.model_id, dy.day, t.model
+        ORDER BY m.model_id, dy.day;
+    """
+    curr = conn.cursor()
+    curr.execute(dbQuery, {"start": start_date, "end": end_date})
+    rows = curr.fetchall()
+    curr.close()
+    return rows
+
+@read_only
+def get_availability_matrix(conn:psycopg2.extensions.connection, start_date, end_date):
+    """
+    Builds a model x date availability matrix from find_available_models_range.
+
+    Parameters:
+        conn: The database connection
+        start_date: First date of the range
+        end_date: Last date of the range
+
+    Returns:
+        Tuple (dates, matrix): dates is the list of dates in the range, and
+        matrix is a list of tuples (model_id, [free_drivers for each date])
+    """
+    rows = find_available_models_range(conn, start_date, end_date)
+    dates = []
+    matrix = []
+    for model_id, day, free_drivers in rows:
+        if not matrix or matrix[-1][0] != model_id:
+            matrix.append((model_id, []))
+        # Every model has one row per date, so the first model gives the date list
+        if len(matrix) == 1:
+            dates.append(day)
+        matrix[-1][1].append(free_drivers)
+    return dates, matrix
+
+# Driver assignment strategies used by book_rent.
+# Each entry maps a strategy name to (extra joins, ORDER BY clause) that are added
+# to the free-driver query, where Drives is aliased d and Driver drv. Rankings read
+# the DriverLoad and DriverRating tables, which are maintained by triggers, so
+# picking a driver stays a primary key lookup per candidate. Queries use named
+# parameters: %(date)s, %(model)s and %(client_id)s.
+DRIVER_ASSIGNMENT_STRATEGIES = {
+    # Whichever qualified free driver the database returns first
+    "first": ("", ""),
+    # Driver with the fewest rents in the month of the booking
+    "least_booked": (
+        """LEFT JOIN DriverLoad dl ON dl.driver_id = d.driver_id
+               AND dl.period = date_trunc('month', %(date)s::date)::date""",
+        "ORDER BY COALESCE(dl.rent_count, 0), drv.name"),
+    # Driver with the best average rating (unrated drivers last)
+    "highest_rated": (
+        "LEFT JOIN DriverRating dr ON dr.driver_id = d.driver_id",
+        """ORDER BY COALESCE(dr.rating_total::numeric / NULLIF(dr.review_count, 0), -1) DESC,
+                    drv.name"""),
+    # Driver living in one of the client's cities, least booked first
+    "same_city": (
+        """LEFT JOIN Address drv_addr ON drv_addr.address_id = drv.address_id
+           LEFT JOIN DriverLoad dl ON dl.driver_id = d.driver_id
+               AND dl.period = date_trunc('month', %(date)s::date)::date""",
+        """ORDER BY EXISTS (SELECT 1 FROM ClientAddresses ca
+                            JOIN Address ca_addr ON ca_addr.address_id = ca.address_id
+                            WHERE ca.client_id = %(client_id)s AND ca_addr.city = drv_addr.city) DESC,
+                    COALESCE(dl.rent_count, 0), drv.name"""),
+}
+DEFAULT_ASSIGNMENT_STRATEGY = "least_booked"
+
+def _free_driver_query(strategy):
+    """
+    Builds the query that picks a free driver for %(model)s for %(days)s days
+    from %(date)s with an assignment strategy. A driver is free if no rent or
+    active hold of theirs overlaps those days.
+    """
+    if strategy not in DRIVER_ASSIGNMENT_STRATEGIES:
+        raise ValueError(f"Unknown driver assignment strategy: {strategy}")
+    strategy_join, strategy_order = DRIVER_ASSIGNMENT_STRATEGIES[strategy]
+    return f"""
+        SELECT d.driver_id, drv.name
+        FROM Drives d
+        JOIN Driver drv ON drv.driver_id = d.driver_id
+        {strategy_join}
+        WHERE d.model = %(model)s
+          AND NOT EXISTS (SELECT 1 FROM Rent r
+                          WHERE r.driver_id = d.driver_id
+                            AND r.dates && daterange(%(date)s::date, %(date)s::date + %(days)s))
+          AND NOT EXISTS (SELECT 1 FROM RentHold h
+                          WHERE h.driver_id = d.driver_id
+                            AND h.dates && daterange(%(date)s::date, %(date)s::date + %(days)s)
+                            AND h.expires_at > now())
+        {strategy_order}
+        LIMIT 1;
+        """
+
+# Longest rent, in days (the rent_days_check constraint in create_tables.sql)
+MAX_RENT_DAYS = 30
+
+# Status codes returned by book_rent_status
+BOOK_OK = 0
+BOOK_CLIENT_BUSY = 1    # client already has a rent on one of the days
+BOOK_NO_DRIVER = 2      # no qualified driver is free on all of the days
+BOOK_ID_TAKEN = 3       # rent_id is already in use
+BOOK_DB_ERROR = 4       # any other database error
+BOOK_MODEL_TAKEN = 5    # the model is rented, or held by another client, on one of the days
+
+# Status names for reports and machine-readable output
+BOOK_STATUS_NAMES = {
+    BOOK_OK: "ok",
+    BOOK_CLIENT_BUSY: "client_busy",
+    BOOK_NO_DRIVER: "no_driver",
+    BOOK_ID_TAKEN: "id_taken",
+    BOOK_DB_ERROR: "db_error",
+    BOOK_MODEL_TAKEN: "model_taken",
+}
+
+# Messages shown to the user when a booking is turned down ({rent_id} is filled in)
+BOOK_FAILURE_MESSAGES = {
+    BOOK_CLIENT_BUSY: "Client has already booked a rent on this date",
+    BOOK_NO_DRIVER: "No available driver for model on this date.",
+    BOOK_ID_TAKEN: "Failed to book rent: rent ID {rent_id} is already in use.",
+    BOOK_DB_ERROR: "Failed to book rent: database error, please try again.",
+    BOOK_MODEL_TAKEN: "Model is already rented on this date.",
+}
+
+# Drivers tried when other bookings take the chosen driver first
+BOOK_RETRIES = 3
+
 # Book a rent, auto-assigning an available driver
-def book_rent(conn:psycopg2.extensions.connection, rent_id, date, client, model_id):
+@read_write
+def book_rent_status(conn:psycopg2.extensions.connection, rent_id, date, client, model_id,
+                     strategy=DEFAULT_ASSIGNMENT_STRATEGY, commit=True, days=1):
+    """
+    Books a new rent for a client and model for days consecutive days from a
+    date without printing anything, reporting why the booking failed.
+    If the client holds the model for those days (place_hold), the held driver
+    is booked and the hold is consumed. Otherwise an available driver
+    qualified for the model is assigned, chosen by the given assignment
+    strategy; drivers held by other clients are not available.
+    The checks are range overlap tests, so a multi-day rent costs the same as
+    a one-day rent. The exclusion constraints on Rent settle races between
+    concurrent bookings: a booking that loses its driver tries the next one.
+
+    Parameters:
+        conn: The database connection
+        rent_id: New rent identifier
+        date: Rent date (first day)
+        client: Client email
+        model_id: Model identifier
+        strategy: Name of an entry in DRIVER_ASSIGNMENT_STRATEGIES
+        commit: Commit the new rent. With commit=False, a booking that is
+            turned down leaves the open transaction alone, but a database
+            error or a taken rent ID still rolls it back.
+        days: Number of days, from 1 to MAX_RENT_DAYS
+
+    Returns:
+        Tuple (status, driver): status is one of the BOOK_* codes, and driver
+        is the assigned driver name when the booking succeeded (None otherwise)
+    """
+    # Find an available driver for the model on those days
+    driver_query = _free_driver_query(strategy)
+
+    # Look up the client, and check that neither the client nor the model
+    # (including other clients' holds on it) is booked on those days
+    client_query = """
+        SELECT c.client_id,
+               EXISTS (SELECT 1 FROM Rent r
+                       WHERE r.client_id = c.client_id
+                         AND r.dates && daterange(%(date)s::date, %(date)s::date + %(days)s)),
+               EXISTS (SELECT 1 FROM Rent r
+                       WHERE r.model = %(model)s
+                         AND r.dates && daterange(%(date)s::date, %(date)s::date + %(days)s))
+               OR EXISTS (SELECT 1 FROM RentHold h
+                          WHERE h.model = %(model)s AND h.client_id <> c.client_id
+                            AND h.dates && daterange(%(date)s::date, %(date)s::date + %(days)s)
+                            AND h.expires_at > now())
+        FROM Client c
+        WHERE c.email = %(client)s
+        """
+    # Consume the client's holds on the model on those days. The held driver
+    # is used if the hold is active and covers every day.
+    hold_query = """
+        WITH held AS (
+            DELETE FROM RentHold
+            WHERE client_id = %(client_id)s AND model = %(model)s
+              AND dates && daterange(%(date)s::date, %(date)s::date + %(days)s)
+            RETURNING driver_id, dates, expires_at
+        )
+        SELECT held.driver_id, drv.name
+        FROM held
+        JOIN Driver drv ON drv.driver_id = held.driver_id
+        WHERE held.expires_at > now()
+          AND held.dates @> daterange(%(date)s::date, %(date)s::date + %(days)s);
+        """
+    # A conflict on the rent ID or an exclusion constraint inserts nothing
+    insert_query = """
+        INSERT INTO Rent (rent_id, date, days, client_id, driver_id, model)
+        VALUES (%(rent_id)s, %(date)s, %(days)s, %(client_id)s, %(driver_id)s, %(model)s)
+        ON CONFLICT DO NOTHING;
+        """
+    conflict_query = """
+        SELECT EXISTS (SELECT 1 FROM Rent WHERE rent_id = %(rent_id)s),
+               EXISTS (SELECT 1 FROM Rent
+                       WHERE model = %(model)s
+                         AND dates && daterange(%(date)s::date, %(date)s::date + %(days)s));
+        """
+
+    params = {"rent_id": rent_id, "date": date, "days": days, "client": client, "model": model_id}
+    curr = conn.cursor()
+    try:
+        curr.execute(client_query, params)
+        row = curr.fetchone()
+        if not row:
+            if commit:
+                conn.rollback()
+            return BOOK_DB_ERROR, None
+        client_id, client_busy, model_taken = row
+        if client_busy or model_taken:
+            if commit:
+                conn.rollback()
+            return (BOOK_CLIENT_BUSY if client_busy else BOOK_MODEL_TAKEN), None
+
+        params["client_id"] = client_id
+        curr.execute(hold_query, params)
+        row = curr.fetchone()
+        for _ in range(BOOK_RETRIES):
+            if not row:
+                curr.execute(driver_query, params)
+                row = curr.fetchone()
+            if not row:
+                break
+            driver_id, driver = row
+
+            # Insert the new rent
+            curr.execute(insert_query, dict(params, driver_id=driver_id))
+            if curr.rowcount == 1:
+                if commit:
+                    conn.commit()
+                return BOOK_OK, driver
+
+            # Another booking got there first; find out what it took
+            curr.execute(conflict_query, params)
+            id_taken, model_taken = curr.fetchone()
+            if id_taken:
+                conn.rollback()
+                return BOOK_ID_TAKEN, None
+            if model_taken:
+                if commit:
+                    conn.rollback()
+                return BOOK_MODEL_TAKEN, None
+            row = None
+        if commit:
+            conn.rollback()
+        return BOOK_NO_DRIVER, None
+    except Exception:
+        conn.rollback()
+        return BOOK_DB_ERROR, None
+    finally:
+        curr.close()
+
+@read_write
+def book_rent(conn:psycopg2.extensions.connection, rent_id, date, client, model_id,
+              strategy=DEFAULT_ASSIGNMENT_STRATEGY, days=1):
     """
-    Books a new rent for a client and model on a given date.
-    Automatically assigns the first available driver qualified for the model.
+    Books a new rent for a client and model for days consecutive days from a date.
+    Prints a message explaining the failure if the rent could not be booked.
 
     Parameters:
         conn: The database connection
         rent_id: New rent identifier
-        date: Rent date
+        date: Rent date (first day)
         client: Client email
         model_id: Model identifier
+        strategy: Name of an entry in DRIVER_ASSIGNMENT_STRATEGIES
+        days: Number of days, from 1 to MAX_RENT_DAYS
 
     Returns:
         True if booking successful, False otherwise
     """
+    status, driver = book_rent_status(conn, rent_id, date, client, model_id, strategy, days=days)
+    if status != BOOK_OK:
+        print("\n" + BOOK_FAILURE_MESSAGES[status].format(rent_id=rent_id))
+    return status == BOOK_OK
+
+### Reservation holds ###
+# A hold reserves a model and a free driver for a client for a range of days
+# for HOLD_TTL seconds, so the booking that follows a search does not lose the
+# driver to another client. Searches and other clients' bookings treat active
+# holds like rents; book_rent_status consumes the client's hold.
+
+HOLD_TTL = 300
+HOLD_RETRIES = 3
+HOLD_REAP_BATCH_SIZE = 5000
+
+Hold = namedtuple("Hold", ["hold_id", "model_id", "date", "driver", "expires_at", "days"])
+
+@read_write
+def place_hold(conn:psycopg2.extensions.connection, client, date, model_id,
+               strategy=DEFAULT_ASSIGNMENT_STRATEGY, ttl=HOLD_TTL, days=1):
+    """
+    Holds a model and a free driver for a client for days consecutive days
+    from a date. The driver is chosen with the assignment strategy, as for a
+    booking. A client holds at most one model on any day, so this replaces the
+    client's previous holds that overlap those days.
+
+    Parameters:
+        conn: The database connection
+        client: Client email
+        date: Rent date (first day)
+        model_id: Model identifier
+        strategy: Name of an entry in DRIVER_ASSIGNMENT_STRATEGIES
+        ttl: Seconds until the hold expires
+        days: Number of days, from 1 to MAX_RENT_DAYS
+
+    Returns:
+        Tuple (status, hold): status is BOOK_OK, BOOK_CLIENT_BUSY (the client
+        has a rent on one of the days), BOOK_MODEL_TAKEN, BOOK_NO_DRIVER or
+        BOOK_DB_ERROR, and hold is a Hold when the status is BOOK_OK (None
+        otherwise)
+    """
+    driver_query = _free_driver_query(strategy)
+    client_query = """
+        SELECT c.client_id,
+               EXISTS (SELECT 1 FROM Rent r
+                       WHERE r.client_id = c.client_id
+                         AND r.dates && daterange(%(date)s::date, %(date)s::date + %(days)s)),
+               EXISTS (SELECT 1 FROM Rent r
+                       WHERE r.model = %(model)s
+                         AND r.dates && daterange(%(date)s::date, %(date)s::date + %(days)s))
+        FROM Client c
+        WHERE c.email = %(client)s
+        """
+    # Clear the client's old holds and any expired hold on those days, which
+    # would otherwise still count against the exclusion constraints
+    clear_query = """
+        DELETE FROM RentHold
+        WHERE dates && daterange(%(date)s::date, %(date)s::date + %(days)s)
+          AND (client_id = %(client_id)s OR expires_at <= now());
+        """
+    # Another client can take the same driver or model in the meantime; the
+    # exclusion constraints turn that into zero rows
+    insert_query = """
+        INSERT INTO RentHold (client_id, model, driver_id, date, days, expires_at)
+        VALUES (%(client_id)s, %(model)s, %(driver_id)s, %(date)s, %(days)s,
+                now() + make_interval(secs => %(ttl)s))
+        ON CONFLICT DO NOTHING
+        RETURNING hold_id, expires_at;
+        """
+    model_query = """
+        SELECT EXISTS (SELECT 1 FROM RentHold
+                       WHERE model = %(model)s
+                         AND dates && daterange(%(date)s::date, %(date)s::date + %(days)s));
+        """
+    params = {"date": date, "days": days, "model": model_id, "client": client, "ttl": ttl}
     curr = conn.cursor()
+    try:
+        curr.execute(client_query, params)
+        row = curr.fetchone()
+        if not row:
+            conn.rollback()
+            return BOOK_DB_ERROR, None
+        client_id, client_busy, model_taken = row
+        if client_busy or model_taken:
+            conn.rollback()
+            return (BOOK_CLIENT_BUSY if client_busy else BOOK_MODEL_TAKEN), None
+
+        params["client_id"] = client_id
+        curr.execute(clear_query, params)
+        for _ in range(HOLD_RETRIES):
+            curr.execute(driver_query, params)
+            row = curr.fetchone()
+            if not row:
+                conn.rollback()
+                return BOOK_NO_DRIVER, None
+            driver_id, driver = row
+            curr.execute(insert_query, dict(params, driver_id=driver_id))
+            held = curr.fetchone()
+            if held:
+                conn.commit()
+                hold_id, expires_at = held
+                return BOOK_OK, Hold(hold_id, model_id, date, driver, expires_at, days)
+            curr.execute(model_query, params)
+            if curr.fetchone()[0]:
+                conn.rollback()
+                return BOOK_MODEL_TAKEN, None
+        conn.rollback()
+        return BOOK_NO_DRIVER, None
+    except Exception:
+        conn.rollback()
+        return BOOK_DB_ERROR, None
+    finally:
+        curr.close()
+
+@read_write
+def release_hold(conn:psycopg2.extensions.connection, client, date):
+    """
+    Releases a client's hold covering a date.
+
+    Parameters:
+        conn: The database connection
+        client: Client email
+        date: A date the hold covers
 
-    # New: Check if client has already booked a rent on that day
+    Returns:
+        True if a hold was released
+    """
+    dbQuery = """
+        DELETE FROM RentHold h
+        USING Client c
+        WHERE h.client_id = c.client_id AND c.email = %s AND h.dates @> %s::date;
+    """
+    curr = conn.cursor()
     try:
-    # Find an available driver for the model on that date
-        client_query = """
-            SELECT *
-            FROM Rent
-            WHERE client = %s AND date = %s
-            """
-        curr.execute(client_query, (client, date))
+        curr.execute(dbQuery, (client, date))
+        released = curr.rowcount > 0
+        conn.commit()
+        return released
     except Exception as e:
-        # If any exception occurs, print a message and return False
-        print(f"\nTry again", e)
-        curr.close()
+        print("Failed to release the hold:", e)
         conn.rollback()
         return False
-    row = curr.fetchone()
-    if row:
-        print("\nClient has already booked a rent on this date")
+    finally:
         curr.close()
-        return False
-    
+
+@read_primary
+def get_holds(conn:psycopg2.extensions.connection, client):
+    """
+    Retrieves a client's active holds.
+
+    Parameters:
+        conn: The database connection
+        client: Client email
+
+    Returns:
+        List of Hold, by date
+    """
+    dbQuery = """
+        SELECT h.hold_id, h.model, h.date, drv.name, h.expires_at, h.days
+        FROM RentHold h
+        JOIN Client c ON c.client_id = h.client_id
+        JOIN Driver drv ON drv.driver_id = h.driver_id
+        WHERE c.email = %s AND h.expires_at > now()
+        ORDER BY h.date;
+    """
+    curr = conn.cursor()
+    curr.execute(dbQuery, (client,))
+    holds = [Hold(*row) for row in curr.fetchall()]
+    curr.close()
+    return holds
+
+@read_write
+def reap_expired_holds(conn:psycopg2.extensions.connection, batch_size=HOLD_REAP_BATCH_SIZE):
+    """
+    Deletes expired holds in batches that each commit on their own.
+
+    Parameters:
+        conn: The database connection
+        batch_size: Maximum number of holds deleted per transaction
+
+    Returns:
+        Number of holds deleted, or None if the job failed
+    """
+    dbQuery = """
+        DELETE FROM RentHold
+        WHERE hold_id = ANY(ARRAY(SELECT hold_id FROM RentHold
+                                  WHERE expires_at <= now()
+                                  LIMIT %s));
+    """
+    total = 0
+    curr = conn.cursor()
     try:
-    # Find an available driver for the model on that date
-        driver_query = """
-            SELECT d.driver 
-            FROM Drives d LEFT JOIN Rent r ON d.driver = r.driver AND r.date = %s
-            WHERE d.model = %s AND r.rent_id IS NULL
-            LIMIT 1;
-            """
-        curr.execute(driver_query, (date, model_id))
+        while True:
+            curr.execute(dbQuery, (batch_size,))
+            batch = curr.rowcount
+            conn.commit()
+            total += batch
+            if batch < batch_size:
+                return total
     except Exception as e:
-        # If any exception occurs, print a message and return False
-        print(f"\nTry again", e)
-        curr.close()
+        print("Failed to reap expired holds:", e)
         conn.rollback()
-        return False
-    row = curr.fetchone()
-    if not row:
-        print("\nNo available driver for model on this date.")
+        return None
+    finally:
         curr.close()
-        return False
-    driver = row[0]
 
+### Waitlist ###
+# A booking turned down with BOOK_NO_DRIVER or BOOK_MODEL_TAKEN can be put on
+# the waitlist.
+# match_waitlist (run by waitlist_worker.py) claims the oldest requests with
+# FOR UPDATE SKIP LOCKED, so several workers can drain the list side by side,
+# and books the ones that a driver has become free for. Triggers send a NOTIFY
+# on WAITLIST_CHANNEL, with the model as payload, when capacity appears.
+
+WAITLIST_CHANNEL = "waitlist"
+WAITLIST_BATCH_SIZE = 50
+
+@read_write
+def join_waitlist(conn:psycopg2.extensions.connection, client, date, model_id,
+                  strategy=DEFAULT_ASSIGNMENT_STRATEGY, days=1):
+    """
+    Puts a booking request on the waitlist.
 
+    Parameters:
+        conn: The database connection
+        client: Client email
+        date: Rent date (first day)
+        model_id: Model identifier
+        strategy: Driver assignment strategy used when the request is booked
+        days: Number of days, from 1 to MAX_RENT_DAYS
 
-    # Insert the new rent
-    insert_query = "INSERT INTO Rent (rent_id, date, client, driver, model) VALUES (%s, %s, %s, %s, %s)"
+    Returns:
+        True if the request was added, False if it was already waiting or failed
+    """
+    dbQuery = """
+        INSERT INTO Waitlist (client_id, model, date, days, strategy)
+        SELECT client_id, %s, %s, %s, %s FROM Client WHERE email = %s
+        ON CONFLICT (client_id, model, date) DO NOTHING;
+    """
+    curr = conn.cursor()
     try:
-        curr.execute(insert_query, (rent_id, date, client, driver, model_id))
+        curr.execute(dbQuery, (model_id, date, days, strategy, client))
+        added = curr.rowcount == 1
         conn.commit()
+        return added
     except Exception as e:
-        print("\nFailed to book rent: ", e)
+        print("Failed to join the waitlist:", e)
         conn.rollback()
-        curr.close()
         return False
+    finally:
+        curr.close()
+
+@read_only
+def get_waitlist(conn:psycopg2.extensions.connection, client):
+    """
+    Retrieves a client's waiting booking requests.
+
+    Parameters:
+        conn: The database connection
+        client: Client email
 
+    Returns:
+        List of tuples: (date, model_id, requested_at, attempts, days), by date
+    """
+    dbQuery = """
+        SELECT w.date, w.model, w.requested_at, w.attempts, w.days
+        FROM Waitlist w
+        JOIN Client c ON w.client_id = c.client_id
+        WHERE c.email = %s
+        ORDER BY w.date, w.requested_at;
+    """
+    curr = conn.cursor()
+    curr.execute(dbQuery, (client,))
+    requests = curr.fetchall()
     curr.close()
-    return True
+    return requests
+
+@read_write
+def match_waitlist(conn:psycopg2.extensions.connection, model_ids=None, batch_size=WAITLIST_BATCH_SIZE):
+    """
+    Claims up to batch_size of the oldest waiting requests that a driver is
+    free for, and books them in one transaction. Requests for past dates are
+    dropped first. A request is removed once booked, or when the client has
+    booked another rent on one of its days; otherwise (no driver, or the model
+    is taken) it keeps waiting.
+    Requests locked by another worker are skipped. If a booking hits a
+    database error, the whole batch is rolled back and stays on the list.
+
+    Parameters:
+        conn: The database connection
+        model_ids: Only match requests for these models (None for all)
+        batch_size: Maximum number of requests claimed
+
+    Returns:
+        List of tuples (email, date, model_id, status, rent_id, driver), one per
+        request processed, with status one of the BOOK_* codes. When the last
+        status is BOOK_ID_TAKEN or BOOK_DB_ERROR, nothing was committed.
+    """
+    expire_query = "DELETE FROM Waitlist WHERE date < CURRENT_DATE;"
+    claim_query = """
+        SELECT w.request_id, c.email, w.date, w.model, w.strategy, w.days
+        FROM Waitlist w
+        JOIN Client c ON w.client_id = c.client_id
+        WHERE (%(models)s::text[] IS NULL OR w.model = ANY(%(models)s::text[]))
+          -- Only requests the model and a driver are free for right now, so
+          -- requests that keep waiting do not crowd newer ones out of the batch
+          AND EXISTS (SELECT 1 FROM Drives d
+                      WHERE d.model = w.model
+                        AND NOT EXISTS (SELECT 1 FROM Rent r
+                                        WHERE r.driver_id = d.driver_id AND r.dates && w.dates)
+                        AND NOT EXISTS (SELECT 1 FROM RentHold h
+                                        WHERE h.driver_id = d.driver_id AND h.dates && w.dates
+                                          AND h.expires_at > now()))
+          AND NOT EXISTS (SELECT 1 FROM Rent r WHERE r.model = w.model AND r.dates && w.dates)
+        ORDER BY w.requested_at
+        LIMIT %(limit)s
+        FOR UPDATE OF w SKIP LOCKED;
+    """
+    done_query = "DELETE FROM Waitlist WHERE request_id = ANY(%s);"
+    retry_query = "UPDATE Waitlist SET attempts = attempts + 1 WHERE request_id = ANY(%s);"
+
+    models = list(model_ids) if model_ids is not None else None
+    curr = conn.cursor()
+    try:
+        curr.execute(expire_query)
+        curr.execute(claim_query, {"models": models, "limit": batch_size})
+        claimed = curr.fetchall()
+        results = []
+        done, waiting = [], []
+        for request_id, email, date, model_id, strategy, days in claimed:
+            rent_id = next_rent_id(conn)
+            status, driver = book_rent_status(conn, rent_id, date, email, model_id, strategy,
+                                              commit=False, days=days)
+            if status in (BOOK_ID_TAKEN, BOOK_DB_ERROR):
+                # Give up on the batch and release every claim
+                conn.rollback()
+                return results + [(email, date, model_id, status, None, None)]
+            results.append((email, date, model_id, status, rent_id if status == BOOK_OK else None, driver))
+            (waiting if status in (BOOK_NO_DRIVER, BOOK_MODEL_TAKEN) else done).append(request_id)
+        curr.execute(done_query, (done,))
+        curr.execute(retry_query, (waiting,))
+        conn.commit()
+        return results
+    except Exception as e:
+        print("Failed to match the waitlist:", e)
+        conn.rollback()
+        return []
+    finally:
+        curr.close()
 
 
 # Get latesst rent and review ID's
+@read_primary
+def next_rent_id(conn:psycopg2.extensions.connection):
+    """
+    Allocates a new rent id from the rent_id_seq sequence. Unlike incrementing
+    get_latest_rent_id, concurrent sessions never get the same id.
+
+    Parameters:
+        conn: The database connection
+
+    Returns:
+        The new rent id
+    """
+    curr = conn.cursor()
+    curr.execute("SELECT next_rent_id();")
+    rent_id = curr.fetchone()[0]
+    curr.close()
+    return rent_id
+
+@read_primary
 def get_latest_rent_id(conn:psycopg2.extensions.connection):
     """
     Retrieves the latest rent id
@@ -762,6 +2585,7 @@ def get_latest_rent_id(conn:psycopg2.extensions.connection):
     else:
         return rent_id[0]
     
+@read_primary
 def get_latest_review_id(conn:psycopg2.extensions.connection):
     """
     Retrieves the latest review id
@@ -788,6 +2612,7 @@ def get_latest_review_id(conn:psycopg2.extensions.connection):
         return rent_id[0]
 
 # Get a client's rent history
+@read_only
 def get_client_rents(conn:psycopg2.extensions.connection, client):
     """
     Retrieves all rents booked by a given client.
@@ -797,13 +2622,15 @@ def get_client_rents(conn:psycopg2.extensions.connection, client):
         client: Client email
 
     Returns:
-        List of tuples: (rent_id, date, model_id, car_id, color, transmission, year, driver)
+        List of tuples: (rent_id, date, model_id, car_id, color, transmission, year, driver, days)
     """
     dbQuery = """
-        SELECT r.rent_id, r.date, m.model_id, m.car_id, m.color, m.transmission, m.year, r.driver
+        SELECT r.rent_id, r.date, m.model_id, m.car_id, m.color, m.transmission, m.year, d.name, r.days
         FROM Rent r
         JOIN Model m ON r.model = m.model_id
-        WHERE r.client = %s
+        JOIN Driver d ON r.driver_id = d.driver_id
+        JOIN Client c ON r.client_id = c.client_id
+        WHERE c.email = %s
         ORDER BY r.date;
     """
     curr = conn.cursor()
@@ -813,6 +2640,8 @@ def get_client_rents(conn:psycopg2.extensions.connection, client):
     return rents
 
  # New: Checks if client has reviewed a driver so our app can be consistent with ER-diagram (review can have 1 client/driver combination)
+# Read from the primary: it is the only guard against a second review, so a lagging replica must not answer it
+@read_primary
 def has_reviewed(conn:psycopg2.extensions.connection, client, driver):
     """
     Checks if client has reviewed a driver
@@ -825,7 +2654,11 @@ def has_reviewed(conn:psycopg2.extensions.connection, client, driver):
     Returns:
         True if client has driver, False otherwise """
 
-    dbQuery = "SELECT 1 FROM Review WHERE client = %s AND driver = %s"
+    dbQuery = """SELECT 1
+                 FROM Review rv
+                 JOIN Client c ON rv.client_id = c.client_id
+                 JOIN Driver d ON rv.driver_id = d.driver_id
+                 WHERE c.email = %s AND d.name = %s"""
     
     with conn.cursor() as curr:
         try:
@@ -840,6 +2673,7 @@ def has_reviewed(conn:psycopg2.extensions.connection, client, driver):
             conn.rollback()
 
  # New: Checks if client has reviewed a driver so our app can be consistent with ER-diagram (review can have 1 client/driver combination)
+@read_write
 def update_review(conn:psycopg2.extensions.connection, client, driver, message, rating):
     """
     Updates a client's review for a driver
@@ -852,21 +2686,25 @@ def update_review(conn:psycopg2.extensions.connection, client, driver, message,
     Returns:
         True if client update was successful, False otherwise """
 
-    review_id_query = "SELECT review_id FROM Review WHERE client = %s AND driver = %s"
+    review_id_query = """SELECT rv.review_id, rv.driver_id
+                 FROM Review rv
+                 JOIN Client c ON rv.client_id = c.client_id
+                 JOIN Driver d ON rv.driver_id = d.driver_id
+                 WHERE c.email = %s AND d.name = %s"""
     update_query = """
                 UPDATE Review 
                 SET message = %s, rating = %s
-                WHERE review_id = %s AND driver = %s
+                WHERE review_id = %s AND driver_id = %s
                 RETURNING *"""
     with conn.cursor() as curr:
         try:
             curr.execute(review_id_query, (client, driver))
-            review_id = curr.fetchone()[0]
+            review_id, driver_id = curr.fetchone()
             # shouldn't ever be none, but just in case
             if review_id is None:
                 print("Could not update review, no review was found")
                 return False
-            curr.execute(update_query, (message, rating, review_id, driver))
+            curr.execute(update_query, (message, rating, review_id, driver_id))
             if curr.fetchone():
                 conn.commit()
                 return True
@@ -881,6 +2719,7 @@ def update_review(conn:psycopg2.extensions.connection, client, driver, message,
 
 
 # Insert a review if client has rented from that driver
+@read_write
 def insert_review(conn:psycopg2.extensions.connection, review_id, client, driver, message, rating):
     """
     Inserts a review for a driver by a client, only if the client has a prior rent with that driver.
@@ -898,16 +2737,23 @@ def insert_review(conn:psycopg2.extensions.connection, review_id, client, driver
     """
     curr = conn.cursor()
     # Verify the client-driver rent relationship
-    check_query = "SELECT 1 FROM Rent WHERE client = %s AND driver = %s LIMIT 1"
+    check_query = """SELECT r.client_id, r.driver_id
+                     FROM Rent r
+                     JOIN Client c ON r.client_id = c.client_id
+                     JOIN Driver d ON r.driver_id = d.driver_id
+                     WHERE c.email = %s AND d.name = %s
+                     LIMIT 1"""
     curr.execute(check_query, (client, driver))
-    if not curr.fetchone():
+    row = curr.fetchone()
+    if not row:
         print("\nCannot review: no rent found between client and driver.")
         curr.close()
         return False
+    client_id, driver_id = row
 
-    insert_query = "INSERT INTO Review (review_id, driver, client, message, rating) VALUES (%s, %s, %s, %s, %s)"
+    insert_query = "INSERT INTO Review (review_id, driver_id, client_id, message, rating) VALUES (%s, %s, %s, %s, %s)"
     try:
-        curr.execute(insert_query, (review_id, driver, client, message, rating))
+        curr.execute(insert_query, (review_id, driver_id, client_id, message, rating))
         conn.commit()
     except Exception as e:
         print("\nFailed to add review: ", e)
@@ -0,0 +1,131 @@
+## Reads the database connection settings shared by the app and the command-line tools
+
+import re
+import select
+import psycopg2
+import psycopg2.extensions
+import routing
+
+DB_INFO_FILE = "dbinfo.txt"
+
+
+def _read_lines(path):
+    """Returns the non-comment, non-blank lines of a db info file"""
+    with open(path) as input_file:
+        input_text = input_file.read()
+
+    # Process file text and remove comments and blank lines
+    input_text = re.sub(r"#.*", "", input_text)
+    input_text = re.sub(r"\n\s*\n", "\n", input_text)
+    input_text = re.sub(r"^\n", "", input_text)
+    input_text = re.sub(r"\n*$", "", input_text)
+    return [line.strip() for line in input_text.split('\n')]
+
+
+def read_db_info(path=DB_INFO_FILE):
+    """
+    Reads the primary database info from a file in the format of dbinfo_example.txt.
+
+    Parameters:
+        path: Path to the db info file
+
+    Returns:
+        Dict of psycopg2.connect keyword arguments
+        (database, host, user, password, port)
+    """
+    # Assign connection parameters
+    db, host, user, pw, port = _read_lines(path)[:5]
+    return {"database": db, "host": host, "user": user, "password": pw, "port": port}
+
+
+def read_replica_info(path=DB_INFO_FILE):
+    """
+    Reads the optional read replica lines ("replica <host> <port>") that follow
+    the primary's settings. Replicas share the primary's database name, user
+    and password.
+
+    Returns:
+        List of psycopg2.connect keyword argument dicts, one per replica
+    """
+    primary = read_db_info(path)
+    replicas = []
+    for line in _read_lines(path)[5:]:
+        parts = line.split()
+        if len(parts) != 3 or parts[0] != "replica":
+            raise ValueError(f"Invalid replica line in {path}: {line!r}")
+        replicas.append(dict(primary, host=parts[1], port=parts[2]))
+    return replicas
+
+
+def connect(info=None):
+    """
+    Opens a new database connection.
+
+    Parameters:
+        info: Dict returned by read_db_info (read from dbinfo.txt if None)
+
+    Returns:
+        A new psycopg2 connection
+    """
+    if info is None:
+        info = read_db_info()
+    return psycopg2.connect(**info)
+
+
+def listen(channel, info=None):
+    """
+    Opens a connection that LISTENs on a notification channel. It runs in
+    autocommit mode, so notifications are delivered as soon as they arrive.
+
+    Parameters:
+        channel: Channel name
+        info: Dict returned by read_db_info (read from dbinfo.txt if None)
+
+    Returns:
+        A new psycopg2 connection
+    """
+    conn = connect(info)
+    conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+    curr = conn.cursor()
+    curr.execute(f"LISTEN {channel};")
+    curr.close()
+    return conn
+
+
+def wait_for_notifies(conn, timeout):
+    """
+    Waits up to timeout seconds for notifications on a listen() connection.
+
+    Returns:
+        List of the payloads received, in order (empty if none arrived)
+    """
+    if not conn.notifies:
+        ready, _, _ = select.select([conn], [], [], max(0.0, timeout))
+        if ready:
+            conn.poll()
+    payloads = [notify.payload for notify in conn.notifies]
+    conn.notifies.clear()
+    return payloads
+
+
+def connect_routed(path=DB_INFO_FILE, read_your_writes=True):
+    """
+    Opens a connection to the primary and to every configured replica.
+
+    Returns:
+        A routing.RoutedConnection if replicas are configured, otherwise a
+        plain psycopg2 connection to the primary
+    """
+    primary = connect(read_db_info(path))
+    replica_info = read_replica_info(path)
+    if not replica_info:
+        return primary
+    replicas = []
+    try:
+        for info in replica_info:
+            replicas.append(connect(info))
+    except Exception:
+        for conn in replicas + [primary]:
+            conn.close()
+        raise
+    return routing.RoutedConnection(primary, replicas, read_your_writes)
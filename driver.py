@@ -1,6 +1,7 @@
 ## Contains all of the methods for driver-specific actions
 
 import dbTier
+import metrics
 
 def get_address():
     print("   Enter Address Info")
@@ -12,35 +13,56 @@ def get_address():
     city = input("     City: ")
     return number, road, city
 
+def choose_driver(conn, name):
+    """Returns name if a driver has that exact name. Otherwise lists the closest
+    driver names and lets the user pick one.
+
+    Returns the chosen driver name, or None if there is no match or the user
+    picks none"""
+    candidates = dbTier.search_drivers(conn, name)
+    if any(candidate == name for candidate, _ in candidates):
+        return name
+    if not candidates:
+        return None
+    print(f"   No driver named \"{name}\". Did you mean:")
+    for i, (candidate, _) in enumerate(candidates, start=1):
+        print(f"     {i}. {candidate}")
+    choice = input(f"   Enter a number (1-{len(candidates)}), or press Enter for none: ").strip()
+    if choice.isnumeric() and 1 <= int(choice) <= len(candidates):
+        return candidates[int(choice) - 1][0]
+    return None
+
 def driver_login(conn):
     """Handles driver authentication and entry to driver menu"""
     print("\nDriver Login:")
     name = input("   Please enter your driver name: ")
 
-    # Validate driver exists
-    driver = dbTier.get_driver(conn, name)
-    if driver is None:
+    # Validate driver exists, offering close matches for a mistyped name
+    name = choose_driver(conn, name)
+    if name is None:
         print("\nLogin failed: Driver not found")
+        metrics.LOGINS.inc(role="driver", outcome="failed")
         return
-    
+    metrics.LOGINS.inc(role="driver", outcome="ok")
+
     print(f"\nWelcome {name}. Please select an action:")
     driver_menu(conn, name)
 
 def qualify_driver(conn, name):
-    model_id = input("   Enter model ID to declare: ")
-    while len(model_id) != 8:
-        if model_id.lower() == 'x':
+    model_ids = input("   Enter model ID(s) to declare, separated by spaces: ").replace(",", " ").split()
+    while not model_ids or any(len(model_id) != 8 for model_id in model_ids):
+        if [model_id.lower() for model_id in model_ids] == ['x']:
             print("\nCancelling driver update...")
             return
-        model_id = input("     Invlaid Model ID (must be 8 characters). Try again: ")
-    # Print message based on result
-    qualifies_return = dbTier.qualify_driver_for_model(conn, name, model_id)
-    if qualifies_return == 0:
-        print(f"\nDriver {name} now qualified for model {model_id}")
-    elif qualifies_return == 1:
-        print("\nDeclaration Failed: Driver already drives model")
-    elif qualifies_return == 2:
-        print(f"\nDeclaration failed: Model ID may not exist.")
+        model_ids = input("     Invlaid Model ID (must be 8 characters). Try again: ").replace(",", " ").split()
+    # Qualify for every model in one statement, then print a message per model based on the result
+    for model_id, qualifies_return in dbTier.qualify_driver_for_models(conn, name, model_ids):
+        if qualifies_return == 0:
+            print(f"\nDriver {name} now qualified for model {model_id}")
+        elif qualifies_return == 1:
+            print(f"\nDeclaration Failed: Driver already drives model {model_id}")
+        elif qualifies_return == 2:
+            print(f"\nDeclaration failed: Model ID {model_id} may not exist.")
 
 def driver_menu(conn, name):
     """Sub-menu for driver operations"""
@@ -49,7 +71,7 @@ def driver_menu(conn, name):
         print("\nDriver actions:")
         print("   1. Change my address")
         print("   2. List all car models")
-        print("   3. Declare I can drive a model")
+        print("   3. Declare I can drive models")
         print("   x. Log out")
 
         user_input = input("Enter a command (1-3, or x to log out): ")
@@ -57,10 +79,10 @@ def driver_menu(conn, name):
             case '1':
                 number, street, city = get_address()
 
-                # Insert address to Address table if it does not exist
-                dbTier.insert_address(conn, number, street, city)
-                # Update Address in Driver table
-                if dbTier.update_driver_address(conn, name, number, street, city):
+                # Look up the address id (adding the address if it does not
+                # exist) and point the driver at it
+                address_id = dbTier.intern_address(conn, number, street, city)
+                if address_id is not None and dbTier.update_driver_address(conn, name, address_id):
                     print(f"\nAddress updated to {number} {street}, {city}")
                 ## validation
                 else:
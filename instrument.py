@@ -0,0 +1,112 @@
+## Hooks for observing calls into the data access layer (dbTier)
+##
+## Tools register a hook to record or time dbTier calls without touching the
+## menu code. The public dbTier functions are wrapped while at least one hook is
+## registered. When one dbTier function calls another, only the outermost call
+## is reported, unless the hook is added with nested=True.
+##
+## Statement hooks see the individual SQL statements instead: they are called
+## for every statement run through a TracingCursor.
+
+import functools
+import inspect
+import threading
+import time
+from collections import namedtuple
+
+import psycopg2.extensions
+
+import dbTier
+
+# One finished dbTier call. args holds the positional arguments (args[0] is the
+# connection), error is the exception raised (None if the call returned
+# normally), and elapsed is the wall time in seconds.
+DalCall = namedtuple("DalCall", "name args kwargs result error elapsed")
+
+_hooks = []
+_nested_hooks = []
+_statement_hooks = []
+_originals = {}
+_state = threading.local()
+
+
+def dal_functions():
+    """Returns the names of the dbTier functions (those tagged with an access type)"""
+    return [name for name, obj in vars(dbTier).items()
+            if inspect.isfunction(obj) and hasattr(obj, "access")]
+
+
+def _wrap(name, func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        # Nested dbTier calls are part of the outer call
+        outermost = not getattr(_state, "active", False)
+        if not outermost and not _nested_hooks:
+            return func(*args, **kwargs)
+        _state.active = True
+        result = error = None
+        start = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+            return result
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            if outermost:
+                _state.active = False
+            call = DalCall(name, args, kwargs, result, error, elapsed)
+            for hook in (list(_hooks) if outermost else []) + list(_nested_hooks):
+                hook(call)
+    return wrapper
+
+
+def add_hook(hook, nested=False):
+    """
+    Registers hook(call) to be called with a DalCall after every outermost
+    dbTier call, or after every dbTier call including nested ones if nested
+    is True. Installs the wrappers on first use.
+    """
+    if not _originals:
+        for name in dal_functions():
+            func = getattr(dbTier, name)
+            _originals[name] = func
+            setattr(dbTier, name, _wrap(name, func))
+    (_nested_hooks if nested else _hooks).append(hook)
+
+
+def remove_hook(hook):
+    """Unregisters a hook, restoring the original dbTier functions when none remain"""
+    for hooks in (_hooks, _nested_hooks):
+        if hook in hooks:
+            hooks.remove(hook)
+    if not _hooks and not _nested_hooks:
+        for name, func in _originals.items():
+            setattr(dbTier, name, func)
+        _originals.clear()
+
+
+class TracingCursor(psycopg2.extensions.cursor):
+    """
+    Cursor that passes every statement, with its parameters bound, to the
+    statement hooks before running it. Enable it on a connection with
+    conn.cursor_factory = instrument.TracingCursor.
+    """
+
+    def execute(self, query, vars=None):
+        if _statement_hooks:
+            statement = self.mogrify(query, vars)
+            for hook in list(_statement_hooks):
+                hook(self, statement)
+        return super().execute(query, vars)
+
+
+def add_statement_hook(hook):
+    """Registers hook(cursor, statement) to be called before each statement a TracingCursor runs"""
+    _statement_hooks.append(hook)
+
+
+def remove_statement_hook(hook):
+    if hook in _statement_hooks:
+        _statement_hooks.remove(hook)
@@ -1,47 +1,58 @@
 ## Initializes the database connection and runs the main menu loop
 
-import psycopg2
+import argparse
+import batch
+import dashboard
+import dbconfig
 import manager
+import metrics
 import driver
 import client
-import re
+import session_profile
+import workload
 import sys
 
 
-def open_db():
-    """Reads database info from file "dbinfo.txt" and attempts to open a new database connection"""
-    with open("dbinfo.txt") as input_file:
-        try:
-            input_text = input_file.read()
-        except Exception as e:
-            print("Could not get db info from file:", e)
-            sys.exit()
-
-    # Process file text and remove comments and blank lines
-    input_text = re.sub(r"#.*", "", input_text)
-    input_text = re.sub(r"\n\s*\n", "\n", input_text)
-    input_text = re.sub(r"^\n", "", input_text)
-    input_text = re.sub(r"\n*$", "", input_text)
-    lines = [line.strip() for line in input_text.split('\n')]
-
-    # Assign connection parameters
-    db, host, user, pw, port = lines
+def open_db(read_your_writes=True):
+    """Reads database info from file "dbinfo.txt" and attempts to open a new database connection.
+    Returns a routed connection when read replicas are listed in the file."""
+    try:
+        dbconfig.read_replica_info()
+    except Exception as e:
+        print("Could not get db info from file:", e)
+        sys.exit()
 
     try:
-        conn = psycopg2.connect(database=db,
-                                host=host,
-                                user=user,
-                                password=pw,
-                                port=port)
+        conn = dbconfig.connect_routed(read_your_writes=read_your_writes)
         return conn
     except Exception as e:
         print("Could not create connection to database:", e)
         sys.exit()
 
 
-def main():
-    # Open db connection and print welcome message
-    conn = open_db()
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Taxi rental management app")
+    parser.add_argument("--record", metavar="FILE",
+                        help="append every database call of this session to a replayable workload file")
+    parser.add_argument("--no-read-your-writes", action="store_true",
+                        help="let reads go to replicas right after this session writes")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="profile the session and write a time breakdown to FILE when it ends")
+    parser.add_argument("--metrics-port", type=int, metavar="PORT",
+                        help="serve Prometheus metrics on http://127.0.0.1:PORT/metrics")
+    parser.add_argument("--metrics-file", metavar="FILE",
+                        help="write Prometheus metrics to FILE periodically and at exit")
+    parser.add_argument("--metrics-interval", type=float, default=metrics.DUMP_INTERVAL,
+                        help="seconds between --metrics-file updates")
+    # Without a subcommand the interactive menu runs
+    subparsers = parser.add_subparsers(dest="command", title="batch commands",
+                                       description="run operations without the menu and print JSON results")
+    batch.add_subcommands(subparsers)
+    return parser.parse_args(argv)
+
+
+def run_menu(conn):
+    """Runs the interactive main menu until the user exits"""
     print("\nWelcome to the taxi rental management app!")
 
     user_input = ''
@@ -69,9 +80,38 @@ def main():
                 pass
             case _:
                 print("\nUnknown command, please try again\n")
-    # Close the database connection before exiting
-    conn.close()
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # Open db connection and print welcome message
+    conn = open_db(read_your_writes=not args.no_read_your_writes)
+    recorder = workload.start_recording(args.record) if args.record else None
+    exporter = None
+    if args.metrics_port is not None or args.metrics_file:
+        metrics.watch_connection(conn)
+        exporter = metrics.Exporter(args.metrics_port, args.metrics_file, args.metrics_interval)
+    profiler = None
+    if args.profile:
+        profiler = session_profile.Profiler(conn, f"batch {args.command}" if args.command else "startup")
+        profiler.start()
+    try:
+        if args.command:
+            return batch.run_command(conn, args)
+        run_menu(conn)
+    finally:
+        if profiler is not None:
+            profiler.stop()
+            profiler.write_report(args.profile)
+        if recorder is not None:
+            workload.stop_recording(recorder)
+        dashboard.close_pool()
+        if exporter is not None:
+            exporter.stop()
+            metrics.unwatch_connection(conn)
+        # Close the database connection before exiting
+        conn.close()
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
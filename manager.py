@@ -1,6 +1,16 @@
 ## Contains all of the methods for manager-specific actions
 
+import csv
+import dashboard
 import dbTier
+import driver
+import metrics
+
+# Number of driver/model pairs sent per statement when qualifying a cohort
+QUALIFY_CHUNK_SIZE = 10000
+
+# Number of clients on the fleet dashboard's top clients list
+DASHBOARD_TOP_K = 10
 
 def get_address():
     print("   Enter Address Info")
@@ -16,12 +26,39 @@ def isvalid_ssn(ssn):
     return (len(ssn) == 9 and ssn.isnumeric())
 
 
-def display_models_rents(conn):
+def print_freshness(conn, report, live, freshness=None):
+    """Prints how current a manager report is: live, or when its view was last refreshed.
+       freshness is a get_analytics_freshness result to use instead of querying it"""
+    if live:
+        print("   (live data)")
+        return
+    if freshness is None:
+        freshness = dbTier.get_analytics_freshness(conn)
+    freshness = freshness.get(report)
+    if freshness is None:
+        print("   (never refreshed)")
+        return
+    refreshed_at, age = freshness
+    if age < 60:
+        ago = f"{age:.0f} s"
+    elif age < 3600:
+        ago = f"{age / 60:.0f} min"
+    else:
+        ago = f"{age / 3600:.1f} h"
+    print(f"   (as of {refreshed_at:%Y-%m-%d %H:%M:%S}, {ago} ago)")
+
+
+def display_models_rents(conn, live=False):
     """Generate and displays a list containing every car in the db
        model alongside the number of rents it has been used"""
     
     # dbTier returns list of tuples: (modle_id, car_id, color, transmission, rent_count))
-    models_rents = dbTier.get_models_rents(conn)
+    models_rents = dbTier.get_models_rents(conn, live)
+    print_models_rents(conn, models_rents, live)
+
+
+def print_models_rents(conn, models_rents, live, freshness=None):
+    """Prints the models report from get_models_rents"""
     # Print the list 
     if models_rents:
         color_width = max(len(tup[2]) for tup in models_rents) + 2 # get width of color so a long color string doesn't break the output
@@ -29,6 +66,7 @@ def display_models_rents(conn):
         color_width = 7
 
     print("\nCar models and total rents:")
+    print_freshness(conn, "models_rents", live, freshness)
     print(f"{'Model ID':<10}{'Car ID':<10}{'Color':<{color_width}}{'Year':<6}{'Trans.':<10}{'Rents'}")
     print('-' * (41+color_width))
     for model_id, car_id, color, year, transmission, rent_count in models_rents:
@@ -36,6 +74,75 @@ def display_models_rents(conn):
     print()
 
 
+def print_top_clients(conn, clients, live, freshness=None):
+    """Prints the top clients report from get_top_k_clients"""
+    print_freshness(conn, "top_clients", live, freshness)
+    print(f"\n{'Email':<30}{'Name':<20}{'Rents':<6}")
+    print("-" * 56)
+    for email, name, count in clients:
+        print(f"{email:<30}{name:<20}{count:<6}")
+    print()
+
+
+def print_driver_stats(conn, stats, live, freshness=None):
+    """Prints the driver report from get_driver_stats"""
+    print_freshness(conn, "driver_stats", live, freshness)
+    print(f"\n{'Name':<20}{'Total Rents':<12}{'Avg Rating':<10}")
+    print("-" * 42)
+    for name, total, avg in stats:
+        if avg == -1:
+            print(f"{name:<20}{total:<12}{'N/A'}")
+        else:
+            print(f"{name:<20}{total:<12}{avg:<10.2f}")
+    print()
+
+
+def fleet_dashboard(conn, live):
+    """Shows the models, drivers and top clients reports together. The reports
+       are fetched at the same time on pooled connections"""
+    try:
+        # Stay on the primary while replicas lag behind this session's writes
+        # (for example, a refresh of the analytics views)
+        primary = hasattr(conn, "reader") and conn.reader() is conn.primary
+        report = dashboard.get_pool(primary=primary).fleet_dashboard(DASHBOARD_TOP_K, live)
+    except Exception as e:
+        print(f"\nFailed to load the dashboard: {e}")
+        return
+    slowest = max(report.timings, key=report.timings.get)
+    print(f"\nFleet dashboard ({report.elapsed * 1000:.0f} ms, "
+          f"slowest report {slowest} {report.timings[slowest] * 1000:.0f} ms)")
+    print_models_rents(conn, report.models_rents, live, report.freshness)
+    print("Driver Information (Total Rents, Avg Rating):")
+    print_driver_stats(conn, report.driver_stats, live, report.freshness)
+    print(f"Top {DASHBOARD_TOP_K} Clients:")
+    print_top_clients(conn, report.top_clients, live, report.freshness)
+
+
+def search_reviews(conn):
+    """Searches review messages and shows the matches a page at a time"""
+    print("\nReview Search:")
+    query = input("   Enter search terms (e.g. late or rude): ").strip()
+    if not query:
+        return
+    cursor = None
+    shown = 0
+    while True:
+        reviews, cursor = dbTier.search_reviews(conn, query, after=cursor)
+        if not reviews and shown == 0:
+            print("\nNo reviews match your search.")
+            return
+        print(f"\n{'Review ID':<10}{'Driver':<20}{'Client':<30}{'Rating':<8}{'Message'}")
+        print('-' * 100)
+        for review_id, driver_name, client_email, rating, message, _ in reviews:
+            print(f"{review_id:<10}{driver_name:<20}{client_email or '':<30}{rating:<8}{message}")
+        shown += len(reviews)
+        if cursor is None:
+            print(f"\n{shown} matching review(s).")
+            return
+        if input("\nShow more results (y/n)? ").lower() != 'y':
+            return
+
+
 def add_model(conn):
     """Allows the user to enter a new car model into the database"""
 
@@ -98,14 +205,48 @@ def add_driver(conn):
     number, street, city  = get_address()
 
 
-    ## Attempt to insert address into table
-    # Insert address is safe to call even if address already exits. It will just return false in that case.
-    dbTier.insert_address(conn, number, street, city)
+    ## Add the driver and their address (if it does not exist yet) in one round trip
+    results = dbTier.execute_pipeline(conn, [dbTier.driver_with_address_statement(name, number, street, city)])
+    driver_rows, error_code, error_message = results[0]
 
-    if dbTier.insert_driver(conn, name, number, street, city):
+    if driver_rows:
         print(f"\nSuccessfully added driver {name}")
-    else:
+    elif error_code is None:
         print(f"\nFailed to add driver. Driver \"{name}\" already exists.")
+    else:
+        print(f"\nFailed to add driver: {error_message}")
+
+def run_delete_job(conn, kind, key, description):
+    """Shows how many rows a delete will remove, asks for confirmation and then
+    deletes in small batches so bookings are not blocked while it runs.
+
+    Returns True if the delete finished, False if the target does not exist,
+    or None if it was cancelled or failed"""
+    counts = dbTier.count_delete_impact(conn, kind, key)
+    # The target itself is the last table cleared
+    if counts[-1][1] == 0:
+        return False
+
+    print("\n   This will delete:")
+    for table, row_count in counts:
+        print(f"      {table:<14}{row_count:>10} rows")
+    ##removal validation
+    confirm = input(f"   Are you sure you want to delete {description}? (y/n): ")
+    if confirm.lower() != 'y':
+        print("Deletion cancelled.")
+        return None
+
+    current = []
+    def show_progress(table, total):
+        # Keep one updating line per table
+        if current and current[0] != table:
+            print()
+        current[:] = [table]
+        print(f"\r      {table:<14}{total:>10} rows deleted", end="", flush=True)
+
+    deleted = dbTier.delete_in_batches(conn, kind, key, progress=show_progress)
+    print()
+    return True if deleted is not None else None
 
 def remove_car(conn):
     ## First, double check that we have models to remove
@@ -120,24 +261,11 @@ def remove_car(conn):
             return
         car_id = input("   Invalid Car ID. Try again (or enter x to cancel): ")
 
-    ##removal validation
-    confirm = input(f"   Are you sure you want to delete car {car_id} and its models? (y/n): ")
-    if confirm.lower() == 'y':
-        curr = conn.cursor()
-        try:
-            curr.execute("DELETE FROM Car WHERE car_id = %s", (car_id,))
-            if curr.rowcount > 0:
-                conn.commit()
-                print(f"\nSuccessfully removed car {car_id} and its models")
-            else:
-                conn.rollback()
-                print("\nFailed to remove car. Car brand does not exist.")
-        except Exception as e:
-            print("\nFailed to remove car: ", e)
-        finally:
-            curr.close()
-    else:
-        print("Deletion cancelled")
+    result = run_delete_job(conn, "car", car_id, f"car {car_id} and its models")
+    if result:
+        print(f"\nSuccessfully removed car {car_id} and its models")
+    elif result is False:
+        print("\nFailed to remove car. Car brand does not exist.")
 
 def remove_model(conn):
     if not dbTier.has_models(conn):
@@ -145,24 +273,55 @@ def remove_model(conn):
         return
     # Remove a car model
     model_id = input("   Enter the model_id to remove: ")
-    ##removal validation
-    confirm = input(f"   Are you sure you want to delete model {model_id}? (y/n): ")
-    if confirm.lower() == 'y':
-        curr = conn.cursor()
-        try:
-            curr.execute("DELETE FROM Model WHERE model_id = %s", (model_id,))
-            if curr.rowcount > 0:
-                conn.commit()
-                print(f"\nSuccessfully removed model {model_id}")
-            else:
-                conn.rollback()
-                print("\nFailed to remove model. Model does not exist.")
-        except Exception as e:
-            print("\nFailed to remove model: ", e)
-        finally:
-            curr.close()
-    else:
-        print("Deletion cancelled.")
+    result = run_delete_job(conn, "model", model_id, f"model {model_id}")
+    if result:
+        print(f"\nSuccessfully removed model {model_id}")
+    elif result is False:
+        print("\nFailed to remove model. Model does not exist.")
+
+
+def import_fleet(conn):
+    """Imports cars and models in bulk from a CSV file and reports the outcome of each row"""
+    print("\nFleet Import:")
+    print("   The file must be CSV with the header: car_id,brand,model_id,color,transmission,year")
+    print("   (leave model columns empty to add just a car)")
+    path = input("   Enter path of the fleet file: ")
+    update = input("   Update cars and models that already exist (y/n)? ")
+
+    try:
+        with open(path, newline="") as csv_file:
+            report = dbTier.import_fleet(conn, csv_file, update_existing=update.lower() == 'y')
+    except OSError as e:
+        print(f"\nCould not read file: {e}")
+        return
+    if report is None:
+        print("\nFleet import failed. No changes were made.")
+        return
+
+    outcomes = {}
+    for _, _, _, outcome in report:
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+    print(f"\nImported {len(report)} rows:")
+    for outcome, count in sorted(outcomes.items(), key=lambda item: -item[1]):
+        print(f"   {outcome:<50}{count}")
+
+    # Rows that were not added or updated
+    problems = [row for row in report if not row[3].endswith(("added", "updated"))]
+    if problems:
+        print(f"\n{'Line':<7}{'Car ID':<10}{'Model ID':<10}{'Outcome'}")
+        print('-' * 60)
+        for line_no, car_id, model_id, outcome in problems[:20]:
+            print(f"{line_no:<7}{car_id or '':<10}{model_id or '':<10}{outcome}")
+        if len(problems) > 20:
+            print(f"... and {len(problems) - 20} more")
+
+    report_path = input("\n   Save the full per-row report to a CSV file (enter a path, or leave blank to skip): ")
+    if report_path:
+        with open(report_path, "w", newline="") as report_file:
+            writer = csv.writer(report_file)
+            writer.writerow(["line", "car_id", "model_id", "outcome"])
+            writer.writerows(report)
+        print(f"   Report saved to {report_path}")
 
 
 def edit_cars(conn):
@@ -174,8 +333,9 @@ def edit_cars(conn):
               "   2. Register new car model\n"\
               "   3. Remove existing car model\n"\
               "   4. Remove car brand (will delete all models of that brand)\n"\
-              "   5. Return to manager menu\n")
-        user_input = input("\nEnter a command (1-5): ")
+              "   5. Import cars and models from file\n"\
+              "   6. Return to manager menu\n")
+        user_input = input("\nEnter a command (1-6): ")
         match user_input:
             case "1":
                 add_car(conn)
@@ -186,6 +346,8 @@ def edit_cars(conn):
             case "4":
               remove_car(conn)
             case "5":
+                import_fleet(conn)
+            case "6":
                 user_input = 'x'
             case _:
                 print("Unknown command, please try again")
@@ -201,10 +363,10 @@ def change_driver_name(conn, name):
 
 def change_driver_address(conn, name):
     number, street, city = get_address()
-    # Insert address to Address table if it does not exist
-    dbTier.insert_address(conn, number, street, city)
-    # Update Address in Driver table
-    if dbTier.update_driver_address(conn, name, number, street, city):
+    # Look up the address id (adding the address if it does not exist) and
+    # point the driver at it
+    address_id = dbTier.intern_address(conn, number, street, city)
+    if address_id is not None and dbTier.update_driver_address(conn, name, address_id):
         print(f"\nAddress updated to {number} {street}, {city}")
     ## validation
     else:
@@ -213,11 +375,11 @@ def change_driver_address(conn, name):
 def edit_driver_menu(conn):
     """Sub-menu for changing a driver's information"""
     name = input("\n  Enter name of driver to edit: ")
-    driver = dbTier.get_driver(conn, name)
-    if driver is None:
+    chosen = driver.choose_driver(conn, name)
+    if chosen is None:
         print(f"Driver \"{name}\" does not exist")
         return
-    name = driver[0]
+    name = chosen
     user_input = ''
     while(user_input != 'x'):
         print("\nChoose Update Action:")
@@ -241,6 +403,57 @@ def edit_driver_menu(conn):
                 print("Unknown command, please try again") 
 
 
+def read_qualification_file(path):
+    """Reads a driver cohort file: CSV rows of "driver name,model_id".
+    Blank lines, lines starting with '#' and a "driver,model" header are skipped.
+
+    Returns a list of (driver, model_id) tuples"""
+    pairs = []
+    with open(path, newline="") as input_file:
+        reader = csv.reader(input_file)
+        for row in reader:
+            if not row or row[0].strip().startswith("#"):
+                continue
+            if [col.strip().lower() for col in row] == ["driver", "model"]:
+                continue
+            if len(row) != 2:
+                raise ValueError(f"line {reader.line_num}: expected \"driver,model_id\", got {row}")
+            pairs.append((row[0].strip(), row[1].strip()))
+    return pairs
+
+
+def qualify_cohort(conn):
+    """Qualifies a whole cohort of drivers for their models from a file"""
+    print("\nQualify Drivers From File:")
+    path = input("   Enter path of the driver,model CSV file: ")
+    try:
+        pairs = read_qualification_file(path)
+    except Exception as e:
+        print(f"\nCould not read file: {e}")
+        return
+
+    # Send the cohort in chunks, each one INSERT and one commit
+    results = []
+    for start in range(0, len(pairs), QUALIFY_CHUNK_SIZE):
+        results.extend(dbTier.qualify_drivers_bulk(conn, pairs[start:start + QUALIFY_CHUNK_SIZE]))
+
+    codes = [code for _, _, code in results]
+    print(f"\nProcessed {len(results)} qualifications:")
+    print(f"   Newly qualified:          {codes.count(0)}")
+    print(f"   Already qualified:        {codes.count(1)}")
+    print(f"   Unknown driver or model:  {codes.count(2)}")
+    print(f"   Database errors:          {codes.count(3)}")
+    failures = [(name, model_id, code) for name, model_id, code in results if code >= 2]
+    if failures:
+        print(f"\n{'Driver':<20}{'Model ID':<10}{'Problem'}")
+        print('-' * 50)
+        for name, model_id, code in failures[:20]:
+            problem = "driver or model does not exist" if code == 2 else "database error"
+            print(f"{name:<20}{model_id:<10}{problem}")
+        if len(failures) > 20:
+            print(f"... and {len(failures) - 20} more")
+
+
 def manage_drivers(conn):
     """Sub-menu for managing driver records"""
     user_input = ''
@@ -249,26 +462,26 @@ def manage_drivers(conn):
         print("   1. Register new driver")
         print("   2. Remove existing driver")
         print("   3. Edit driver info")
-        print("   4. Return to manager menu")
-        user_input = input("Enter a command (1-4): ")
+        print("   4. Qualify drivers for models from file")
+        print("   5. Return to manager menu")
+        user_input = input("Enter a command (1-5): ")
         match user_input:
             case "1":
                 add_driver(conn)
             case "2":
                 print("\nRemove Driver:")
                 name = input("   Enter driver name to remove: ")
-                ##added confirmation
-                confirm = input(f"   Are you sure you want to delete driver {name}? (y/n): ")
-                if confirm.lower() == 'y':
-                    if dbTier.delete_driver(conn, name):
-                        print(f"\nSuccessfully removed driver {name}")
-                    else:
-                        print(f"Failed to remove driver: Driver \"{name}\" could not be found.")
-                else:
-                    print("Deletion Cancelled.")
+                name = driver.choose_driver(conn, name) or name
+                result = run_delete_job(conn, "driver", name, f"driver {name}")
+                if result:
+                    print(f"\nSuccessfully removed driver {name}")
+                elif result is False:
+                    print(f"Failed to remove driver: Driver \"{name}\" could not be found.")
             case "3":
                 edit_driver_menu(conn)
             case "4":
+                qualify_cohort(conn)
+            case "5":
                 user_input = 'x'
             case _:
                 print("Unknown command, please try again")
@@ -276,6 +489,8 @@ def manage_drivers(conn):
 
 def manager_options(conn):
     """Main manager menu routing to specific actions"""
+    # Reports read the periodically refreshed analytics views unless live is on
+    live = False
     user_input = ''
     while(user_input != 'x'):
         print("\nManager actions:")
@@ -284,8 +499,12 @@ def manager_options(conn):
               "   3. List top clients\n"\
               "   4. List car information\n"\
               "   5. List driver information\n"\
-              "   6. Client/Driver city search")
-        user_input = input("\nEnter a command (1-6, or x to log out): ")
+              "   6. Client/Driver city search\n"\
+              "   7. Search reviews\n"\
+              "   8. Refresh analytics now\n"\
+              f"   9. Use live analytics (currently {'on' if live else 'off'})\n"\
+              "   10. Fleet dashboard")
+        user_input = input("\nEnter a command (1-10, or x to log out): ")
         match user_input:
             case "1":
                 edit_cars(conn)
@@ -297,37 +516,41 @@ def manager_options(conn):
                 k = input("   Enter value for k: ")
                 while not k.isdigit():
                     k = input("   Invalid. Enter a numeric value for k: ")
-                clients = dbTier.get_top_k_clients(conn, int(k))
-                print(f"\n{'Email':<30}{'Name':<20}{'Rents':<6}")
-                print("-" * 56)
-                for email, name, count in clients:
-                    print(f"{email:<30}{name:<20}{count:<6}")
-                print()
+                clients = dbTier.get_top_k_clients(conn, int(k), live)
+                print_top_clients(conn, clients, live)
             case "4":
-                display_models_rents(conn)
+                display_models_rents(conn, live)
             case "5":
                 # List driver stats
                 print("\nDriver Information (Total Rents, Avg Rating):")
-                stats = dbTier.get_driver_stats(conn)
-                print(f"\n{'Name':<20}{'Total Rents':<12}{'Avg Rating':<10}")
-                print("-" * 42)
-                for name, total, avg in stats:
-                    if avg == -1:
-                        print(f"{name:<20}{total:<12}{'N/A'}")
-                    else:
-                        print(f"{name:<20}{total:<12}{avg:<10.2f}")
-                print()
+                stats = dbTier.get_driver_stats(conn, live)
+                print_driver_stats(conn, stats, live)
             case "6":
                 # Client/Driver city search
                 print("\nClient/Driver City Search:")
                 city1 = input("   Enter client city: ")
                 city2 = input("   Enter driver city: ")
-                results = dbTier.get_clients_by_cities(conn, city1, city2)
+                results = dbTier.get_clients_by_cities(conn, city1, city2, live)
+                print_freshness(conn, "clients_by_cities", live)
                 print(f"\n{'Email':<30}{'Name':<20}")
                 print("-" * 50)
                 for email, name in results:
                     print(f"{email:<30}{name:<20}")
                 print()
+            case "7":
+                search_reviews(conn)
+            case "8":
+                print("\nRefreshing analytics...")
+                refreshed = dbTier.refresh_analytics(conn)
+                for report, seconds in refreshed:
+                    print(f"   {report:<20}{seconds * 1000:.0f} ms")
+                if len(refreshed) == len(dbTier.ANALYTICS_VIEWS):
+                    print("Analytics refreshed.")
+            case "9":
+                live = not live
+                print(f"\nLive analytics {'on: reports query the booking tables directly' if live else 'off'}.")
+            case "10":
+                fleet_dashboard(conn, live)
             case 'x':
                 print("\nLogging out manager...")
             case _:
@@ -346,9 +569,11 @@ def manager_login(conn):
     manager = dbTier.get_manager(conn, ssn)
 
     if manager != None:
+        metrics.LOGINS.inc(role="manager", outcome="ok")
         print(f"\nWelcome {manager[2]}. Please select an action:")
         manager_options(conn)
     else:
+        metrics.LOGINS.inc(role="manager", outcome="failed")
         print("\nLogin failed: Manager SSN not found")
 
 
@@ -368,4 +593,7 @@ def register_manager(conn):
 
     # Attempt to insert manager into the database
     if(dbTier.insert_manager(conn, ssn, email, name)):
+        metrics.REGISTRATIONS.inc(role="manager", outcome="ok")
         print(f"\nSuccessfully registered new manager: {name}")
+    else:
+        metrics.REGISTRATIONS.inc(role="manager", outcome="failed")
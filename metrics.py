@@ -0,0 +1,295 @@
+## Application metrics in the Prometheus text format
+##
+## Counters and histograms live in process memory and are exported either over
+## a local HTTP endpoint (GET /metrics) or by rewriting a file every few
+## seconds (for node_exporter's textfile collector, for example):
+##   python main.py --metrics-port 9464
+##   python main.py --metrics-file /var/lib/node_exporter/taxi.prom
+##
+## Bookings, booking failures, holds and reviews are counted from the dbTier calls
+## themselves (through instrument hooks), so the menus and batch mode are
+## covered alike. Logins and registrations only exist in the menus, which
+## count them directly.
+
+import http.server
+import os
+import threading
+
+import psycopg2.extensions
+
+import dbTier
+import instrument
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DUMP_INTERVAL = 15
+
+REGISTRY = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """Base class: a named family of samples keyed by label values"""
+    kind = "untyped"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} takes labels {self.labels}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def samples(self):
+        """Returns (suffix, label text, value) tuples"""
+        with self._lock:
+            return [("", _labels(self.labels, key), value) for key, value in sorted(self._values.items())]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines += [f"{self.name}{suffix}{labels} {_number(value)}" for suffix, labels, value in self.samples()]
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """
+    Gauge set by the application, or computed at export time by
+    callback(), which returns {tuple of label values: value}.
+    """
+    kind = "gauge"
+
+    def __init__(self, name, help, labels=(), callback=None):
+        super().__init__(name, help, labels)
+        self.callback = callback
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def samples(self):
+        if self.callback is None:
+            return super().samples()
+        return [("", _labels(self.labels, key), value) for key, value in sorted(self.callback().items())]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total, observed = self._values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value, observed + 1)
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, (counts, total, observed) in sorted(self._values.items()):
+                for bound, count in zip(self.buckets, counts):
+                    samples.append(("_bucket", _labels(self.labels, key, f'le="{bound}"'), count))
+                samples.append(("_bucket", _labels(self.labels, key, 'le="+Inf"'), observed))
+                samples.append(("_sum", _labels(self.labels, key), total))
+                samples.append(("_count", _labels(self.labels, key), observed))
+        return samples
+
+
+def render():
+    """Returns every registered metric in the Prometheus text exposition format"""
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+
+### Application metrics ###
+
+BOOKINGS = Counter("taxi_bookings_total", "Rents booked")
+BOOKING_FAILURES = Counter("taxi_booking_failures_total", "Booking attempts turned down, by reason",
+                           ["reason"])
+HOLDS = Counter("taxi_holds_total", "Reservation hold attempts, by outcome", ["outcome"])
+REVIEWS = Counter("taxi_reviews_total", "Reviews written or updated", ["kind"])
+REGISTRATIONS = Counter("taxi_registrations_total", "Registration attempts", ["role", "outcome"])
+LOGINS = Counter("taxi_logins_total", "Login attempts", ["role", "outcome"])
+DAL_LATENCY = Histogram("taxi_dbtier_call_duration_seconds", "Wall time of dbTier calls", ["function"])
+DAL_ERRORS = Counter("taxi_dbtier_call_errors_total", "dbTier calls that raised an exception", ["function"])
+
+# Report every series from the start, so rates work before the first event
+BOOKINGS.inc(0)
+for status, reason in dbTier.BOOK_STATUS_NAMES.items():
+    if status != dbTier.BOOK_OK:
+        BOOKING_FAILURES.inc(0, reason=reason)
+    if status != dbTier.BOOK_ID_TAKEN:
+        HOLDS.inc(0, outcome=reason)
+
+
+def _dal_call(call):
+    """instrument hook that turns dbTier calls into metrics"""
+    DAL_LATENCY.observe(call.elapsed, function=call.name)
+    if call.error is not None:
+        DAL_ERRORS.inc(function=call.name)
+    elif call.name == "book_rent_status":
+        status = call.result[0]
+        if status == dbTier.BOOK_OK:
+            BOOKINGS.inc()
+        else:
+            BOOKING_FAILURES.inc(reason=dbTier.BOOK_STATUS_NAMES[status])
+    elif call.name == "place_hold":
+        HOLDS.inc(outcome=dbTier.BOOK_STATUS_NAMES[call.result[0]])
+    elif call.name in ("insert_review", "update_review") and call.result:
+        REVIEWS.inc(kind="new" if call.name == "insert_review" else "updated")
+
+
+### Connection and pool gauges ###
+
+_watched = []
+
+
+def watch_connection(conn):
+    """Reports conn (a psycopg2 or routed connection) in the connection gauges"""
+    _watched.append(conn)
+
+
+def unwatch_connection(conn):
+    if conn in _watched:
+        _watched.remove(conn)
+
+
+def _servers():
+    """Yields (server role, psycopg2 connection) for every watched connection"""
+    for conn in list(_watched):
+        if hasattr(conn, "primary"):
+            yield "primary", conn.primary
+            for replica in conn.replicas:
+                yield "replica", replica
+        else:
+            yield "primary", conn
+
+
+def _connection_counts(busy):
+    counts = {}
+    for server, conn in _servers():
+        if conn.closed:
+            continue
+        if busy and conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            continue
+        counts[(server,)] = counts.get((server,), 0) + 1
+    return counts
+
+
+CONNECTIONS_OPEN = Gauge("taxi_db_connections_open", "Open database connections", ["server"],
+                         callback=lambda: _connection_counts(busy=False))
+CONNECTIONS_BUSY = Gauge("taxi_db_connections_in_transaction",
+                         "Open database connections inside a transaction", ["server"],
+                         callback=lambda: _connection_counts(busy=True))
+
+
+_pools = {}
+
+
+def watch_pool(name, pool):
+    """Reports a connection pool (with in_use and size attributes) in the pool gauges"""
+    _pools[name] = pool
+
+
+def unwatch_pool(name):
+    _pools.pop(name, None)
+
+
+POOL_IN_USE = Gauge("taxi_db_pool_connections_in_use", "Pooled connections checked out", ["pool"],
+                    callback=lambda: {(name,): pool.in_use for name, pool in list(_pools.items())})
+POOL_SIZE = Gauge("taxi_db_pool_connections_max", "Maximum connections of the pool", ["pool"],
+                  callback=lambda: {(name,): pool.size for name, pool in list(_pools.items())})
+
+
+### Export ###
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Keep scrapes out of the interactive menu
+        pass
+
+
+def dump(path):
+    """Writes the metrics to path, replacing it atomically so readers never see half a file"""
+    temp_path = path + ".tmp"
+    with open(temp_path, "w") as f:
+        f.write(render())
+    os.replace(temp_path, path)
+
+
+class Exporter:
+    """
+    Collects dbTier metrics and exports them while running. Serves
+    http://host:port/metrics if port is given, and rewrites path every
+    interval seconds if path is given.
+    """
+
+    def __init__(self, port=None, path=None, interval=DUMP_INTERVAL, host="127.0.0.1"):
+        self.path = path
+        self.interval = interval
+        self.server = None
+        self._stopped = threading.Event()
+        instrument.add_hook(_dal_call, nested=True)
+        if port is not None:
+            self.server = http.server.ThreadingHTTPServer((host, port), _Handler)
+            threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        if path is not None:
+            threading.Thread(target=self._dump_loop, daemon=True).start()
+
+    def _dump_loop(self):
+        while not self._stopped.wait(self.interval):
+            dump(self.path)
+
+    def stop(self):
+        """Stops exporting, writing the file one last time"""
+        self._stopped.set()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+        if self.path is not None:
+            dump(self.path)
+        instrument.remove_hook(_dal_call)
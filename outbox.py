@@ -0,0 +1,192 @@
+## Change feed consumers for the outbox (rent, review, car, model and driver events)
+##
+## Every committed change to those tables leaves an event in the Outbox table
+## (see create_tables.sql). A Consumer streams the events in order from its
+## last acknowledged position, and acknowledges a whole batch at a time once
+## the caller has handled it. Delivery is at least once: after a crash, the
+## events since the last acknowledgement are delivered again, so handlers
+## should be idempotent (the event payload is the full row, which makes
+## "upsert this row" or "delete this key" handlers the natural fit).
+##
+## In code:
+##   consumer = outbox.Consumer(conn, "rent-cache", topics={"rent"})
+##   for events in consumer.stream(listener=dbconfig.listen(dbTier.OUTBOX_CHANNEL)):
+##       apply(events)                  (acknowledged when the next batch is requested)
+##
+## From the command line:
+##   python outbox.py tail --consumer audit              (print events as JSON lines, forever)
+##   python outbox.py tail --consumer audit --topics rent review --once
+##   python outbox.py status                             (consumers and their backlog)
+##   python outbox.py prune                              (delete events every consumer has acknowledged)
+##   python outbox.py drop audit                         (forget a consumer)
+
+import argparse
+import json
+import sys
+import time
+
+import dbconfig
+import dbTier
+
+# Seconds between polls when waiting without a listener, and the longest wait
+# for a notification before polling anyway
+POLL_INTERVAL = 5
+
+
+class Consumer:
+    """
+    A named position in the change feed. poll() returns the next batch and
+    ack() saves the position after it; stream() does both in a loop.
+    """
+
+    def __init__(self, conn, name, topics=None, batch_size=dbTier.OUTBOX_BATCH_SIZE, from_start=False):
+        self.conn = conn
+        self.name = name
+        self.topics = set(topics) if topics else None
+        self.batch_size = batch_size
+        self.acked = dbTier.register_outbox_consumer(conn, name, from_start)
+        if self.acked is None:
+            raise RuntimeError(f"Could not register outbox consumer {name}")
+        self.position = self.acked
+
+    def poll(self):
+        """
+        Reads the events after the last batch polled. Events of other topics
+        are skipped, but still count as read.
+
+        Returns:
+            (events, more): the events, and whether a full batch was read
+        """
+        events = dbTier.read_outbox(self.conn, self.position, self.batch_size)
+        if events:
+            self.position = (events[-1].txid, events[-1].event_id)
+        # End the read transaction, so the connection does not hold back vacuum
+        self.conn.rollback()
+        more = len(events) == self.batch_size
+        if self.topics is not None:
+            events = [event for event in events if event.topic in self.topics]
+        return events, more
+
+    def ack(self):
+        """Acknowledges everything polled so far"""
+        if self.position != self.acked and dbTier.ack_outbox(self.conn, self.name, self.position):
+            self.acked = self.position
+
+    def rewind(self):
+        """Goes back to the last acknowledged position, so unacknowledged events are read again"""
+        self.position = self.acked
+
+    def stream(self, listener=None, idle_timeout=POLL_INTERVAL, stop=None):
+        """
+        Yields non-empty batches of events forever (or until stop() returns
+        True). A batch is acknowledged when the next one is requested, so a
+        batch whose handler raised is delivered again next time.
+
+        Parameters:
+            listener: Connection from dbconfig.listen(dbTier.OUTBOX_CHANNEL);
+                without one the feed is polled every idle_timeout seconds
+            idle_timeout: Longest wait between polls when the feed is idle
+            stop: Optional function checked between batches
+        """
+        while stop is None or not stop():
+            events, more = self.poll()
+            if events:
+                yield events
+            self.ack()
+            if more:
+                continue
+            # A notification means new events, but they only become readable
+            # once every older transaction has finished, hence the timeout
+            if listener is not None:
+                dbconfig.wait_for_notifies(listener, idle_timeout)
+            else:
+                time.sleep(idle_timeout)
+
+
+def event_json(event):
+    return json.dumps({"txid": event.txid, "event_id": event.event_id, "topic": event.topic,
+                       "event": event.event, "key": event.key, "payload": event.payload,
+                       "created_at": event.created_at.isoformat()})
+
+
+def tail(conn, args, info):
+    consumer = Consumer(conn, args.consumer, args.topics, args.batch_size, args.from_start)
+    if args.once:
+        while True:
+            events, more = consumer.poll()
+            for event in events:
+                print(event_json(event), flush=True)
+            consumer.ack()
+            if not more:
+                return 0
+    listener = dbconfig.listen(dbTier.OUTBOX_CHANNEL, info)
+    try:
+        for events in consumer.stream(listener, args.interval):
+            for event in events:
+                print(event_json(event), flush=True)
+    finally:
+        listener.close()
+
+
+def status(conn):
+    consumers = dbTier.get_outbox_consumers(conn)
+    print(f"{'Consumer':<24}{'Position':<24}{'Acknowledged':<22}{'Pending':>8}")
+    print('-' * 78)
+    for name, txid, event_id, acked_at, pending in consumers:
+        position = f"{txid}/{event_id}"
+        print(f"{name:<24}{position:<24}{acked_at:%Y-%m-%d %H:%M:%S}   {pending:>8}")
+    return 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Read and maintain the outbox change feed")
+    parser.add_argument("--dbinfo", default=dbconfig.DB_INFO_FILE, help="database info file")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    tail_parser = commands.add_parser("tail", help="print events as JSON lines and acknowledge them")
+    tail_parser.add_argument("--consumer", required=True, help="consumer name (its position is saved)")
+    tail_parser.add_argument("--topics", nargs="+", choices=dbTier.OUTBOX_TOPICS,
+                             help="only print these topics (default: all)")
+    tail_parser.add_argument("--from-start", action="store_true",
+                             help="start a new consumer at the oldest event instead of the newest")
+    tail_parser.add_argument("--batch-size", type=int, default=dbTier.OUTBOX_BATCH_SIZE)
+    tail_parser.add_argument("--interval", type=float, default=POLL_INTERVAL,
+                             help=f"longest wait between polls when idle (default: {POLL_INTERVAL})")
+    tail_parser.add_argument("--once", action="store_true", help="exit once the consumer has caught up")
+
+    commands.add_parser("status", help="list consumers and their backlog")
+    commands.add_parser("prune", help="delete events every consumer has acknowledged")
+
+    drop_parser = commands.add_parser("drop", help="remove a consumer")
+    drop_parser.add_argument("consumer")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    info = dbconfig.read_db_info(args.dbinfo)
+    conn = dbconfig.connect(info)
+    try:
+        if args.command == "tail":
+            return tail(conn, args, info)
+        if args.command == "status":
+            return status(conn)
+        if args.command == "prune":
+            deleted = dbTier.prune_outbox(conn)
+            if deleted is None:
+                return 1
+            print(f"Deleted {deleted} events")
+            return 0
+        if dbTier.drop_outbox_consumer(conn, args.consumer):
+            print(f"Dropped consumer {args.consumer}")
+            return 0
+        print(f"No consumer named {args.consumer}")
+        return 1
+    except KeyboardInterrupt:
+        return 0
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,47 @@
+## Latency statistics shared by the benchmarking and load-testing tools
+
+
+def percentile(sorted_values, pct):
+    """
+    Returns the pct-th percentile (0-100) of an already sorted list using
+    linear interpolation between the closest ranks, or None if the list is empty.
+    """
+    if not sorted_values:
+        return None
+    rank = (len(sorted_values) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (rank - low)
+
+
+def summarize(latencies):
+    """
+    Summarizes a list of latencies (in seconds).
+
+    Returns:
+        Dict with count, mean, p50, p95, p99 and max (None values when empty)
+    """
+    values = sorted(latencies)
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values) if values else None,
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": values[-1] if values else None,
+    }
+
+
+def format_summary(label, summary, width=28):
+    """Formats a summary from summarize() as one table row with times in milliseconds"""
+    def ms(value):
+        return f"{value * 1000:>9.2f}" if value is not None else f"{'-':>9}"
+    return (f"{label:<{width}}{summary['count']:>8}{ms(summary['mean'])}{ms(summary['p50'])}"
+            f"{ms(summary['p95'])}{ms(summary['p99'])}{ms(summary['max'])}")
+
+
+def format_header(label="Operation", width=28, extra=""):
+    """Column header matching format_summary, with optional extra column titles appended"""
+    header = (f"{label:<{width}}{'Count':>8}{'Mean':>9}{'p50':>9}"
+              f"{'p95':>9}{'p99':>9}{'Max':>9}{extra}")
+    return "(times in ms)\n" + header + "\n" + "-" * len(header)
@@ -0,0 +1,406 @@
+## Query plan regression check for the dbTier statements
+##
+## Builds a scaled synthetic dataset in its own schema (plan_check), then runs
+## a representative call of every dbTier function, including the flows the
+## manager and client menus send through execute_pipeline. Each statement is
+## captured as it is sent (instrument.TracingCursor) and run first under
+## EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) inside a savepoint that is rolled
+## back, so writes are explained against the same data they really run on.
+##
+## Every plan is reduced to its shape (node types, relations and indexes) and
+## compared with the baseline in plan_baselines/. The check fails, with exit
+## status 1, when a shape changes, when the estimated cost or the buffers
+## touched exceed the baseline by more than the tolerance, or when a statement
+## has no baseline yet.
+##
+## The app's own tables are left alone, but the plan_check schema is dropped
+## and rebuilt on every run, so the tool needs CREATE rights on the database.
+##
+## Examples:
+##   python plan_check.py --update               (record the baselines)
+##   python plan_check.py                        (check against them)
+##   python plan_check.py --scale 4 --cost-tolerance 1.25
+
+import argparse
+import io
+import json
+import os
+import re
+import sys
+
+import psycopg2.extensions
+
+import dbconfig
+import dbTier
+import instrument
+
+SCHEMA = "plan_check"
+BASELINE_DIR = "plan_baselines"
+SQL_DIR = "sql_scripts"
+
+# Statements EXPLAIN accepts; everything else (SET, REFRESH, temp tables) is skipped
+EXPLAINABLE = re.compile(rb"\s*(WITH|SELECT|INSERT|UPDATE|DELETE|VALUES)\b", re.IGNORECASE)
+
+# Row counts at scale 1
+SCALE_ROWS = {"addresses": 2000, "clients": 5000, "drivers": 500, "cars": 100,
+              "models": 500, "rents": 50000}
+
+# Built with plain SQL so every run at the same scale loads the same rows
+LOAD_STATEMENTS = """
+INSERT INTO Manager VALUES ('100000001', 'plan@check.test', 'Plan Manager');
+INSERT INTO Address (number, road, city)
+    SELECT n, 'Road ' || (n %% 400), 'City ' || (n %% 40) FROM generate_series(1, %(addresses)s) n;
+INSERT INTO Client (email, name)
+    SELECT 'client' || n || '@example.com', 'Client ' || n FROM generate_series(1, %(clients)s) n;
+INSERT INTO ClientAddresses (client_id, address_id)
+    SELECT n, 1 + (n * 7) %% %(addresses)s FROM generate_series(1, %(clients)s) n;
+INSERT INTO CreditCard (cc_number, client_id, address_id)
+    SELECT lpad(n::text, 16, '0'), n, 1 + (n * 7) %% %(addresses)s FROM generate_series(1, %(clients)s) n;
+INSERT INTO Driver (name, address_id)
+    SELECT 'Driver ' || n, 1 + (n * 13) %% %(addresses)s FROM generate_series(1, %(drivers)s) n;
+INSERT INTO Car (car_id, brand)
+    SELECT 'C' || lpad(n::text, 7, '0'), (ARRAY['Toyota', 'Ford', 'Honda', 'Mercedes'])[1 + n %% 4]
+    FROM generate_series(1, %(cars)s) n;
+INSERT INTO Model (model_id, car_id, color, transmission, year)
+    SELECT 'M' || lpad(n::text, 7, '0'), 'C' || lpad((1 + n %% %(cars)s)::text, 7, '0'),
+        (ARRAY['black', 'white', 'silver', 'red'])[1 + n %% 4],
+        (ARRAY['automatic', 'manual'])[1 + n %% 2], 2010 + n %% 15
+    FROM generate_series(1, %(models)s) n;
+INSERT INTO Drives (driver_id, model)
+    SELECT 1 + n %% %(drivers)s, 'M' || lpad((1 + (n * 31) %% %(models)s)::text, 7, '0')
+    FROM generate_series(1, %(drivers)s * 8) n
+    ON CONFLICT DO NOTHING;
+CREATE TEMP TABLE numbered_drives AS
+    SELECT row_number() OVER (ORDER BY driver_id, model) AS n, driver_id, model FROM Drives;
+-- Every tenth rent lasts three days; rents that would overlap a booked driver
+-- or model are skipped by the exclusion constraints
+INSERT INTO Rent (rent_id, date, days, client_id, driver_id, model)
+    SELECT 'R' || lpad(r.n::text, 7, '0'), DATE '2025-01-01' + (r.n * 37) %% 365,
+        CASE WHEN r.n %% 10 = 0 THEN 3 ELSE 1 END,
+        1 + (r.n * 17) %% %(clients)s, d.driver_id, d.model
+    FROM generate_series(1, %(rents)s) r(n)
+    JOIN numbered_drives d ON d.n = 1 + (r.n * 7919) %% (SELECT COUNT(*) FROM numbered_drives)
+    ON CONFLICT DO NOTHING;
+INSERT INTO Review (review_id, driver_id, client_id, message, rating)
+    SELECT 'V' || lpad((n / 4)::text, 7, '0'), driver_id, client_id,
+        (ARRAY['friendly and on time', 'late pickup but a safe driver', 'rude and late',
+               'clean car, smooth ride', 'took a wrong turn twice'])[1 + n %% 5],
+        n %% 6
+    FROM (SELECT substr(rent_id, 2)::int AS n, driver_id, client_id FROM Rent) r
+    WHERE n %% 4 = 0;
+DROP TABLE numbered_drives;
+-- The load itself is not part of the change feed; a live outbox is pruned short
+TRUNCATE Outbox;
+"""
+
+BOOK_DATE = "2025-03-15"
+# Far enough ahead that match_waitlist never expires it
+WAITLIST_DATE = "2099-01-01"
+
+
+def scenarios():
+    """
+    Returns (label, function) pairs; each function makes one representative
+    dbTier call on the loaded dataset. Reads come first, then writes in an
+    order that keeps every run identical.
+    """
+    client = "client42@example.com"
+    driver = "Driver 7"
+    model = "M0000042"
+    reads = [
+        ("get_manager", lambda conn: dbTier.get_manager(conn, "100000001")),
+        ("get_client", lambda conn: dbTier.get_client(conn, client)),
+        ("get_driver", lambda conn: dbTier.get_driver(conn, driver)),
+        ("get_car", lambda conn: dbTier.get_car(conn, "C0000007")),
+        ("has_models", dbTier.has_models),
+        ("has_cars", dbTier.has_cars),
+        ("get_all_models", dbTier.get_all_models),
+        ("search_drivers", lambda conn: dbTier.search_drivers(conn, "Drvier 7")),
+        ("search_clients", lambda conn: dbTier.search_clients(conn, "client42")),
+        ("search_reviews", lambda conn: dbTier.search_reviews(conn, "late driver")),
+        ("search_reviews_next_page",
+         lambda conn: dbTier.search_reviews(conn, "late driver", after=(0.05, "V0005000"))),
+        ("find_available_models", lambda conn: dbTier.find_available_models(conn, BOOK_DATE)),
+        ("find_available_models_week", lambda conn: dbTier.find_available_models(conn, BOOK_DATE, 7)),
+        ("find_available_models_range",
+         lambda conn: dbTier.find_available_models_range(conn, BOOK_DATE, "2025-03-21")),
+        ("get_client_rents", lambda conn: dbTier.get_client_rents(conn, client)),
+        ("get_client_profile", lambda conn: dbTier.get_client_profile(conn, client)),
+        ("has_reviewed", lambda conn: dbTier.has_reviewed(conn, client, driver)),
+        ("get_latest_rent_id", dbTier.get_latest_rent_id),
+        ("next_rent_id", dbTier.next_rent_id),
+        ("get_waitlist", lambda conn: dbTier.get_waitlist(conn, client)),
+        ("get_holds", lambda conn: dbTier.get_holds(conn, client)),
+        ("get_latest_review_id", dbTier.get_latest_review_id),
+        ("count_delete_impact_driver", lambda conn: dbTier.count_delete_impact(conn, "driver", driver)),
+        ("count_delete_impact_car", lambda conn: dbTier.count_delete_impact(conn, "car", "C0000007")),
+        ("get_analytics_freshness", dbTier.get_analytics_freshness),
+        ("get_rent_series", lambda conn: dbTier.get_rent_series(conn, "2025-01-01", "2025-12-31")),
+        ("get_rent_series_model_week",
+         lambda conn: dbTier.get_rent_series(conn, "2025-01-01", "2025-12-31", "week", model_id=model)),
+        ("get_rent_series_driver_month",
+         lambda conn: dbTier.get_rent_series(conn, "2025-01-01", "2025-12-31", "month", driver=driver)),
+        ("get_rent_series_city", lambda conn: dbTier.get_rent_series(conn, "2025-01-01", "2025-03-31", city="City 3")),
+        ("get_rent_breakdown_city", lambda conn: dbTier.get_rent_breakdown(conn, "2025-01-01", "2025-12-31", "city")),
+        ("get_rents_between", lambda conn: dbTier.get_rents_between(conn, BOOK_DATE, "2025-03-16")),
+        ("read_outbox", dbTier.read_outbox),
+        ("get_outbox_consumers", dbTier.get_outbox_consumers),
+    ]
+    for live in (False, True):
+        suffix = "_live" if live else ""
+        reads += [
+            ("get_models_rents" + suffix, lambda conn, live=live: dbTier.get_models_rents(conn, live)),
+            ("get_top_k_clients" + suffix, lambda conn, live=live: dbTier.get_top_k_clients(conn, 10, live)),
+            ("get_driver_stats" + suffix, lambda conn, live=live: dbTier.get_driver_stats(conn, live)),
+            ("get_clients_by_cities" + suffix,
+             lambda conn, live=live: dbTier.get_clients_by_cities(conn, "City 3", "City 4", live)),
+        ]
+    for strategy in sorted(dbTier.DRIVER_ASSIGNMENT_STRATEGIES):
+        reads.append((f"book_rent_status_{strategy}",
+                      lambda conn, strategy=strategy: _rolled_back(conn, dbTier.book_rent_status(
+                          conn, "R9999999", BOOK_DATE, client, model, strategy, commit=False))))
+    reads.append(("book_rent_status_days",
+                  lambda conn: _rolled_back(conn, dbTier.book_rent_status(
+                      conn, "R9999999", BOOK_DATE, client, model, commit=False, days=3))))
+
+    fleet = "car_id,brand,model_id,color,transmission,year\nC9000001,Kia,M9000001,blue,manual,2024\n"
+    writes = [
+        ("intern_addresses", lambda conn: dbTier.intern_addresses(conn, [(1, "Plan Road", "Plan City")])),
+        ("register_client_pipeline", lambda conn: dbTier.execute_pipeline(conn, [
+            dbTier.client_statement("plan@example.com", "Plan Client"),
+            dbTier.client_address_statement("plan@example.com", 1),
+            dbTier.credit_card_statement("9999999999999999", "plan@example.com", 1)], atomic=True)),
+        ("insert_client", lambda conn: dbTier.insert_client(conn, "plan2@example.com", "Plan Client 2")),
+        ("insert_client_address", lambda conn: dbTier.insert_client_address(conn, "plan2@example.com", 2)),
+        ("insert_credit_card",
+         lambda conn: dbTier.insert_credit_card(conn, "9999999999999998", "plan2@example.com", 2)),
+        ("insert_manager", lambda conn: dbTier.insert_manager(conn, "100000002", "plan2@check.test", "Plan 2")),
+        ("insert_car", lambda conn: dbTier.insert_car(conn, "C8000001", "Kia")),
+        ("insert_model", lambda conn: dbTier.insert_model(conn, "M8000001", "blue", "manual", 2024, "C8000001")),
+        ("import_fleet", lambda conn: dbTier.import_fleet(conn, io.StringIO(fleet))),
+        ("add_driver_pipeline",
+         lambda conn: dbTier.execute_pipeline(conn, [dbTier.driver_with_address_statement(
+             "Plan Driver", 1, "Plan Road", "Plan City")])),
+        ("insert_driver", lambda conn: dbTier.insert_driver(conn, "Plan Driver 2", 2)),
+        ("update_driver_address", lambda conn: dbTier.update_driver_address(conn, "Plan Driver", 3)),
+        ("update_driver_name", lambda conn: dbTier.update_driver_name(conn, "Plan Driver 2", "Plan Driver 3")),
+        ("qualify_driver_for_model", lambda conn: dbTier.qualify_driver_for_model(conn, "Plan Driver", model)),
+        ("qualify_drivers_bulk",
+         lambda conn: dbTier.qualify_drivers_bulk(conn, [("Plan Driver 3", model), ("Plan Driver 3", "M8000001")])),
+        ("place_hold", lambda conn: dbTier.place_hold(conn, client, "2026-01-01", model)),
+        ("book_rent_status", lambda conn: dbTier.book_rent_status(conn, "R9999999", "2026-01-01", client, model)),
+        ("release_hold", lambda conn: dbTier.release_hold(conn, client, "2026-01-01")),
+        ("reap_expired_holds", dbTier.reap_expired_holds),
+        ("join_waitlist", lambda conn: dbTier.join_waitlist(conn, client, WAITLIST_DATE, model)),
+        ("match_waitlist", dbTier.match_waitlist),
+        ("insert_review", lambda conn: dbTier.insert_review(conn, "V9999999", client, "Plan Driver", "great", 5)),
+        ("update_review", lambda conn: dbTier.update_review(conn, client, "Plan Driver", "great again", 4)),
+        ("refresh_analytics", dbTier.refresh_analytics),
+        ("register_outbox_consumer", lambda conn: dbTier.register_outbox_consumer(conn, "plan")),
+        ("ack_outbox", lambda conn: dbTier.ack_outbox(conn, "plan", ("1", 1))),
+        ("prune_outbox", dbTier.prune_outbox),
+        ("drop_outbox_consumer", lambda conn: dbTier.drop_outbox_consumer(conn, "plan")),
+        ("delete_driver", lambda conn: dbTier.delete_driver(conn, "Plan Driver 3")),
+        ("delete_in_batches_driver", lambda conn: dbTier.delete_in_batches(conn, "driver", "Driver 8")),
+        ("delete_in_batches_car", lambda conn: dbTier.delete_in_batches(conn, "car", "C0000009")),
+    ]
+    return reads + writes
+
+
+def _rolled_back(conn, result):
+    conn.rollback()
+    return result
+
+
+### Dataset ###
+
+def load_dataset(conn, scale):
+    """(Re)creates the plan_check schema with the app's tables and the scaled dataset"""
+    rows = {name: count * scale for name, count in SCALE_ROWS.items()}
+    with open(os.path.join(SQL_DIR, "create_tables.sql")) as f:
+        create_tables = f.read()
+    curr = conn.cursor()
+    curr.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+    curr.execute(f"CREATE SCHEMA {SCHEMA}")
+    # public stays on the path for the pg_trgm operators
+    curr.execute(f"SET search_path = {SCHEMA}, public")
+    curr.execute(create_tables)
+    curr.execute(LOAD_STATEMENTS, rows)
+    for view in dbTier.ANALYTICS_VIEWS.values():
+        curr.execute(f"REFRESH MATERIALIZED VIEW {view}")
+    conn.commit()
+    # ANALYZE cannot run inside a transaction block
+    conn.autocommit = True
+    curr.execute("ANALYZE")
+    conn.autocommit = False
+    curr.close()
+
+
+### Plans ###
+
+def plan_shape(node):
+    """
+    Reduces an EXPLAIN plan node to its shape: node types with the relation
+    and index they use, nested like the plan. Costs and row counts are left out.
+    """
+    label = node["Node Type"]
+    if "Join Type" in node and node["Join Type"] != "Inner":
+        label += " " + node["Join Type"]
+    target = node.get("Relation Name") or node.get("Function Name") or node.get("CTE Name")
+    if target:
+        label += " on " + target
+    if "Index Name" in node:
+        label += " using " + node["Index Name"]
+    children = [plan_shape(child) for child in node.get("Plans", [])]
+    if children:
+        label += " (" + ", ".join(children) + ")"
+    return label
+
+
+class PlanCollector:
+    """Statement hook that explains every statement before it runs"""
+
+    def __init__(self):
+        self.scenario = None
+        self.index = 0
+        self.plans = {}
+        self.errors = {}
+
+    def start(self, scenario):
+        self.scenario = scenario
+        self.index = 0
+
+    def __call__(self, cursor, statement):
+        if self.scenario is None or not EXPLAINABLE.match(statement):
+            return
+        conn = cursor.connection
+        if conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_INERROR:
+            return
+        self.index += 1
+        key = f"{self.scenario}#{self.index}"
+        # A plain cursor, so the EXPLAIN itself is not traced
+        curr = conn.cursor(cursor_factory=psycopg2.extensions.cursor)
+        curr.execute("SAVEPOINT plan_check")
+        try:
+            curr.execute(b"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + statement)
+            explained = curr.fetchone()[0][0]
+        except psycopg2.Error as e:
+            self.errors[key] = str(e).strip()
+        else:
+            plan = explained["Plan"]
+            self.plans[key] = {
+                "statement": " ".join(statement.decode().split()),
+                "shape": plan_shape(plan),
+                "cost": plan["Total Cost"],
+                "buffers": plan.get("Shared Hit Blocks", 0) + plan.get("Shared Read Blocks", 0),
+                "ms": explained["Execution Time"],
+            }
+        curr.execute("ROLLBACK TO SAVEPOINT plan_check")
+        curr.close()
+
+
+def collect_plans(conn):
+    """Runs every scenario with the plan collector attached. Returns the PlanCollector"""
+    collector = PlanCollector()
+    conn.cursor_factory = instrument.TracingCursor
+    instrument.add_statement_hook(collector)
+    try:
+        for label, call in scenarios():
+            collector.start(label)
+            call(conn)
+            if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+    finally:
+        instrument.remove_statement_hook(collector)
+        conn.cursor_factory = psycopg2.extensions.cursor
+    return collector
+
+
+def compare(plans, baseline, cost_tolerance, buffer_tolerance, buffer_slack):
+    """
+    Compares collected plans with a baseline.
+
+    Returns:
+        List of (key, problem) tuples, empty if nothing regressed
+    """
+    problems = []
+    for key, plan in plans.items():
+        expected = baseline.get(key)
+        if expected is None:
+            problems.append((key, "no baseline (run with --update)"))
+            continue
+        if plan["shape"] != expected["shape"]:
+            problems.append((key, f"plan changed\n      was: {expected['shape']}\n      now: {plan['shape']}"))
+        if plan["cost"] > expected["cost"] * cost_tolerance:
+            problems.append((key, f"cost {plan['cost']:.1f} > budget {expected['cost'] * cost_tolerance:.1f}"))
+        budget = expected["buffers"] * buffer_tolerance + buffer_slack
+        if plan["buffers"] > budget:
+            problems.append((key, f"buffers {plan['buffers']} > budget {budget:.0f}"))
+    for key in baseline:
+        if key not in plans:
+            problems.append((key, "statement no longer runs"))
+    return problems
+
+
+def print_report(plans):
+    print(f"{'Statement':<40}{'Cost':>12}{'Buffers':>10}{'ms':>10}")
+    for key, plan in plans.items():
+        print(f"{key:<40}{plan['cost']:12.1f}{plan['buffers']:10d}{plan['ms']:10.2f}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Check dbTier query plans against saved baselines")
+    parser.add_argument("--scale", type=int, default=1,
+                        help=f"dataset scale factor ({SCALE_ROWS['rents']} rents per unit)")
+    parser.add_argument("--update", action="store_true", help="save the current plans as the baseline")
+    parser.add_argument("--cost-tolerance", type=float, default=1.5,
+                        help="fail when a cost exceeds the baseline by this factor")
+    parser.add_argument("--buffer-tolerance", type=float, default=1.5,
+                        help="fail when the buffers touched exceed the baseline by this factor")
+    parser.add_argument("--buffer-slack", type=int, default=8,
+                        help="extra buffers allowed on top of the tolerance, for tiny plans")
+    parser.add_argument("--baseline-dir", default=BASELINE_DIR, help="directory of the baseline files")
+    parser.add_argument("--dbinfo", default=dbconfig.DB_INFO_FILE, help="database info file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    baseline_path = os.path.join(args.baseline_dir, f"scale{args.scale}.json")
+    conn = dbconfig.connect(dbconfig.read_db_info(args.dbinfo))
+    try:
+        load_dataset(conn, args.scale)
+        collector = collect_plans(conn)
+    finally:
+        conn.close()
+
+    print_report(collector.plans)
+    for key, error in collector.errors.items():
+        print(f"{key}: EXPLAIN failed: {error}")
+
+    if args.update:
+        os.makedirs(args.baseline_dir, exist_ok=True)
+        with open(baseline_path, "w") as f:
+            json.dump(collector.plans, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"\nSaved {len(collector.plans)} plans to {baseline_path}")
+        return 0
+
+    if not os.path.exists(baseline_path):
+        print(f"\nNo baseline at {baseline_path}; run with --update first")
+        return 1
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    problems = compare(collector.plans, baseline, args.cost_tolerance,
+                       args.buffer_tolerance, args.buffer_slack)
+    if problems:
+        print(f"\n{len(problems)} plan regression(s):")
+        for key, problem in problems:
+            print(f"  {key}: {problem}")
+        return 1
+    print(f"\nAll {len(collector.plans)} plans match {baseline_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,58 @@
+## Scheduled refresh of the manager analytics views
+##
+## Refreshes the materialized views behind the manager reports (see
+## dbTier.refresh_analytics) once, or every --interval seconds until stopped.
+## Refreshes run concurrently, so the app keeps reading the previous results
+## while a refresh is in progress.
+##
+## Example:
+##   python refresh_analytics.py                       (refresh everything once)
+##   python refresh_analytics.py --interval 300        (every 5 minutes, e.g. under a process supervisor)
+##   python refresh_analytics.py --reports top_clients driver_stats
+
+import argparse
+import sys
+import time
+from datetime import datetime
+
+import dbconfig
+import dbTier
+
+
+def refresh(conn, reports):
+    """Refreshes the reports once and prints the time each took. Returns True if all succeeded"""
+    refreshed = dbTier.refresh_analytics(conn, reports)
+    stamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    for report, seconds in refreshed:
+        print(f"{stamp} {report:<20}{seconds * 1000:8.0f} ms", flush=True)
+    return len(refreshed) == len(reports)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Refresh the manager analytics views")
+    parser.add_argument("--reports", nargs="+", choices=sorted(dbTier.ANALYTICS_VIEWS),
+                        default=list(dbTier.ANALYTICS_VIEWS), help="reports to refresh (default: all)")
+    parser.add_argument("--interval", type=float,
+                        help="keep running and refresh every INTERVAL seconds")
+    parser.add_argument("--dbinfo", default=dbconfig.DB_INFO_FILE, help="database info file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    conn = dbconfig.connect(dbconfig.read_db_info(args.dbinfo))
+    try:
+        if args.interval is None:
+            return 0 if refresh(conn, args.reports) else 1
+        while True:
+            started = time.monotonic()
+            refresh(conn, args.reports)
+            time.sleep(max(0.0, args.interval - (time.monotonic() - started)))
+    except KeyboardInterrupt:
+        return 0
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
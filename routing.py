@@ -0,0 +1,81 @@
+## Read-replica routing for the data access layer
+##
+## A RoutedConnection stands in for a psycopg2 connection. dbTier functions tagged
+## @read_only run on a replica (round robin), everything else runs on the
+## primary. Attributes that are not defined here (cursor, commit, rollback, ...)
+## are forwarded to the primary, so menu code that uses the connection directly
+## keeps working.
+##
+## With read_your_writes enabled, a session that has written (e.g. booked a rent)
+## keeps reading from the primary until a replica has replayed the primary's WAL
+## past that write.
+
+import itertools
+
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+
+
+class RoutedConnection:
+    def __init__(self, primary, replicas, read_your_writes=True):
+        """
+        Parameters:
+            primary: psycopg2 connection to the primary server
+            replicas: List of psycopg2 connections to read replicas
+            read_your_writes: Keep reads on the primary until replicas catch up with this session's writes
+        """
+        self.primary = primary
+        self.replicas = replicas
+        self.read_your_writes = read_your_writes
+        self._next_replica = itertools.cycle(replicas)
+        # Set when this session wrote something whose WAL position is not known yet
+        self._write_pending = False
+        # Primary WAL position (pg_lsn text) replicas must reach before serving reads
+        self._write_lsn = None
+        for replica in replicas:
+            # Reads never need a transaction on the replica; this also avoids holding back cleanup there
+            replica.set_session(readonly=True, autocommit=True)
+
+    def __getattr__(self, name):
+        return getattr(self.primary, name)
+
+    def note_write(self):
+        """Called by dbTier after every read-write call"""
+        if self.read_your_writes and self.replicas:
+            self._write_pending = True
+            self._capture_write_lsn()
+
+    def _capture_write_lsn(self):
+        """Records the primary's WAL position once this session's writes are committed"""
+        # An open transaction may hold uncommitted writes (e.g. commit=False during registration)
+        if self.primary.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+            return
+        with self.primary.cursor() as curr:
+            curr.execute("SELECT pg_current_wal_lsn()::text")
+            self._write_lsn = curr.fetchone()[0]
+        self.primary.rollback()
+        self._write_pending = False
+
+    def _caught_up(self, replica):
+        with replica.cursor() as curr:
+            curr.execute("SELECT pg_last_wal_replay_lsn() >= %s::pg_lsn", (self._write_lsn,))
+            return bool(curr.fetchone()[0])
+
+    def reader(self):
+        """Returns the connection a read-only call should use"""
+        if not self.replicas:
+            return self.primary
+        if self._write_pending:
+            self._capture_write_lsn()
+            if self._write_pending:
+                return self.primary
+        replica = next(self._next_replica)
+        if self._write_lsn is not None:
+            if not self._caught_up(replica):
+                return self.primary
+            self._write_lsn = None
+        return replica
+
+    def close(self):
+        for replica in self.replicas:
+            replica.close()
+        self.primary.close()
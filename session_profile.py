@@ -0,0 +1,233 @@
+## Profiling mode for app sessions (python main.py --profile FILE)
+##
+## Runs the session under cProfile and separates where the time goes:
+##   - dbTier calls: wall time of every outermost dbTier call (instrument hooks)
+##   - round trips: every statement sent through the session's cursors, timed
+##     on the client side, so it includes the network and the server
+##   - server execution: the pg_stat_statements counters of this database and
+##     user, read before and after the session (skipped when the extension is
+##     not installed; other sessions running at the same time are included)
+##   - Python: the rest of the active time, with the time spent waiting at
+##     input() prompts left out
+## Statements and round trips are also grouped by menu action: every answer to
+## an input() prompt starts a new action, named after the prompt.
+##
+## The report is written to FILE when the session ends, and the raw cProfile
+## data to FILE.prof (for pstats or snakeviz).
+
+import builtins
+import cProfile
+import io
+import pstats
+import re
+import sys
+import time
+from collections import OrderedDict, defaultdict
+
+import psycopg2
+import psycopg2.extensions
+
+import instrument
+
+TOP_FUNCTIONS = 25
+TOP_QUERIES = 20
+
+# Server-side statement totals for this database and user
+SERVER_STATS_QUERY = """
+    SELECT query, calls, total_exec_time
+    FROM pg_stat_statements
+    WHERE dbid = (SELECT oid FROM pg_database WHERE datname = current_database())
+      AND userid = (SELECT oid FROM pg_roles WHERE rolname = current_user)
+      AND query NOT LIKE '%pg_stat_statements%'
+"""
+
+# Parameters and literals, which pg_stat_statements shows as $1, $2, ...
+_PARAMETERS = re.compile(r"'(?:[^']|'')*'|%\(\w+\)s|%s|\$\d+|\b\d+(?:\.\d+)?\b")
+
+# Answers short enough to be menu choices are kept in the action name
+_MENU_CHOICE = re.compile(r"\w{1,2}")
+
+
+def canonical(query):
+    """Reduces a statement to a form shared by psycopg2 templates and pg_stat_statements text"""
+    return " ".join(_PARAMETERS.sub("?", query.replace("%%", "%")).split()).lower()
+
+
+def action_name(prompt, answer):
+    """Names the menu action started by answering a prompt"""
+    name = prompt.strip().rstrip(":").strip() or "input"
+    answer = answer.strip()
+    return f"{name} -> {answer if _MENU_CHOICE.fullmatch(answer) else '<text>'}"
+
+
+class ProfilingCursor(instrument.TracingCursor):
+    """Cursor that reports the wall time of every statement to the active Profiler"""
+    profiler = None
+
+    def execute(self, query, vars=None):
+        start = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            if ProfilingCursor.profiler is not None:
+                if isinstance(query, bytes):
+                    query = query.decode()
+                elif not isinstance(query, str):
+                    query = query.as_string(self.connection)
+                ProfilingCursor.profiler.statement(query, time.perf_counter() - start)
+
+
+def _connections(conn):
+    """The psycopg2 connections behind conn (a routed connection has several)"""
+    if hasattr(conn, "primary"):
+        return [conn.primary] + list(conn.replicas)
+    return [conn]
+
+
+def server_snapshot(conn):
+    """
+    Reads the pg_stat_statements totals on the primary.
+
+    Returns:
+        Dict of canonical query -> [calls, milliseconds], or None if unavailable
+    """
+    primary = getattr(conn, "primary", conn)
+    if primary.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+        return None
+    curr = primary.cursor(cursor_factory=psycopg2.extensions.cursor)
+    try:
+        curr.execute(SERVER_STATS_QUERY)
+        rows = curr.fetchall()
+    except psycopg2.Error:
+        return None
+    finally:
+        curr.close()
+        primary.rollback()
+    totals = defaultdict(lambda: [0, 0.0])
+    for query, calls, total in rows:
+        totals[canonical(query)][0] += calls
+        totals[canonical(query)][1] += total
+    return totals
+
+
+class Profiler:
+    """Profiles one session; start() before it and stop() after it, then write_report()"""
+
+    def __init__(self, conn, action="startup"):
+        self.conn = conn
+        self.profile = cProfile.Profile()
+        self.dal = defaultdict(lambda: [0, 0.0])        # dbTier function -> [calls, seconds]
+        self.queries = defaultdict(lambda: [0, 0.0])    # canonical statement -> [calls, seconds]
+        # action -> [times started, round trips, round trip seconds, active seconds]
+        self.actions = OrderedDict()
+        self.action = action
+        self.waiting = 0.0
+        self.server = None
+
+    def start(self):
+        self._server_before = server_snapshot(self.conn)
+        self._factories = [(c, c.cursor_factory) for c in _connections(self.conn)]
+        for c, _ in self._factories:
+            c.cursor_factory = ProfilingCursor
+        ProfilingCursor.profiler = self
+        instrument.add_hook(self._dal_call)
+        self._input = builtins.input
+        builtins.input = self._timed_input
+        self._begin_action(self.action)
+        self.started = time.perf_counter()
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+        self.elapsed = time.perf_counter() - self.started
+        self._end_action()
+        builtins.input = self._input
+        instrument.remove_hook(self._dal_call)
+        ProfilingCursor.profiler = None
+        for c, factory in self._factories:
+            c.cursor_factory = factory
+        after = server_snapshot(self.conn)
+        if self._server_before is not None and after is not None:
+            self.server = {}
+            for query, (calls, total) in after.items():
+                before_calls, before_total = self._server_before.get(query, (0, 0.0))
+                if calls > before_calls:
+                    self.server[query] = (calls - before_calls, total - before_total)
+
+    def statement(self, query, seconds):
+        entry = self.queries[canonical(query)]
+        entry[0] += 1
+        entry[1] += seconds
+        action = self.actions[self.action]
+        action[1] += 1
+        action[2] += seconds
+
+    def _dal_call(self, call):
+        entry = self.dal[call.name]
+        entry[0] += 1
+        entry[1] += call.elapsed
+
+    def _begin_action(self, action):
+        self.action = action
+        self.actions.setdefault(action, [0, 0, 0.0, 0.0])[0] += 1
+        self._action_started = time.perf_counter()
+
+    def _end_action(self):
+        self.actions[self.action][3] += time.perf_counter() - self._action_started
+
+    def _timed_input(self, prompt=""):
+        self._end_action()
+        asked = time.perf_counter()
+        answer = self._input(prompt)
+        self.waiting += time.perf_counter() - asked
+        self._begin_action(action_name(prompt, answer))
+        return answer
+
+    def write_report(self, path):
+        """Writes the text report to path and the raw cProfile data to path.prof"""
+        self.profile.dump_stats(path + ".prof")
+        with open(path, "w") as out:
+            self._report(out)
+        print(f"Profile written to {path}", file=sys.stderr)
+
+    def _report(self, out):
+        active = self.elapsed - self.waiting
+        in_dal = sum(seconds for _, seconds in self.dal.values())
+        round_trips = sum(calls for calls, _ in self.queries.values())
+        on_wire = sum(seconds for _, seconds in self.queries.values())
+        ms = lambda seconds: f"{seconds * 1000:10.1f}"
+
+        out.write("Session time (ms)\n")
+        out.write(f"  total               {ms(self.elapsed)}\n")
+        out.write(f"  waiting for input   {ms(self.waiting)}\n")
+        out.write(f"  active              {ms(active)}\n")
+        out.write(f"    inside dbTier     {ms(in_dal)}\n")
+        out.write(f"    round trips       {ms(on_wire)}   ({round_trips} statements)\n")
+        if self.server is not None:
+            server = sum(total for _, total in self.server.values()) / 1000
+            out.write(f"      server exec     {ms(server)}\n")
+        out.write(f"    Python            {ms(active - on_wire)}\n")
+        out.write("  Round trips count statements only; the BEGIN and COMMIT psycopg2 sends are not included.\n")
+
+        out.write(f"\n{'dbTier call':<36}{'Calls':>8}{'Total ms':>10}{'Mean ms':>10}\n")
+        for name, (calls, seconds) in sorted(self.dal.items(), key=lambda item: -item[1][1]):
+            out.write(f"{name:<36}{calls:>8}{ms(seconds)}{ms(seconds / calls)}\n")
+
+        out.write(f"\n{'Statement':<72}{'Calls':>8}{'Wall ms':>10}{'Server ms':>10}\n")
+        top = sorted(self.queries.items(), key=lambda item: -item[1][1])[:TOP_QUERIES]
+        for query, (calls, seconds) in top:
+            server = "-"
+            if self.server is not None and query in self.server:
+                server = f"{self.server[query][1]:.1f}"
+            out.write(f"{query[:70]:<72}{calls:>8}{ms(seconds)}{server:>10}\n")
+        if self.server is None:
+            out.write("Server times unavailable: pg_stat_statements is not installed or not readable.\n")
+
+        out.write(f"\n{'Menu action':<48}{'Times':>6}{'Trips':>7}{'DB ms':>10}{'Active ms':>10}\n")
+        for action, (times, trips, seconds, busy) in self.actions.items():
+            out.write(f"{action[:46]:<48}{times:>6}{trips:>7}{ms(seconds)}{ms(busy)}\n")
+
+        out.write(f"\nTop {TOP_FUNCTIONS} functions by cumulative time\n")
+        stream = io.StringIO()
+        pstats.Stats(self.profile, stream=stream).sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+        out.write(stream.getvalue())
@@ -0,0 +1,8 @@
+-- Adds the foreign key indexes from create_tables.sql to an existing database
+-- without blocking bookings. CREATE INDEX CONCURRENTLY cannot run inside a
+-- transaction block, so run this file with autocommit on (the psql default).
+CREATE INDEX CONCURRENTLY IF NOT EXISTS model_car_idx ON Model(car_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS rent_model_idx ON Rent(model);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS rent_driver_idx ON Rent(driver_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS drives_model_idx ON Drives(model);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS review_driver_idx ON Review(driver_id);
@@ -0,0 +1,13 @@
+-- Adds the search indexes from create_tables.sql to an existing database
+-- without blocking writes. CREATE INDEX CONCURRENTLY cannot run inside a
+-- transaction block, so run this file with autocommit on (the psql default).
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS driver_name_trgm_idx ON Driver USING gin (name gin_trgm_ops);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS client_email_trgm_idx ON Client USING gin (email gin_trgm_ops);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS client_name_trgm_idx ON Client USING gin (name gin_trgm_ops);
+
+-- Review search document. Adding a stored generated column rewrites Review
+-- under an exclusive lock, so run this part in a quiet period.
+ALTER TABLE Review ADD COLUMN IF NOT EXISTS message_tsv tsvector
+    GENERATED ALWAYS AS (to_tsvector('english', coalesce(message, ''))) STORED;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS review_message_fts_idx ON Review USING gin (message_tsv);
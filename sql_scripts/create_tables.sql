@@ -10,10 +10,13 @@ CREATE TABLE IF NOT EXISTS Manager(
 -- Relationships:
    -- Address: Handled with new table (Rule 5)
    -- CreditCard: Adding foreign key to CreditCard (Rule 4)
+-- client_id is a surrogate key; email stays unique and is what the app looks clients up by
 CREATE TABLE IF NOT EXISTS  Client(
-    email text,
+    client_id int GENERATED BY DEFAULT AS IDENTITY,
+    email text NOT NULL,
     name text,
-    PRIMARY KEY(email)
+    PRIMARY KEY(client_id),
+    UNIQUE(email)
 );
 
 
@@ -22,11 +25,15 @@ CREATE TABLE IF NOT EXISTS  Client(
    -- Driver: Added foreign key to Driver (Rule 4)
    -- CreditCard: Added foreign key to CreditCard (Rule 4)
    -- Rent: Added foreign key to Rent (Rule 4)
+-- address_id is an interned id: each (number, road, city) is stored once and
+-- every other table references it by id (see dbTier.intern_address)
 CREATE TABLE IF NOT EXISTS Address(
-    number int,
-    road text,
-    city text,
-    PRIMARY KEY(number, road, city)
+    address_id int GENERATED BY DEFAULT AS IDENTITY,
+    number int NOT NULL,
+    road text NOT NULL,
+    city text NOT NULL,
+    PRIMARY KEY(address_id),
+    UNIQUE(number, road, city)
 );
 
 
@@ -36,13 +43,15 @@ CREATE TABLE IF NOT EXISTS Address(
    -- Review: Review is weak entity so relationship is handled when defining it
    -- Model: Handled with new table "Drives" (Rule 5)
    -- Works: Added foreign key to Rent (Rule 4)
+-- driver_id is a surrogate key, so renaming a driver only touches this table;
+-- name stays unique and is what the app looks drivers up by
 CREATE TABLE IF NOT EXISTS Driver(
-    name text,
-    number int,
-    road text,
-    city text,
-    PRIMARY KEY(name),
-    FOREIGN KEY(number, road, city) REFERENCES Address(number, road, city)
+    driver_id int GENERATED BY DEFAULT AS IDENTITY,
+    name text NOT NULL,
+    address_id int,
+    PRIMARY KEY(driver_id),
+    UNIQUE(name),
+    FOREIGN KEY(address_id) REFERENCES Address(address_id)
 );
 
 
@@ -55,13 +64,11 @@ CREATE TABLE IF NOT EXISTS Driver(
       --(e.g., make clients enter a credit card when they register)
 CREATE TABLE IF NOT EXISTS CreditCard(
     cc_number CHAR(16),
-    client text,
-    addr_number int,
-    road text,
-    city text,
+    client_id int NOT NULL,
+    address_id int,
     PRIMARY KEY(cc_number),
-    FOREIGN KEY(client) REFERENCES client(email),
-    FOREIGN KEY(addr_number, road, city) REFERENCES Address(number, road, city)
+    FOREIGN KEY(client_id) REFERENCES Client(client_id),
+    FOREIGN KEY(address_id) REFERENCES Address(address_id)
 );
 
 
@@ -96,20 +103,30 @@ CREATE TABLE IF NOT EXISTS Model(
    -- Client: foreign key
    -- Driver: foreign key
    -- Model: foreign key
+-- A rent covers days consecutive days starting on date; dates is that range
+-- (end exclusive). The exclusion constraints keep a driver or a model from
+-- being booked twice on overlapping dates, and their GiST indexes serve the
+-- overlap searches. btree_gist provides the = operator classes they need.
+CREATE EXTENSION IF NOT EXISTS btree_gist;
 CREATE TABLE IF NOT EXISTS Rent(
     rent_id CHAR(8),
-    date date,
+    date date NOT NULL,
+    days int NOT NULL DEFAULT 1,
+    dates daterange GENERATED ALWAYS AS (daterange(date, date + days)) STORED,
     -- Relationship attributes
-    client text,
-    driver text,
+    client_id int,
+    driver_id int,
     model CHAR(8),
     PRIMARY KEY(rent_id),
-    FOREIGN KEY(client) REFERENCES Client(email),
+    FOREIGN KEY(client_id) REFERENCES Client(client_id),
     -- Delete rent records when the referenced driver/model is deleted
-    FOREIGN KEY(driver) REFERENCES Driver(name)
-        ON DELETE CASCADE
-        ON UPDATE CASCADE,
-    FOREIGN KEY(model) REFERENCES Model(model_id) ON DELETE CASCADE
+    FOREIGN KEY(driver_id) REFERENCES Driver(driver_id)
+        ON DELETE CASCADE,
+    FOREIGN KEY(model) REFERENCES Model(model_id) ON DELETE CASCADE,
+    -- Keep in sync with dbTier.MAX_RENT_DAYS
+    CONSTRAINT rent_days_check CHECK (days BETWEEN 1 AND 30),
+    CONSTRAINT rent_driver_excl EXCLUDE USING gist (driver_id WITH =, dates WITH &&),
+    CONSTRAINT rent_model_excl EXCLUDE USING gist (model WITH =, dates WITH &&)
 );
 
 
@@ -121,15 +138,16 @@ CREATE TABLE IF NOT EXISTS Rent(
    -- Rent: Added foreign key to Rent (Rule 4)
 CREATE TABLE IF NOT EXISTS Review(
     review_id CHAR(8) UNIQUE,
-	driver text,
-	client text,
+    driver_id int,
+    client_id int,
     message text,
     rating int,
-    PRIMARY KEY(review_id, driver),
-    FOREIGN KEY(driver) REFERENCES Driver(name) 
-        ON DELETE CASCADE
-        ON UPDATE CASCADE,
-    FOREIGN KEY(client) REFERENCES Client(email)
+    -- Search document for the message, recomputed whenever the message changes
+    message_tsv tsvector GENERATED ALWAYS AS (to_tsvector('english', coalesce(message, ''))) STORED,
+    PRIMARY KEY(review_id, driver_id),
+    FOREIGN KEY(driver_id) REFERENCES Driver(driver_id)
+        ON DELETE CASCADE,
+    FOREIGN KEY(client_id) REFERENCES Client(client_id)
 );
 
 
@@ -142,13 +160,11 @@ CREATE TABLE IF NOT EXISTS Review(
    --application (e.g,. make clients enter at least 1 address when they register,
   -- then save that address in this table)
 CREATE TABLE IF NOT EXISTS ClientAddresses(
-    client text,
-    number int,
-    road text,
-    city text,
-    PRIMARY KEY(client, number, road, city),
-    FOREIGN KEY(client) REFERENCES Client(email),
-    FOREIGN KEY(number, road, city) REFERENCES Address(number, road, city)
+    client_id int,
+    address_id int,
+    PRIMARY KEY(client_id, address_id),
+    FOREIGN KEY(client_id) REFERENCES Client(client_id),
+    FOREIGN KEY(address_id) REFERENCES Address(address_id)
 );
 
 
@@ -156,12 +172,449 @@ CREATE TABLE IF NOT EXISTS ClientAddresses(
 -- Rule 5: Driver--0:N--(qualified_for)--0:N--Model
    -- No need to enforce any lower bounds in the app since it's 0:N on both sides
 CREATE TABLE IF NOT EXISTS Drives(
-    driver text,
+    driver_id int,
     model CHAR(8),
-    PRIMARY KEY (driver,model),
+    PRIMARY KEY (driver_id, model),
     -- Delete drives entries when the referenced driver or model is deleted 
-    FOREIGN KEY(driver) REFERENCES Driver(name) 
-        ON UPDATE CASCADE
+    FOREIGN KEY(driver_id) REFERENCES Driver(driver_id)
+        ON DELETE CASCADE,
+    FOREIGN KEY(model) REFERENCES Model(model_id) ON DELETE CASCADE
+);
+
+
+
+-- Indexes on foreign key columns
+-- Deleting a car, model or driver cascades through these columns, and the
+-- batched deletes in dbTier look rows up by them; without indexes each of
+-- those steps scans the whole table.
+CREATE INDEX IF NOT EXISTS model_car_idx ON Model(car_id);
+CREATE INDEX IF NOT EXISTS rent_model_idx ON Rent(model);
+CREATE INDEX IF NOT EXISTS rent_driver_idx ON Rent(driver_id);
+CREATE INDEX IF NOT EXISTS drives_model_idx ON Drives(model);
+CREATE INDEX IF NOT EXISTS review_driver_idx ON Review(driver_id);
+
+-- Trigram indexes for fuzzy name lookups (dbTier.search_drivers/search_clients)
+-- They serve similarity and ILIKE '%...%' searches without scanning the table.
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS driver_name_trgm_idx ON Driver USING gin (name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS client_email_trgm_idx ON Client USING gin (email gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS client_name_trgm_idx ON Client USING gin (name gin_trgm_ops);
+
+-- Full-text index for searching review messages (dbTier.search_reviews)
+CREATE INDEX IF NOT EXISTS review_message_fts_idx ON Review USING gin (message_tsv);
+
+-- Driver assignment support tables
+-- These hold per-driver aggregates that are kept current by the triggers below,
+-- so book_rent can rank candidate drivers with primary key lookups instead of
+-- aggregating over Rent and Review for every booking.
+
+
+-- Number of rented days per driver per month (period is the first day of the month)
+CREATE TABLE IF NOT EXISTS DriverLoad(
+    driver_id int,
+    period date,
+    rent_count int NOT NULL DEFAULT 0,
+    PRIMARY KEY(driver_id, period),
+    FOREIGN KEY(driver_id) REFERENCES Driver(driver_id)
+        ON DELETE CASCADE
+);
+
+
+-- Running rating totals per driver
+CREATE TABLE IF NOT EXISTS DriverRating(
+    driver_id int,
+    rating_total int NOT NULL DEFAULT 0,
+    review_count int NOT NULL DEFAULT 0,
+    PRIMARY KEY(driver_id),
+    FOREIGN KEY(driver_id) REFERENCES Driver(driver_id)
+        ON DELETE CASCADE
+);
+
+
+-- Keeps DriverLoad in sync with Rent; a rent counts once for each of its days,
+-- in the month of that day
+CREATE OR REPLACE FUNCTION track_driver_load() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE DriverLoad dl
+        SET rent_count = dl.rent_count - m.days
+        FROM (SELECT date_trunc('month', day)::date AS month, COUNT(*) AS days
+              FROM generate_series(OLD.date, OLD.date + OLD.days - 1, interval '1 day') day
+              GROUP BY 1) m
+        WHERE dl.driver_id = OLD.driver_id AND dl.period = m.month;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO DriverLoad (driver_id, period, rent_count)
+        SELECT NEW.driver_id, date_trunc('month', day)::date, COUNT(*)
+        FROM generate_series(NEW.date, NEW.date + NEW.days - 1, interval '1 day') day
+        GROUP BY 2
+        ON CONFLICT (driver_id, period)
+        DO UPDATE SET rent_count = DriverLoad.rent_count + EXCLUDED.rent_count;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS rent_driver_load ON Rent;
+CREATE TRIGGER rent_driver_load
+    AFTER INSERT OR DELETE OR UPDATE OF driver_id, date, days ON Rent
+    FOR EACH ROW EXECUTE FUNCTION track_driver_load();
+
+
+-- Keeps DriverRating in sync with Review
+CREATE OR REPLACE FUNCTION track_driver_rating() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE DriverRating
+        SET rating_total = rating_total - OLD.rating,
+            review_count = review_count - 1
+        WHERE driver_id = OLD.driver_id;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO DriverRating (driver_id, rating_total, review_count)
+        VALUES (NEW.driver_id, NEW.rating, 1)
+        ON CONFLICT (driver_id)
+        DO UPDATE SET rating_total = DriverRating.rating_total + NEW.rating,
+                      review_count = DriverRating.review_count + 1;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS review_driver_rating ON Review;
+CREATE TRIGGER review_driver_rating
+    AFTER INSERT OR DELETE OR UPDATE OF driver_id, rating ON Review
+    FOR EACH ROW EXECUTE FUNCTION track_driver_rating();
+
+
+-- Rent rollup
+-- Rents per day, model and driver, kept current by the trigger below, so
+-- time-series reports (dbTier.get_rent_series) read a few hundred rollup rows
+-- instead of scanning Rent. Ad-hoc date range scans over Rent itself use the
+-- BRIN index: rents are inserted roughly in date order, so a block range
+-- summary per 128 pages is enough to skip most of the table.
+CREATE TABLE IF NOT EXISTS RentDaily(
+    day date,
+    model CHAR(8),
+    driver_id int,
+    rent_count int NOT NULL DEFAULT 0,
+    PRIMARY KEY(day, model, driver_id),
+    FOREIGN KEY(driver_id) REFERENCES Driver(driver_id)
+        ON DELETE CASCADE,
+    FOREIGN KEY(model) REFERENCES Model(model_id) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS rentdaily_driver_idx ON RentDaily(driver_id, day);
+CREATE INDEX IF NOT EXISTS rentdaily_model_idx ON RentDaily(model, day);
+CREATE INDEX IF NOT EXISTS rent_date_brin_idx ON Rent USING brin (date);
+
+
+-- Keeps RentDaily in sync with Rent; a rent counts on every day it covers.
+-- A row whose count drops to zero is deleted, so the rollup only holds days
+-- that still have rents.
+CREATE OR REPLACE FUNCTION track_rent_daily() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        DELETE FROM RentDaily
+        WHERE day BETWEEN OLD.date AND OLD.date + OLD.days - 1
+          AND model = OLD.model AND driver_id = OLD.driver_id
+          AND rent_count <= 1;
+        UPDATE RentDaily
+        SET rent_count = rent_count - 1
+        WHERE day BETWEEN OLD.date AND OLD.date + OLD.days - 1
+          AND model = OLD.model AND driver_id = OLD.driver_id;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO RentDaily (day, model, driver_id, rent_count)
+        SELECT day::date, NEW.model, NEW.driver_id, 1
+        FROM generate_series(NEW.date, NEW.date + NEW.days - 1, interval '1 day') day
+        ON CONFLICT (day, model, driver_id)
+        DO UPDATE SET rent_count = RentDaily.rent_count + 1;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS rent_daily ON Rent;
+CREATE TRIGGER rent_daily
+    AFTER INSERT OR DELETE OR UPDATE OF date, days, model, driver_id ON Rent
+    FOR EACH ROW EXECUTE FUNCTION track_rent_daily();
+
+
+-- Rent ids
+-- New rent ids come from a sequence, so concurrent sessions never pick the
+-- same id (dbTier.next_rent_id). When an id is already taken (rents loaded
+-- from a file, or booked before the sequence existed), the sequence jumps
+-- past the highest id in use.
+CREATE SEQUENCE IF NOT EXISTS rent_id_seq;
+
+CREATE OR REPLACE FUNCTION next_rent_id() RETURNS text AS $$
+DECLARE
+    candidate text;
+BEGIN
+    LOOP
+        candidate := 'R' || lpad(nextval('rent_id_seq')::text, 7, '0');
+        EXIT WHEN NOT EXISTS (SELECT 1 FROM Rent WHERE rent_id = candidate);
+        PERFORM setval('rent_id_seq', GREATEST(currval('rent_id_seq'),
+            (SELECT max(substr(rent_id, 2)::int) FROM Rent WHERE rent_id ~ '^R[0-9]{7}$')));
+    END LOOP;
+    RETURN candidate;
+END;
+$$ LANGUAGE plpgsql;
+
+
+-- Booking waitlist
+-- Bookings turned down for lack of a free driver can wait here. The waitlist
+-- worker (waitlist_worker.py) claims requests with SKIP LOCKED and books them
+-- once capacity appears; the triggers below wake it with a NOTIFY on the
+-- waitlist channel (payload: the model) when a rent frees a driver or a
+-- driver is qualified for a model someone is waiting for.
+CREATE TABLE IF NOT EXISTS Waitlist(
+    request_id bigint GENERATED ALWAYS AS IDENTITY,
+    client_id int NOT NULL,
+    model CHAR(8) NOT NULL,
+    date date NOT NULL,
+    days int NOT NULL DEFAULT 1,
+    dates daterange GENERATED ALWAYS AS (daterange(date, date + days)) STORED,
+    strategy text NOT NULL,
+    requested_at timestamptz NOT NULL DEFAULT now(),
+    attempts int NOT NULL DEFAULT 0,
+    PRIMARY KEY(request_id),
+    UNIQUE(client_id, model, date),
+    FOREIGN KEY(client_id) REFERENCES Client(client_id)
+        ON DELETE CASCADE,
+    FOREIGN KEY(model) REFERENCES Model(model_id) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS waitlist_model_date_idx ON Waitlist(model, date);
+
+
+-- A rent that is deleted or moved frees its model, and its driver for every
+-- model they drive, on its dates (also used for RentHold, which has the same
+-- model, driver_id and dates columns)
+CREATE OR REPLACE FUNCTION notify_waitlist_rent() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('waitlist', w.model)
+    FROM (SELECT DISTINCT w.model
+          FROM Waitlist w
+          WHERE w.dates && OLD.dates
+            AND (w.model = OLD.model
+                 OR w.model IN (SELECT d.model FROM Drives d WHERE d.driver_id = OLD.driver_id))) w;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS rent_waitlist ON Rent;
+CREATE TRIGGER rent_waitlist
+    AFTER DELETE OR UPDATE OF driver_id, model, date, days ON Rent
+    FOR EACH ROW EXECUTE FUNCTION notify_waitlist_rent();
+
+
+-- A new qualification adds a driver for the model. A new driver has no
+-- qualifications yet, so qualifying them is what creates capacity.
+CREATE OR REPLACE FUNCTION notify_waitlist_drives() RETURNS trigger AS $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM Waitlist WHERE model = NEW.model) THEN
+        PERFORM pg_notify('waitlist', NEW.model);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS drives_waitlist ON Drives;
+CREATE TRIGGER drives_waitlist
+    AFTER INSERT OR UPDATE ON Drives
+    FOR EACH ROW EXECUTE FUNCTION notify_waitlist_drives();
+
+
+-- Reservation holds
+-- A client can hold a model and a free driver for a date for a few minutes
+-- between searching and booking (dbTier.place_hold). While a hold is active,
+-- searches and other bookings treat it like a rent, and booking the held
+-- model consumes it. Expired holds are ignored, and are deleted in bulk by
+-- dbTier.reap_expired_holds (run by the waitlist worker). Like rents, holds
+-- cover a range of days. A client holds at most one model on any day, and a
+-- driver or a model is held by at most one client on any day.
+CREATE TABLE IF NOT EXISTS RentHold(
+    hold_id bigint GENERATED ALWAYS AS IDENTITY,
+    client_id int NOT NULL,
+    model CHAR(8) NOT NULL,
+    driver_id int NOT NULL,
+    date date NOT NULL,
+    days int NOT NULL DEFAULT 1,
+    dates daterange GENERATED ALWAYS AS (daterange(date, date + days)) STORED,
+    expires_at timestamptz NOT NULL,
+    PRIMARY KEY(hold_id),
+    CONSTRAINT renthold_driver_excl EXCLUDE USING gist (driver_id WITH =, dates WITH &&),
+    CONSTRAINT renthold_client_excl EXCLUDE USING gist (client_id WITH =, dates WITH &&),
+    CONSTRAINT renthold_model_excl EXCLUDE USING gist (model WITH =, dates WITH &&),
+    FOREIGN KEY(client_id) REFERENCES Client(client_id)
+        ON DELETE CASCADE,
+    FOREIGN KEY(driver_id) REFERENCES Driver(driver_id)
         ON DELETE CASCADE,
     FOREIGN KEY(model) REFERENCES Model(model_id) ON DELETE CASCADE
 );
+CREATE INDEX IF NOT EXISTS renthold_expires_idx ON RentHold(expires_at);
+
+-- A released or reaped hold frees its model and driver, like a cancelled rent
+DROP TRIGGER IF EXISTS renthold_waitlist ON RentHold;
+CREATE TRIGGER renthold_waitlist
+    AFTER DELETE ON RentHold
+    FOR EACH ROW EXECUTE FUNCTION notify_waitlist_rent();
+
+
+-- Outbox (change feed)
+-- Every change to a rent, review, car, model or driver is recorded here by the
+-- triggers below, in the same transaction as the change, so an event exists
+-- if and only if its change committed. Consumers (outbox.py) read events in
+-- (txid, event_id) order and only up to the oldest transaction still running:
+-- event ids are handed out before commit, so a later id can commit first, but
+-- nothing new can appear below that horizon once it has passed. A NOTIFY on
+-- the outbox channel (payload: the topic) wakes listening consumers.
+CREATE TABLE IF NOT EXISTS Outbox(
+    event_id bigint GENERATED ALWAYS AS IDENTITY,
+    txid xid8 NOT NULL DEFAULT pg_current_xact_id(),
+    topic text NOT NULL,
+    event text NOT NULL,
+    entity_key text NOT NULL,
+    payload jsonb NOT NULL,
+    created_at timestamptz NOT NULL DEFAULT now(),
+    PRIMARY KEY(event_id)
+);
+CREATE INDEX IF NOT EXISTS outbox_position_idx ON Outbox(txid, event_id);
+
+
+-- Position of each consumer: the last event it acknowledged
+CREATE TABLE IF NOT EXISTS OutboxConsumer(
+    name text,
+    last_txid xid8 NOT NULL DEFAULT '0',
+    last_event_id bigint NOT NULL DEFAULT 0,
+    acked_at timestamptz NOT NULL DEFAULT now(),
+    PRIMARY KEY(name)
+);
+
+
+-- Records one event per changed row. TG_ARGV[0] is the topic and TG_ARGV[1]
+-- the key column; the payload is the row after the change (before it, for
+-- deletes), without the review search document.
+CREATE OR REPLACE FUNCTION record_outbox_event() RETURNS trigger AS $$
+DECLARE
+    row_data jsonb;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        row_data := to_jsonb(OLD);
+    ELSE
+        row_data := to_jsonb(NEW);
+    END IF;
+    row_data := row_data - 'message_tsv';
+    INSERT INTO Outbox (topic, event, entity_key, payload)
+    VALUES (TG_ARGV[0],
+            CASE TG_OP WHEN 'INSERT' THEN 'created' WHEN 'UPDATE' THEN 'updated' ELSE 'deleted' END,
+            trim(row_data ->> TG_ARGV[1]),
+            row_data);
+    PERFORM pg_notify('outbox', TG_ARGV[0]);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS rent_outbox ON Rent;
+CREATE TRIGGER rent_outbox
+    AFTER INSERT OR UPDATE OR DELETE ON Rent
+    FOR EACH ROW EXECUTE FUNCTION record_outbox_event('rent', 'rent_id');
+
+DROP TRIGGER IF EXISTS review_outbox ON Review;
+CREATE TRIGGER review_outbox
+    AFTER INSERT OR UPDATE OR DELETE ON Review
+    FOR EACH ROW EXECUTE FUNCTION record_outbox_event('review', 'review_id');
+
+DROP TRIGGER IF EXISTS car_outbox ON Car;
+CREATE TRIGGER car_outbox
+    AFTER INSERT OR UPDATE OR DELETE ON Car
+    FOR EACH ROW EXECUTE FUNCTION record_outbox_event('car', 'car_id');
+
+DROP TRIGGER IF EXISTS model_outbox ON Model;
+CREATE TRIGGER model_outbox
+    AFTER INSERT OR UPDATE OR DELETE ON Model
+    FOR EACH ROW EXECUTE FUNCTION record_outbox_event('model', 'model_id');
+
+DROP TRIGGER IF EXISTS driver_outbox ON Driver;
+CREATE TRIGGER driver_outbox
+    AFTER INSERT OR UPDATE OR DELETE ON Driver
+    FOR EACH ROW EXECUTE FUNCTION record_outbox_event('driver', 'driver_id');
+
+
+-- Statement pipelining
+-- Runs a list of already-bound statements in order and reports the outcome of
+-- each one, so a multi-step flow costs one network round trip
+-- (see dbTier.execute_pipeline). Each statement runs in its own subtransaction:
+-- a failing statement is rolled back on its own and the rest still run.
+CREATE OR REPLACE FUNCTION run_statement_batch(stmts text[])
+RETURNS TABLE(stmt_index int, row_count bigint, error_code text, error_message text) AS $$
+BEGIN
+    FOR i IN 1 .. COALESCE(array_length(stmts, 1), 0) LOOP
+        stmt_index := i;
+        row_count := NULL;
+        error_code := NULL;
+        error_message := NULL;
+        BEGIN
+            EXECUTE stmts[i];
+            GET DIAGNOSTICS row_count = ROW_COUNT;
+        EXCEPTION WHEN OTHERS THEN
+            error_code := SQLSTATE;
+            error_message := SQLERRM;
+        END;
+        RETURN NEXT;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+
+-- Manager analytics
+-- Precomputed results for the manager menu reports, so they do not aggregate
+-- the booking tables on every view. Each has a unique index, which lets
+-- dbTier.refresh_analytics use REFRESH MATERIALIZED VIEW CONCURRENTLY: readers
+-- keep seeing the previous contents until the refresh commits.
+CREATE MATERIALIZED VIEW IF NOT EXISTS model_rents_mv AS
+    SELECT m.model_id, m.car_id, m.color, m.year, m.transmission,
+           COUNT(r.rent_id) AS rent_count
+    FROM Model m LEFT JOIN Rent r ON m.model_id = r.model
+    GROUP BY m.car_id, m.model_id, m.color, m.year, m.transmission;
+CREATE UNIQUE INDEX IF NOT EXISTS model_rents_mv_idx ON model_rents_mv(model_id);
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS client_rents_mv AS
+    SELECT c.client_id, c.email, c.name, COUNT(r.rent_id) AS rent_count
+    FROM Client c JOIN Rent r ON c.client_id = r.client_id
+    GROUP BY c.client_id, c.email, c.name;
+CREATE UNIQUE INDEX IF NOT EXISTS client_rents_mv_idx ON client_rents_mv(client_id);
+CREATE INDEX IF NOT EXISTS client_rents_mv_count_idx ON client_rents_mv(rent_count DESC);
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS driver_stats_mv AS
+    SELECT d.driver_id, d.name,
+           COUNT(r.rent_id) AS total_rents,
+           COALESCE(ROUND(AVG(rv.rating)::numeric,2),-1) AS avg_rating
+    FROM Driver d
+    LEFT JOIN Rent r ON d.driver_id = r.driver_id
+    LEFT JOIN Review rv ON d.driver_id = rv.driver_id
+    GROUP BY d.driver_id, d.name;
+CREATE UNIQUE INDEX IF NOT EXISTS driver_stats_mv_idx ON driver_stats_mv(driver_id);
+
+-- Every (client city, driver city) pair a client has booked across
+CREATE MATERIALIZED VIEW IF NOT EXISTS client_driver_cities_mv AS
+    SELECT DISTINCT ca_addr.city AS client_city, d_addr.city AS driver_city,
+           c.client_id, c.email, c.name
+    FROM Client c
+    JOIN ClientAddresses ca ON c.client_id = ca.client_id
+    JOIN Address ca_addr ON ca.address_id = ca_addr.address_id
+    JOIN Rent r ON c.client_id = r.client_id
+    JOIN Driver d ON r.driver_id = d.driver_id
+    JOIN Address d_addr ON d.address_id = d_addr.address_id;
+CREATE UNIQUE INDEX IF NOT EXISTS client_driver_cities_mv_idx
+    ON client_driver_cities_mv(client_city, driver_city, client_id);
+
+-- When each view was last refreshed (shown next to the reports)
+CREATE TABLE IF NOT EXISTS AnalyticsRefresh(
+    view_name text,
+    refreshed_at timestamptz NOT NULL,
+    PRIMARY KEY(view_name)
+);
+INSERT INTO AnalyticsRefresh (view_name, refreshed_at)
+    SELECT unnest(ARRAY['model_rents_mv', 'client_rents_mv', 'driver_stats_mv', 'client_driver_cities_mv']), now()
+    ON CONFLICT (view_name) DO NOTHING;
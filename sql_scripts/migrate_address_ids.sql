@@ -0,0 +1,38 @@
+-- Moves an existing database from the composite Address key (number, road, city)
+-- to the interned address_id used by create_tables.sql.
+-- Run after migrate_surrogate_keys.sql: psql -f migrate_address_ids.sql
+-- Everything runs in one transaction, so a failure leaves the old schema intact.
+BEGIN;
+
+ALTER TABLE Address ADD COLUMN address_id int GENERATED BY DEFAULT AS IDENTITY;
+
+-- Backfill the references from the old address columns
+ALTER TABLE Driver ADD COLUMN address_id int;
+UPDATE Driver t SET address_id = a.address_id FROM Address a
+    WHERE (a.number, a.road, a.city) = (t.number, t.road, t.city);
+
+ALTER TABLE CreditCard ADD COLUMN address_id int;
+UPDATE CreditCard t SET address_id = a.address_id FROM Address a
+    WHERE (a.number, a.road, a.city) = (t.addr_number, t.road, t.city);
+
+ALTER TABLE ClientAddresses ADD COLUMN address_id int;
+UPDATE ClientAddresses t SET address_id = a.address_id FROM Address a
+    WHERE (a.number, a.road, a.city) = (t.number, t.road, t.city);
+
+-- Drop the old columns; this also drops their foreign keys and the
+-- ClientAddresses primary key
+ALTER TABLE Driver DROP COLUMN number, DROP COLUMN road, DROP COLUMN city;
+ALTER TABLE CreditCard DROP COLUMN addr_number, DROP COLUMN road, DROP COLUMN city;
+ALTER TABLE ClientAddresses DROP COLUMN number, DROP COLUMN road, DROP COLUMN city;
+
+-- The natural key stays unique so addresses are still stored once
+ALTER TABLE Address DROP CONSTRAINT address_pkey;
+ALTER TABLE Address ADD PRIMARY KEY (address_id), ADD UNIQUE (number, road, city);
+
+ALTER TABLE Driver ADD FOREIGN KEY (address_id) REFERENCES Address(address_id);
+ALTER TABLE CreditCard ADD FOREIGN KEY (address_id) REFERENCES Address(address_id);
+ALTER TABLE ClientAddresses ALTER COLUMN address_id SET NOT NULL,
+    ADD PRIMARY KEY (client_id, address_id),
+    ADD FOREIGN KEY (address_id) REFERENCES Address(address_id);
+
+COMMIT;
@@ -0,0 +1,44 @@
+-- Moves an existing database from single-day rents to the date ranges used by
+-- create_tables.sql (Rent.days and Rent.dates, with the exclusion constraints
+-- that stop a driver or a model from being booked twice on overlapping dates).
+-- Run after migrate_surrogate_keys.sql and migrate_address_ids.sql, on
+-- databases that needed those: psql -f migrate_rent_ranges.sql
+-- Then run create_tables.sql (for the updated triggers and functions), and
+-- rebuild_driver_stats.sql, since DriverLoad now counts rented days.
+-- Everything runs in one transaction, so a failure leaves the old schema intact.
+BEGIN;
+
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+
+-- Existing double bookings would make the constraints fail; list them first
+DO $$
+DECLARE
+    conflicts int;
+BEGIN
+    SELECT COUNT(*) INTO conflicts
+    FROM Rent a
+    JOIN Rent b ON a.rent_id < b.rent_id AND a.date = b.date
+               AND (a.driver_id = b.driver_id OR a.model = b.model);
+    IF conflicts > 0 THEN
+        RAISE EXCEPTION '% pairs of rents book the same driver or model on the same date; '
+                        'cancel one of each pair and run the migration again', conflicts;
+    END IF;
+END;
+$$;
+
+ALTER TABLE Rent
+    ALTER COLUMN date SET NOT NULL,
+    ADD COLUMN days int NOT NULL DEFAULT 1,
+    ADD COLUMN dates daterange GENERATED ALWAYS AS (daterange(date, date + days)) STORED,
+    ADD CONSTRAINT rent_days_check CHECK (days BETWEEN 1 AND 30),
+    ADD CONSTRAINT rent_driver_excl EXCLUDE USING gist (driver_id WITH =, dates WITH &&),
+    ADD CONSTRAINT rent_model_excl EXCLUDE USING gist (model WITH =, dates WITH &&);
+
+ALTER TABLE IF EXISTS Waitlist
+    ADD COLUMN IF NOT EXISTS days int NOT NULL DEFAULT 1,
+    ADD COLUMN IF NOT EXISTS dates daterange GENERATED ALWAYS AS (daterange(date, date + days)) STORED;
+
+-- Holds only live for minutes; create_tables.sql recreates the table with ranges
+DROP TABLE IF EXISTS RentHold;
+
+COMMIT;
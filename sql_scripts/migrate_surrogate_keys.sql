@@ -0,0 +1,78 @@
+-- Moves an existing database from text keys (Client.email, Driver.name) to the
+-- integer client_id and driver_id keys used by create_tables.sql.
+-- Run with psql from this directory: psql -f migrate_surrogate_keys.sql
+-- Only the tables it converts are touched. Run the later migrations the
+-- database needs (migrate_address_ids.sql, migrate_rent_ranges.sql), then
+-- create_tables.sql for the aggregate tables, triggers and analytics views,
+-- then rebuild_driver_stats.sql and rebuild_rent_daily.sql to fill the
+-- aggregates.
+-- Everything runs in one transaction, so a failure leaves the old schema intact.
+BEGIN;
+
+-- New surrogate keys on the parent tables
+ALTER TABLE Client ADD COLUMN client_id int GENERATED BY DEFAULT AS IDENTITY;
+ALTER TABLE Driver ADD COLUMN driver_id int GENERATED BY DEFAULT AS IDENTITY;
+
+-- Backfill the referencing columns from the old text keys
+ALTER TABLE CreditCard ADD COLUMN client_id int;
+UPDATE CreditCard t SET client_id = c.client_id FROM Client c WHERE c.email = t.client;
+
+ALTER TABLE ClientAddresses ADD COLUMN client_id int;
+UPDATE ClientAddresses t SET client_id = c.client_id FROM Client c WHERE c.email = t.client;
+
+ALTER TABLE Rent ADD COLUMN client_id int, ADD COLUMN driver_id int;
+UPDATE Rent t SET client_id = c.client_id FROM Client c WHERE c.email = t.client;
+UPDATE Rent t SET driver_id = d.driver_id FROM Driver d WHERE d.name = t.driver;
+
+ALTER TABLE Review ADD COLUMN client_id int, ADD COLUMN driver_id int;
+UPDATE Review t SET client_id = c.client_id FROM Client c WHERE c.email = t.client;
+UPDATE Review t SET driver_id = d.driver_id FROM Driver d WHERE d.name = t.driver;
+
+ALTER TABLE Drives ADD COLUMN driver_id int;
+UPDATE Drives t SET driver_id = d.driver_id FROM Driver d WHERE d.name = t.driver;
+
+-- The aggregate tables and their triggers are keyed by the text columns; they
+-- are recreated by create_tables.sql once every migration has run
+DROP TRIGGER IF EXISTS rent_driver_load ON Rent;
+DROP TRIGGER IF EXISTS review_driver_rating ON Review;
+DROP TRIGGER IF EXISTS rent_daily ON Rent;
+DROP TABLE IF EXISTS DriverLoad, DriverRating, RentDaily;
+
+-- Drop the text columns; this also drops their foreign keys and the
+-- composite keys and indexes built on them
+ALTER TABLE CreditCard DROP COLUMN client;
+ALTER TABLE ClientAddresses DROP COLUMN client;
+ALTER TABLE Rent DROP COLUMN client, DROP COLUMN driver;
+ALTER TABLE Review DROP COLUMN client, DROP COLUMN driver;
+ALTER TABLE Drives DROP COLUMN driver;
+
+-- Swap the parent keys: the old text keys stay unique
+ALTER TABLE Client DROP CONSTRAINT client_pkey;
+ALTER TABLE Client ADD PRIMARY KEY (client_id), ADD UNIQUE (email),
+    ALTER COLUMN email SET NOT NULL;
+ALTER TABLE Driver DROP CONSTRAINT driver_pkey;
+ALTER TABLE Driver ADD PRIMARY KEY (driver_id), ADD UNIQUE (name),
+    ALTER COLUMN name SET NOT NULL;
+
+-- Restore the keys of the child tables on the new columns
+ALTER TABLE CreditCard ALTER COLUMN client_id SET NOT NULL,
+    ADD FOREIGN KEY (client_id) REFERENCES Client(client_id);
+ALTER TABLE ClientAddresses ALTER COLUMN client_id SET NOT NULL,
+    ADD PRIMARY KEY (client_id, number, road, city),
+    ADD FOREIGN KEY (client_id) REFERENCES Client(client_id);
+ALTER TABLE Rent
+    ADD FOREIGN KEY (client_id) REFERENCES Client(client_id),
+    ADD FOREIGN KEY (driver_id) REFERENCES Driver(driver_id) ON DELETE CASCADE;
+ALTER TABLE Review ALTER COLUMN driver_id SET NOT NULL,
+    ADD PRIMARY KEY (review_id, driver_id),
+    ADD FOREIGN KEY (driver_id) REFERENCES Driver(driver_id) ON DELETE CASCADE,
+    ADD FOREIGN KEY (client_id) REFERENCES Client(client_id);
+ALTER TABLE Drives ALTER COLUMN driver_id SET NOT NULL,
+    ADD PRIMARY KEY (driver_id, model),
+    ADD FOREIGN KEY (driver_id) REFERENCES Driver(driver_id) ON DELETE CASCADE;
+
+-- Recreate the foreign key indexes that were dropped with the text columns
+CREATE INDEX IF NOT EXISTS rent_driver_idx ON Rent(driver_id);
+CREATE INDEX IF NOT EXISTS review_driver_idx ON Review(driver_id);
+
+COMMIT;
@@ -0,0 +1,22 @@
+-- Rebuilds the DriverLoad and DriverRating tables from Rent and Review.
+-- Run once after adding the tables to an existing database (the triggers in
+-- create_tables.sql keep them current from then on), or any time the counts
+-- are suspected to have drifted.
+BEGIN;
+
+LOCK TABLE Rent, Review IN SHARE MODE;
+
+DELETE FROM DriverLoad;
+INSERT INTO DriverLoad (driver_id, period, rent_count)
+    SELECT r.driver_id, date_trunc('month', day)::date, COUNT(*)
+    FROM Rent r
+    CROSS JOIN generate_series(r.date, r.date + r.days - 1, interval '1 day') day
+    GROUP BY r.driver_id, date_trunc('month', day)::date;
+
+DELETE FROM DriverRating;
+INSERT INTO DriverRating (driver_id, rating_total, review_count)
+    SELECT driver_id, SUM(rating), COUNT(*)
+    FROM Review
+    GROUP BY driver_id;
+
+COMMIT;
@@ -0,0 +1,16 @@
+-- Rebuilds the RentDaily rollup from Rent.
+-- Run once after adding the table to an existing database (run create_tables.sql
+-- first; its trigger keeps the rollup current from then on), or any time the
+-- counts are suspected to have drifted.
+BEGIN;
+
+LOCK TABLE Rent IN SHARE MODE;
+
+DELETE FROM RentDaily;
+INSERT INTO RentDaily (day, model, driver_id, rent_count)
+    SELECT day::date, r.model, r.driver_id, COUNT(*)
+    FROM Rent r
+    CROSS JOIN generate_series(r.date, r.date + r.days - 1, interval '1 day') day
+    GROUP BY day::date, r.model, r.driver_id;
+
+COMMIT;
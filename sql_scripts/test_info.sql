@@ -3,30 +3,40 @@ INSERT INTO Manager VALUES
     ('222333444', 'bigbossboris@taxidrivers.com', 'Boris');
 
 -- Clients
-INSERT INTO Client VALUES
+INSERT INTO Client (email, name) VALUES
     ('maria45@gmail.com','Maria'),
     ('bobbyb33@hotmail.com','Bobby'),
     ('juan77@gmail.com','Juan');
 
--- Addresses (AddressID removed)
-INSERT INTO Address VALUES
+-- Addresses
+INSERT INTO Address (number, road, city) VALUES
     (100, 'Main St',    'Chicago'),
     (200, 'Oak Ave',    'Chicago'),
     (300, 'Pine Rd',    'Evanston'),
     (400, 'Elm St',     'Naperville');
 
--- Client–Address relationships (expanded address info instead of AddressID)
-INSERT INTO ClientAddresses VALUES
+-- Client–Address relationships
+INSERT INTO ClientAddresses (client_id, address_id)
+SELECT c.client_id, a.address_id
+FROM (VALUES
     ('maria45@gmail.com', 100, 'Main St', 'Chicago'),
     ('maria45@gmail.com', 300, 'Pine Rd', 'Evanston'),
     ('bobbyb33@hotmail.com', 200, 'Oak Ave', 'Chicago'),
-    ('juan77@gmail.com', 400, 'Elm St', 'Naperville');
+    ('juan77@gmail.com', 400, 'Elm St', 'Naperville')
+) AS v(email, number, road, city)
+JOIN Client c ON c.email = v.email
+JOIN Address a ON (a.number, a.road, a.city) = (v.number, v.road, v.city);
 
--- Credit cards (expanded address info instead of AddressID)
-INSERT INTO CreditCard VALUES
+-- Credit cards
+INSERT INTO CreditCard (cc_number, client_id, address_id)
+SELECT v.cc_number, c.client_id, a.address_id
+FROM (VALUES
     ('4111222233334444','maria45@gmail.com',100,'Main St','Chicago'),
     ('5555666677778888','bobbyb33@hotmail.com',200,'Oak Ave','Chicago'),
-    ('9999000011112222','juan77@gmail.com',400,'Elm St','Naperville');
+    ('9999000011112222','juan77@gmail.com',400,'Elm St','Naperville')
+) AS v(cc_number, email, number, road, city)
+JOIN Client c ON c.email = v.email
+JOIN Address a ON (a.number, a.road, a.city) = (v.number, v.road, v.city);
 
 -- Cars
 INSERT INTO Car VALUES
@@ -40,40 +50,68 @@ INSERT INTO Model VALUES
     ('M2334455','C2222222','silver',   'manual',   2019),
     ('M4556677','C3333333','white',    'automatic',2021);
 
--- Drivers (expanded address info instead of AddressID)
-INSERT INTO Driver VALUES
+-- Drivers
+INSERT INTO Driver (name, address_id)
+SELECT v.name, a.address_id
+FROM (VALUES
     ('Stanley',100,'Main St','Chicago'),
     ('Alice',  200,'Oak Ave','Chicago'),
-    ('Charles',400,'Elm St','Naperville');
+    ('Charles',400,'Elm St','Naperville')
+) AS v(name, number, road, city)
+JOIN Address a ON (a.number, a.road, a.city) = (v.number, v.road, v.city);
 
 -- Driver–Model qualifications
-INSERT INTO Drives VALUES
+INSERT INTO Drives (driver_id, model)
+SELECT d.driver_id, v.model
+FROM (VALUES
     ('Stanley','M2334455'),
     ('Alice',  'M4556677'),
-    ('Charles','M1111111');
+    ('Charles','M1111111')
+) AS v(name, model)
+JOIN Driver d ON d.name = v.name;
 
 -- Rents
-INSERT INTO Rent VALUES
+INSERT INTO Rent (rent_id, date, client_id, driver_id, model)
+SELECT v.rent_id, v.date::date, c.client_id, d.driver_id, v.model
+FROM (VALUES
     ('R2222222','2025-04-15','maria45@gmail.com','Stanley','M2334455'),
     ('R3333333','2025-04-16','maria45@gmail.com','Stanley','M2334455'),
-    ('R4444444','2025-04-17','maria45@gmail.com','Stanley','M2334455');
+    ('R4444444','2025-04-17','maria45@gmail.com','Stanley','M2334455')
+) AS v(rent_id, date, email, name, model)
+JOIN Client c ON c.email = v.email
+JOIN Driver d ON d.name = v.name;
 
 -- 5 rents of model M4556677
-INSERT INTO Rent VALUES
+INSERT INTO Rent (rent_id, date, client_id, driver_id, model)
+SELECT v.rent_id, v.date::date, c.client_id, d.driver_id, v.model
+FROM (VALUES
     ('R5555555','2025-04-14','bobbyb33@hotmail.com','Alice','M4556677'),
     ('R6666666','2025-04-15','bobbyb33@hotmail.com','Alice','M4556677'),
     ('R7777777','2025-04-16','bobbyb33@hotmail.com','Alice','M4556677'),
     ('R8888888','2025-04-17','bobbyb33@hotmail.com','Alice','M4556677'),
-    ('R9999999','2025-04-18','bobbyb33@hotmail.com','Alice','M4556677');
+    ('R9999999','2025-04-18','bobbyb33@hotmail.com','Alice','M4556677')
+) AS v(rent_id, date, email, name, model)
+JOIN Client c ON c.email = v.email
+JOIN Driver d ON d.name = v.name;
 
 -- 3 rents of model M1111111
-INSERT INTO Rent VALUES
+INSERT INTO Rent (rent_id, date, client_id, driver_id, model)
+SELECT v.rent_id, v.date::date, c.client_id, d.driver_id, v.model
+FROM (VALUES
     ('R1234567','2025-04-14','juan77@gmail.com','Charles','M1111111'),
     ('R2345678','2025-04-15','juan77@gmail.com','Charles','M1111111'),
-    ('R3456789','2025-04-16','juan77@gmail.com','Charles','M1111111');
+    ('R3456789','2025-04-16','juan77@gmail.com','Charles','M1111111')
+) AS v(rent_id, date, email, name, model)
+JOIN Client c ON c.email = v.email
+JOIN Driver d ON d.name = v.name;
 
 -- Reviews
-INSERT INTO Review VALUES
+INSERT INTO Review (review_id, driver_id, client_id, message, rating)
+SELECT v.review_id, d.driver_id, c.client_id, v.message, v.rating
+FROM (VALUES
     ('RVW0001','Stanley','maria45@gmail.com','Very smooth ride',         5),
     ('RVW0002','Alice',  'bobbyb33@hotmail.com','Friendly and punctual',4),
-    ('RVW0003','Charles','juan77@gmail.com','Professional service',      5);
+    ('RVW0003','Charles','juan77@gmail.com','Professional service',      5)
+) AS v(review_id, name, email, message, rating)
+JOIN Driver d ON d.name = v.name
+JOIN Client c ON c.email = v.email;
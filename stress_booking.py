@@ -0,0 +1,267 @@
+## Concurrent booking stress test
+##
+## Fires many book_rent calls at the same time against a local PostgreSQL
+## database, with clients racing for the same model and dates. Reports
+## throughput, latency percentiles and failure reasons, then audits the
+## database for invariant violations.
+##
+## Example:
+##   python stress_booking.py --setup --model M4556677 --bookings 5000 --workers 32
+##   python stress_booking.py --model M4556677 --processes --cleanup
+##   python stress_booking.py --model M4556677 --days 10 --rent-days 4   (overlapping multi-day rents)
+
+import argparse
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import date, timedelta
+
+import dbconfig
+import dbTier
+import perfstats
+
+# Test data created by --setup is recognizable by these names
+STRESS_CLIENT_EMAIL = "stress{}@example.com"
+STRESS_CLIENT_PATTERN = "stress%@example.com"
+STRESS_DRIVER_NAME = "Stress Driver {}"
+STRESS_DRIVER_PATTERN = "Stress Driver %"
+STRESS_ADDRESS = (1, "Stress Test Rd", "Loadville")
+
+OUTCOME_LABELS = {
+    dbTier.BOOK_OK: "booked",
+    dbTier.BOOK_CLIENT_BUSY: "client already booked",
+    dbTier.BOOK_NO_DRIVER: "no free driver",
+    dbTier.BOOK_ID_TAKEN: "rent id already in use",
+    dbTier.BOOK_DB_ERROR: "database error",
+    dbTier.BOOK_MODEL_TAKEN: "model already rented",
+}
+
+# Invariant checks run after the load. Each query returns the offending keys.
+AUDIT_QUERIES = [
+    ("Drivers booked more than once on a date",
+     """SELECT a.driver_id, a.rent_id, b.rent_id FROM Rent a
+        JOIN Rent b ON b.driver_id = a.driver_id AND a.rent_id < b.rent_id AND a.dates && b.dates
+        ORDER BY a.driver_id, a.date"""),
+    ("Clients with more than one rent on a date",
+     """SELECT a.client_id, a.rent_id, b.rent_id FROM Rent a
+        JOIN Rent b ON b.client_id = a.client_id AND a.rent_id < b.rent_id AND a.dates && b.dates
+        ORDER BY a.client_id, a.date"""),
+    ("Models rented more than once on a date",
+     """SELECT a.model, a.rent_id, b.rent_id FROM Rent a
+        JOIN Rent b ON b.model = a.model AND a.rent_id < b.rent_id AND a.dates && b.dates
+        ORDER BY a.model, a.date"""),
+    ("Duplicate rent IDs",
+     """SELECT rent_id, COUNT(*) FROM Rent
+        GROUP BY rent_id HAVING COUNT(*) > 1 ORDER BY rent_id"""),
+    ("Duplicate review IDs",
+     """SELECT review_id, COUNT(*) FROM Review
+        GROUP BY review_id HAVING COUNT(*) > 1 ORDER BY review_id"""),
+]
+
+# Connection settings and per-thread connections used by the workers
+_db_info = None
+_local = threading.local()
+_open_conns = []
+_open_conns_lock = threading.Lock()
+
+
+def _init_worker(db_info):
+    """Stores the connection settings in a worker process"""
+    global _db_info
+    _db_info = db_info
+
+
+def _get_conn():
+    """Returns this thread's connection, opening it on first use"""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = dbconfig.connect(_db_info)
+        _local.conn = conn
+        with _open_conns_lock:
+            _open_conns.append(conn)
+    return conn
+
+
+def _book(task):
+    """Runs one booking and returns (latency in seconds, status code)"""
+    index, email, rent_date, rent_days, model_id, strategy, id_mode = task
+    conn = _get_conn()
+    start = time.perf_counter()
+    if id_mode == "app":
+        # Same id generation the client menu uses
+        rent_id = dbTier.next_rent_id(conn)
+    else:
+        rent_id = f"S{index:07d}"
+    status, driver = dbTier.book_rent_status(conn, rent_id, rent_date, email, model_id, strategy,
+                                             days=rent_days)
+    return time.perf_counter() - start, status
+
+
+def setup_data(conn, model_id, n_clients, n_drivers):
+    """Creates stress clients and drivers qualified for the target model"""
+    address_id = dbTier.intern_address(conn, *STRESS_ADDRESS)
+    with conn.cursor() as curr:
+        curr.execute("""INSERT INTO Client (email, name)
+                        SELECT format(%s, n), 'Stress Client ' || n
+                        FROM generate_series(1, %s) n
+                        ON CONFLICT DO NOTHING""",
+                     (STRESS_CLIENT_EMAIL.replace("{}", "%s"), n_clients))
+        curr.execute("""INSERT INTO ClientAddresses (client_id, address_id)
+                        SELECT c.client_id, %s
+                        FROM generate_series(1, %s) n
+                        JOIN Client c ON c.email = format(%s, n)
+                        ON CONFLICT DO NOTHING""",
+                     (address_id, n_clients, STRESS_CLIENT_EMAIL.replace("{}", "%s")))
+        curr.execute("""INSERT INTO Driver (name, address_id)
+                        SELECT format(%s, n), %s
+                        FROM generate_series(1, %s) n
+                        ON CONFLICT DO NOTHING""",
+                     (STRESS_DRIVER_NAME.replace("{}", "%s"), address_id, n_drivers))
+        curr.execute("""INSERT INTO Drives (driver_id, model)
+                        SELECT d.driver_id, %s
+                        FROM generate_series(1, %s) n
+                        JOIN Driver d ON d.name = format(%s, n)
+                        ON CONFLICT DO NOTHING""",
+                     (model_id, n_drivers, STRESS_DRIVER_NAME.replace("{}", "%s")))
+    conn.commit()
+
+
+def cleanup_data(conn):
+    """Removes everything created by setup_data and the stress run"""
+    with conn.cursor() as curr:
+        curr.execute("""DELETE FROM Rent
+                        WHERE client_id IN (SELECT client_id FROM Client WHERE email LIKE %s)
+                           OR rent_id LIKE 'S%%'""",
+                     (STRESS_CLIENT_PATTERN,))
+        curr.execute("""DELETE FROM ClientAddresses
+                        WHERE client_id IN (SELECT client_id FROM Client WHERE email LIKE %s)""",
+                     (STRESS_CLIENT_PATTERN,))
+        curr.execute("DELETE FROM Client WHERE email LIKE %s", (STRESS_CLIENT_PATTERN,))
+        curr.execute("DELETE FROM Driver WHERE name LIKE %s", (STRESS_DRIVER_PATTERN,))
+    conn.commit()
+
+
+def audit(conn, show=10):
+    """
+    Checks the database for invariant violations and prints them.
+
+    Returns:
+        Total number of violations found
+    """
+    total = 0
+    print("\nInvariant audit:")
+    with conn.cursor() as curr:
+        for label, query in AUDIT_QUERIES:
+            curr.execute(query)
+            rows = curr.fetchall()
+            total += len(rows)
+            print(f"   {label:<45}{len(rows):>6}")
+            for row in rows[:show]:
+                print("      " + ", ".join(str(value) for value in row))
+    conn.rollback()
+    return total
+
+
+def make_tasks(args):
+    """Builds the list of booking requests, all aimed at the same model and a few dates"""
+    rng = random.Random(args.seed)
+    first_day = date.fromisoformat(args.start_date)
+    tasks = []
+    for index in range(args.bookings):
+        email = STRESS_CLIENT_EMAIL.format(rng.randint(1, args.clients))
+        rent_date = (first_day + timedelta(days=rng.randrange(args.days))).isoformat()
+        rent_days = rng.randint(1, args.rent_days)
+        tasks.append((index, email, rent_date, rent_days, args.model, args.strategy, args.id_mode))
+    return tasks
+
+
+def run(args, db_info):
+    """Runs the bookings concurrently and returns (elapsed seconds, results)"""
+    tasks = make_tasks(args)
+    if args.processes:
+        executor = ProcessPoolExecutor(max_workers=args.workers,
+                                       initializer=_init_worker, initargs=(db_info,))
+        chunksize = max(1, len(tasks) // (args.workers * 8))
+    else:
+        _init_worker(db_info)
+        executor = ThreadPoolExecutor(max_workers=args.workers)
+        chunksize = 1
+
+    start = time.perf_counter()
+    with executor:
+        results = list(executor.map(_book, tasks, chunksize=chunksize))
+    elapsed = time.perf_counter() - start
+
+    for conn in _open_conns:
+        conn.close()
+    return elapsed, results
+
+
+def report(args, elapsed, results):
+    """Prints throughput, latency percentiles and outcome counts"""
+    mode = "processes" if args.processes else "threads"
+    print(f"\n{len(results)} booking attempts with {args.workers} {mode} in {elapsed:.2f}s "
+          f"({len(results) / elapsed:.1f} attempts/s)")
+
+    print()
+    print(perfstats.format_header("Outcome"))
+    print(perfstats.format_summary("all attempts", perfstats.summarize([lat for lat, _ in results])))
+    outcomes = Counter(status for _, status in results)
+    for status, label in OUTCOME_LABELS.items():
+        if outcomes[status]:
+            latencies = [lat for lat, st in results if st == status]
+            print(perfstats.format_summary(label, perfstats.summarize(latencies)))
+
+    booked = outcomes[dbTier.BOOK_OK]
+    print(f"\nSuccessful bookings: {booked} ({booked / elapsed:.1f}/s)")
+    print("Failure reasons:")
+    for status, label in OUTCOME_LABELS.items():
+        if status != dbTier.BOOK_OK:
+            print(f"   {label:<25}{outcomes[status]:>8}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Concurrent book_rent stress test with invariant audit")
+    parser.add_argument("--model", required=True, help="model ID every client tries to book")
+    parser.add_argument("--bookings", type=int, default=2000, help="number of booking attempts")
+    parser.add_argument("--workers", type=int, default=16, help="concurrent workers")
+    parser.add_argument("--processes", action="store_true", help="use worker processes instead of threads")
+    parser.add_argument("--start-date", default="2030-01-01", help="first date clients book (YYYY-MM-DD)")
+    parser.add_argument("--days", type=int, default=3, help="number of dates clients race for")
+    parser.add_argument("--rent-days", type=int, default=1,
+                        help="longest rent booked; each attempt books 1 to this many days")
+    parser.add_argument("--clients", type=int, default=200, help="number of stress clients")
+    parser.add_argument("--drivers", type=int, default=20, help="drivers created by --setup")
+    parser.add_argument("--strategy", default=dbTier.DEFAULT_ASSIGNMENT_STRATEGY,
+                        choices=sorted(dbTier.DRIVER_ASSIGNMENT_STRATEGIES))
+    parser.add_argument("--id-mode", choices=("app", "unique"), default="app",
+                        help="'app' generates rent IDs like the client menu, 'unique' gives each attempt its own ID")
+    parser.add_argument("--seed", type=int, default=480, help="random seed for the booking mix")
+    parser.add_argument("--setup", action="store_true", help="create stress clients and drivers first")
+    parser.add_argument("--cleanup", action="store_true", help="delete stress data after the audit")
+    parser.add_argument("--dbinfo", default=dbconfig.DB_INFO_FILE, help="database info file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    db_info = dbconfig.read_db_info(args.dbinfo)
+    conn = dbconfig.connect(db_info)
+    try:
+        if args.setup:
+            setup_data(conn, args.model, args.clients, args.drivers)
+        elapsed, results = run(args, db_info)
+        report(args, elapsed, results)
+        violations = audit(conn)
+        if args.cleanup:
+            cleanup_data(conn)
+    finally:
+        conn.close()
+    return 1 if violations else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+## Background matcher for the booking waitlist
+##
+## Books waiting requests (see dbTier.match_waitlist) as soon as a driver
+## becomes free. The worker LISTENs on the waitlist channel, which the database
+## triggers notify when a rent is cancelled or moved, or a driver is qualified
+## for a waited-for model, and only matches the models named in the
+## notifications. It also does a full pass every --interval seconds, which
+## picks up anything a notification could not announce (and notifications
+## sent while the worker was down). Each full pass first reaps the expired
+## reservation holds, which frees their drivers. Several workers can run side by side:
+## requests are claimed with SKIP LOCKED, so no two workers book the same one.
+##
+## Example:
+##   python waitlist_worker.py                       (run until stopped)
+##   python waitlist_worker.py --once                (one full pass, e.g. from cron)
+##   python waitlist_worker.py --interval 30 --batch-size 200
+
+import argparse
+import sys
+import time
+from datetime import datetime
+
+import dbconfig
+import dbTier
+
+POLL_INTERVAL = 60
+
+# Outcomes that leave a request on the waitlist
+WAITING = (dbTier.BOOK_NO_DRIVER, dbTier.BOOK_MODEL_TAKEN)
+
+
+def full_pass(conn, batch_size):
+    """Reaps expired holds, then matches every waiting request"""
+    dbTier.reap_expired_holds(conn)
+    return match(conn, batch_size=batch_size)
+
+
+def match(conn, model_ids=None, batch_size=dbTier.WAITLIST_BATCH_SIZE):
+    """
+    Matches batches of waiting requests until a batch books nothing new, and
+    prints every booking. Returns the number of rents booked.
+    """
+    booked = 0
+    while True:
+        results = dbTier.match_waitlist(conn, model_ids, batch_size)
+        stamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        for email, date, model_id, status, rent_id, driver in results:
+            if status == dbTier.BOOK_OK:
+                print(f"{stamp} booked {rent_id} {date} {model_id} for {email} with {driver}", flush=True)
+            elif status not in WAITING:
+                print(f"{stamp} {dbTier.BOOK_STATUS_NAMES[status]} {date} {model_id} for {email}", flush=True)
+        progress = [result[3] for result in results if result[3] not in WAITING]
+        booked += progress.count(dbTier.BOOK_OK)
+        # A full batch that made progress may have more behind it; stop on a
+        # failed batch so a persistent error does not spin
+        if len(results) < batch_size or not progress or progress[-1] in (dbTier.BOOK_ID_TAKEN, dbTier.BOOK_DB_ERROR):
+            return booked
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Book waitlisted rents as drivers become free")
+    parser.add_argument("--once", action="store_true", help="do one full pass and exit")
+    parser.add_argument("--interval", type=float, default=POLL_INTERVAL,
+                        help=f"seconds between full passes (default: {POLL_INTERVAL})")
+    parser.add_argument("--batch-size", type=int, default=dbTier.WAITLIST_BATCH_SIZE,
+                        help=f"requests claimed per transaction (default: {dbTier.WAITLIST_BATCH_SIZE})")
+    parser.add_argument("--dbinfo", default=dbconfig.DB_INFO_FILE, help="database info file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    info = dbconfig.read_db_info(args.dbinfo)
+    conn = dbconfig.connect(info)
+    listener = None
+    try:
+        if args.once:
+            full_pass(conn, args.batch_size)
+            return 0
+        # Listen before the first pass, so nothing freed during it is missed
+        listener = dbconfig.listen(dbTier.WAITLIST_CHANNEL, info)
+        next_pass = time.monotonic()
+        while True:
+            if time.monotonic() >= next_pass:
+                full_pass(conn, args.batch_size)
+                next_pass = time.monotonic() + args.interval
+            models = set(dbconfig.wait_for_notifies(listener, next_pass - time.monotonic()))
+            if models:
+                match(conn, sorted(models), args.batch_size)
+    except KeyboardInterrupt:
+        return 0
+    finally:
+        if listener is not None:
+            listener.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
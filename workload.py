@@ -0,0 +1,405 @@
+## Session workload recording, generation and replay
+##
+## A workload is a JSONL file with one dbTier call per line:
+##   {"session": "c17", "op": "find_available_models", "args": ["2025-04-15"], "kwargs": {}, "think": 1.5}
+## Lines of the same session run in file order on one connection. "think" is
+## the pause (in seconds) before the call. IDs that must be fresh on every
+## replay are written as {"$id": "rent"} or {"$id": "review"}; the replayer
+## allocates new ones each run (see IdSource), so a workload can be replayed
+## against the same database again and again.
+##
+## Examples:
+##   python main.py --record session.jsonl            (record an interactive session)
+##   python workload.py generate --sessions 500 -o mix.jsonl
+##   python workload.py replay mix.jsonl --concurrency 16 --rate 20 --save run.json
+##   python workload.py replay mix.jsonl --baseline run.json --tolerance 1.25
+
+import argparse
+import contextlib
+import itertools
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+import dbconfig
+import dbTier
+import instrument
+import perfstats
+
+# Arguments replaced by fresh IDs on replay: op -> (argument index, id kind)
+# Indexes count from the first argument after the connection.
+ID_ARGUMENTS = {
+    "book_rent": (0, "rent"),
+    "book_rent_status": (0, "rent"),
+    "insert_review": (0, "review"),
+}
+
+
+### Recording ###
+
+class Recorder:
+    """dbTier hook that appends every call to a workload file"""
+
+    def __init__(self, path, session=None):
+        self.file = open(path, "a")
+        self.session = session or uuid.uuid4().hex[:8]
+        self.last_end = None
+        self.lock = threading.Lock()
+
+    def __call__(self, call):
+        end = time.perf_counter()
+        start = end - call.elapsed
+        think = 0.0 if self.last_end is None else max(0.0, start - self.last_end)
+        self.last_end = end
+
+        args = list(call.args[1:])
+        if call.name in ID_ARGUMENTS:
+            index, kind = ID_ARGUMENTS[call.name]
+            if index < len(args):
+                args[index] = {"$id": kind}
+        line = {"session": self.session, "op": call.name, "args": args,
+                "kwargs": call.kwargs, "think": round(think, 3)}
+        with self.lock:
+            self.file.write(json.dumps(line, default=str) + "\n")
+            self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def start_recording(path, session=None):
+    """Starts recording every dbTier call to path. Returns the Recorder to pass to stop_recording"""
+    recorder = Recorder(path, session)
+    instrument.add_hook(recorder)
+    return recorder
+
+
+def stop_recording(recorder):
+    """Stops a recording started by start_recording"""
+    instrument.remove_hook(recorder)
+    recorder.close()
+
+
+def read_workload(path):
+    """
+    Reads a workload file.
+
+    Returns:
+        OrderedDict mapping session id to its list of operations (dicts), in file order
+    """
+    sessions = OrderedDict()
+    with open(path) as input_file:
+        for line_no, line in enumerate(input_file, 1):
+            line = line.strip()
+            if not line:
+                continue
+            op = json.loads(line)
+            if not hasattr(dbTier, op["op"]):
+                raise ValueError(f"line {line_no}: unknown dbTier operation {op['op']!r}")
+            sessions.setdefault(op["session"], []).append(op)
+    return sessions
+
+
+### Generation ###
+
+def generate_workload(conn, n_sessions, start_date, days, think=2.0, seed=480,
+                      mix=(("client", 0.7), ("driver", 0.15), ("manager", 0.15))):
+    """
+    Generates synthetic sessions that follow the CLI flows, using the clients,
+    drivers, models and managers currently in the database.
+
+    Returns:
+        List of operation dicts in workload format
+    """
+    rng = random.Random(seed)
+    with conn.cursor() as curr:
+        curr.execute("SELECT email FROM Client")
+        clients = [row[0] for row in curr.fetchall()]
+        curr.execute("""SELECT d.name, a.city
+                        FROM Driver d JOIN Address a ON a.address_id = d.address_id""")
+        drivers = curr.fetchall()
+        curr.execute("SELECT model_id FROM Model")
+        models = [row[0] for row in curr.fetchall()]
+        curr.execute("SELECT ssn FROM Manager")
+        managers = [row[0] for row in curr.fetchall()]
+    conn.rollback()
+    if not (clients and drivers and models and managers):
+        raise ValueError("the database needs at least one client, driver, model and manager")
+
+    cities = sorted({city for _, city in drivers})
+    first_day = date.fromisoformat(start_date)
+
+    def pause():
+        return round(rng.expovariate(1 / think), 3) if think > 0 else 0.0
+
+    def some_date():
+        return (first_day + timedelta(days=rng.randrange(days))).isoformat()
+
+    kinds = [kind for kind, _ in mix]
+    weights = [weight for _, weight in mix]
+    operations = []
+    for n in range(n_sessions):
+        kind = rng.choices(kinds, weights)[0]
+        session = f"{kind[0]}{n}"
+        steps = []
+        if kind == "client":
+            email = rng.choice(clients)
+            day = some_date()
+            steps.append(("get_client", [email]))
+            steps.append(("find_available_models", [day]))
+            if rng.random() < 0.3:
+                steps.append(("get_availability_matrix", [day, (date.fromisoformat(day) + timedelta(days=6)).isoformat()]))
+            steps.append(("next_rent_id", []))
+            steps.append(("book_rent", [{"$id": "rent"}, day, email, rng.choice(models)]))
+            steps.append(("get_client_rents", [email]))
+            if rng.random() < 0.3:
+                driver_name = rng.choice(drivers)[0]
+                steps.append(("has_reviewed", [email, driver_name]))
+                steps.append(("get_latest_review_id", []))
+                steps.append(("insert_review", [{"$id": "review"}, email, driver_name, "Replayed review", rng.randint(0, 5)]))
+        elif kind == "driver":
+            driver_name = rng.choice(drivers)[0]
+            steps.append(("get_driver", [driver_name]))
+            steps.append(("get_all_models", []))
+            steps.append(("qualify_driver_for_model", [driver_name, rng.choice(models)]))
+        else:
+            steps.append(("get_manager", [rng.choice(managers)]))
+            steps.append(("get_top_k_clients", [10]))
+            steps.append(("get_models_rents", []))
+            steps.append(("get_driver_stats", []))
+            steps.append(("get_clients_by_cities", [rng.choice(cities), rng.choice(cities)]))
+        for op, args in steps:
+            operations.append({"session": session, "op": op, "args": args, "kwargs": {}, "think": pause()})
+    return operations
+
+
+### Replay ###
+
+class IdSource:
+    """
+    Hands out rent and review IDs that are unique across replays, so replaying
+    the same workload again does not collide with the rents and reviews of
+    earlier runs. Rent IDs come from the rent_id_seq sequence, like real
+    bookings. Review IDs (PV123456 for prefix "P") continue after the highest
+    one already in the database with that prefix.
+    """
+
+    def __init__(self, conn, prefix):
+        self.prefix = prefix
+        curr = conn.cursor()
+        curr.execute("SELECT MAX(substr(review_id, %s)::int) FROM Review WHERE review_id ~ %s",
+                     (len(prefix) + 2, f"^{re.escape(prefix)}V[0-9]{{6}}$"))
+        last = curr.fetchone()[0] or 0
+        curr.close()
+        conn.rollback()
+        self.reviews = itertools.count(last + 1)
+        self.lock = threading.Lock()
+
+    def next(self, kind, conn):
+        if kind == "rent":
+            return dbTier.next_rent_id(conn)
+        with self.lock:
+            n = next(self.reviews)
+        return f"{self.prefix}V{n:06d}"
+
+
+def _resolve(value, ids, conn):
+    if isinstance(value, dict) and "$id" in value:
+        return ids.next(value["$id"], conn)
+    return value
+
+
+def replay(sessions, open_conn, concurrency=8, rate=0.0, think_scale=1.0, id_prefix="P", seed=480):
+    """
+    Replays sessions through the dbTier API.
+
+    Parameters:
+        sessions: OrderedDict from read_workload
+        open_conn: Function returning a new connection (called once per worker thread)
+        concurrency: Number of sessions running at once (one connection each)
+        rate: Session arrival rate per second (Poisson); 0 starts all sessions at once
+        think_scale: Multiplier for recorded think times (0 disables them)
+        id_prefix: First letter of generated review IDs
+
+    Returns:
+        Dict with per-op latencies, per-op error counts, session queue waits and elapsed time
+    """
+    id_conn = open_conn()
+    try:
+        ids = IdSource(id_conn, id_prefix)
+    finally:
+        id_conn.close()
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    queue_waits = []
+    results_lock = threading.Lock()
+    local = threading.local()
+    conns = []
+
+    def get_conn():
+        if not hasattr(local, "conn"):
+            local.conn = open_conn()
+            with results_lock:
+                conns.append(local.conn)
+        return local.conn
+
+    def run_session(operations, arrival):
+        conn = get_conn()
+        with results_lock:
+            queue_waits.append(time.perf_counter() - arrival)
+        for op in operations:
+            if think_scale and op.get("think"):
+                time.sleep(op["think"] * think_scale)
+            func = getattr(dbTier, op["op"])
+            args = [_resolve(arg, ids, conn) for arg in op.get("args", [])]
+            start = time.perf_counter()
+            failed = False
+            try:
+                func(conn, *args, **op.get("kwargs", {}))
+            except Exception:
+                failed = True
+                conn.rollback()
+            elapsed = time.perf_counter() - start
+            with results_lock:
+                latencies[op["op"]].append(elapsed)
+                if failed:
+                    errors[op["op"]] += 1
+
+    rng = random.Random(seed)
+    start = time.perf_counter()
+    # dbTier prints user-facing messages (e.g. failed bookings); keep them out of the report
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            next_arrival = start
+            futures = []
+            for operations in sessions.values():
+                if rate > 0:
+                    next_arrival += rng.expovariate(rate)
+                    delay = next_arrival - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                futures.append(executor.submit(run_session, operations, time.perf_counter()))
+            for future in futures:
+                future.result()
+    elapsed = time.perf_counter() - start
+
+    for conn in conns:
+        conn.close()
+    return {"latencies": dict(latencies), "errors": dict(errors),
+            "queue_waits": queue_waits, "elapsed": elapsed}
+
+
+def summarize_run(run):
+    """Turns replay() results into per-op summaries (the format saved with --save)"""
+    return {
+        "elapsed": run["elapsed"],
+        "ops": {op: dict(perfstats.summarize(values), errors=run["errors"].get(op, 0))
+                for op, values in sorted(run["latencies"].items())},
+        "queue_wait": perfstats.summarize(run["queue_waits"]),
+    }
+
+
+def print_report(summary):
+    total_ops = sum(op["count"] for op in summary["ops"].values())
+    print(f"\nReplayed {total_ops} operations in {summary['elapsed']:.2f}s "
+          f"({total_ops / summary['elapsed']:.1f} ops/s)\n")
+    print(perfstats.format_header())
+    for op, stats in summary["ops"].items():
+        print(perfstats.format_summary(op, stats) + (f"   {stats['errors']} errors" if stats["errors"] else ""))
+    print(perfstats.format_summary("(session queue wait)", summary["queue_wait"]))
+
+
+def compare_to_baseline(summary, baseline, tolerance):
+    """
+    Compares p95 latencies against a saved summary.
+
+    Returns:
+        List of (op, baseline p95, current p95) for ops slower than baseline * tolerance
+    """
+    regressions = []
+    for op, stats in summary["ops"].items():
+        base = baseline["ops"].get(op)
+        if base and base["p95"] and stats["p95"] and stats["p95"] > base["p95"] * tolerance:
+            regressions.append((op, base["p95"], stats["p95"]))
+    return regressions
+
+
+### Command line ###
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate and replay dbTier session workloads")
+    parser.add_argument("--dbinfo", default=dbconfig.DB_INFO_FILE, help="database info file")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    gen = commands.add_parser("generate", help="generate a synthetic workload from the current data")
+    gen.add_argument("-o", "--output", required=True, help="workload file to write")
+    gen.add_argument("--sessions", type=int, default=200)
+    gen.add_argument("--start-date", default="2030-01-01", help="first date searched and booked")
+    gen.add_argument("--days", type=int, default=30, help="number of dates sessions pick from")
+    gen.add_argument("--think", type=float, default=2.0, help="mean think time between calls (s)")
+    gen.add_argument("--seed", type=int, default=480)
+
+    rep = commands.add_parser("replay", help="replay a workload and report per-operation latency")
+    rep.add_argument("workload", help="workload file")
+    rep.add_argument("--concurrency", type=int, default=8, help="sessions running at once")
+    rep.add_argument("--rate", type=float, default=0.0, help="session arrivals per second (0 = all at once)")
+    rep.add_argument("--think-scale", type=float, default=1.0, help="multiplier for think times (0 = none)")
+    rep.add_argument("--id-prefix", default="P", help="first letter of generated review IDs")
+    rep.add_argument("--replicas", action="store_true",
+                     help="route read-only calls to the replicas listed in the db info file")
+    rep.add_argument("--save", help="write the latency summary to this JSON file")
+    rep.add_argument("--baseline", help="summary JSON to compare p95 latencies against")
+    rep.add_argument("--tolerance", type=float, default=1.25, help="allowed p95 slowdown vs. baseline")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    db_info = dbconfig.read_db_info(args.dbinfo)
+
+    if args.command == "generate":
+        conn = dbconfig.connect(db_info)
+        try:
+            operations = generate_workload(conn, args.sessions, args.start_date, args.days,
+                                           args.think, args.seed)
+        finally:
+            conn.close()
+        with open(args.output, "w") as output:
+            for op in operations:
+                output.write(json.dumps(op) + "\n")
+        print(f"Wrote {len(operations)} operations in {args.sessions} sessions to {args.output}")
+        return 0
+
+    sessions = read_workload(args.workload)
+    if args.replicas:
+        open_conn = lambda: dbconfig.connect_routed(args.dbinfo)
+    else:
+        open_conn = lambda: dbconfig.connect(db_info)
+    run = replay(sessions, open_conn, args.concurrency, args.rate, args.think_scale, args.id_prefix)
+    summary = summarize_run(run)
+    print_report(summary)
+    if args.save:
+        with open(args.save, "w") as output:
+            json.dump(summary, output, indent=2)
+    if args.baseline:
+        with open(args.baseline) as input_file:
+            regressions = compare_to_baseline(summary, json.load(input_file), args.tolerance)
+        if regressions:
+            print(f"\nRegressions (p95 more than {args.tolerance:.2f}x baseline):")
+            for op, base, current in regressions:
+                print(f"   {op:<28}{base * 1000:>9.2f} ms -> {current * 1000:.2f} ms")
+            return 1
+        print("\nNo p95 regressions against the baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())